@@ -5,10 +5,15 @@ from functools import partial
 from pathlib import Path
 from typing import Any
 
+import torch
 from terratorch.models.backbones.select_patch_embed_weights import (
     select_patch_embed_weights,
 )
-from terratorch.models.backbones.vit_encoder_decoder import TemporalViTEncoder
+from terratorch.models.backbones.vit_encoder_decoder import (
+    B_C_H_W_SHAPE_LEN,
+    TemporalViTEncoder,
+    get_3d_sincos_pos_embed,
+)
 from timm.models import FeatureInfo
 from timm.models._builder import build_model_with_cfg
 from timm.models._registry import generate_default_cfgs, register_model
@@ -96,6 +101,48 @@ def checkpoint_filter_fn(
     return state_dict
 
 
+def forward_selected_features(
+    model: TemporalViTEncoder, x: torch.Tensor, out_indices: list[int]
+) -> list[torch.Tensor]:
+    """`TemporalViTEncoder.forward_features`, but only running the blocks up
+    to the deepest of `out_indices` and only keeping their outputs, rather
+    than a copy of every block output. Earlier activations are freed as the
+    blocks run. As in `forward_features`, the last block output is normed.
+    """
+    depth = len(model.blocks)
+    wanted = [i % depth for i in out_indices]
+
+    if len(x.shape) == B_C_H_W_SHAPE_LEN and model.patch_embed.num_frames == 1:
+        x = x.reshape(-1, model.in_chans, 1, *x.shape[-2:])
+    t, h, w = x.shape[-3:]
+    # embed patches
+    x = model.patch_embed(x)
+    pos_embed = torch.from_numpy(
+        get_3d_sincos_pos_embed(
+            model.embed_dim, (t, h // 16, w // 16), cls_token=True
+        )
+    ).to(x)
+    # add pos embed w/o cls token
+    x = x + pos_embed[1:, :]
+
+    # append cls token
+    cls_token = model.cls_token + pos_embed[:1, :]
+    cls_tokens = cls_token.expand(x.shape[0], -1, -1)
+    x = torch.cat((cls_tokens, x), dim=1)
+
+    # apply Transformer blocks, which return new tensors, so no copies are
+    # needed
+    kept = {}
+    for i, blk in enumerate(model.blocks[: max(wanted) + 1]):
+        x = blk(x)
+        if i in wanted:
+            kept[i] = x
+    if depth - 1 in kept:
+        kept[depth - 1] = model.norm(kept[depth - 1])
+
+    return [kept[i] for i in wanted]
+
+
 def _create_prithvi(
     variant: str,
     pretrained: bool = False,  # noqa: FBT001, FBT002
@@ -117,7 +164,9 @@ def _create_prithvi(
     print(f"✅ _create_prithvi called with in_chans={kwargs['in_chans']}")
 
     def checkpoint_filter_wrapper_fn(state_dict, model):
-        return checkpoint_filter_fn(state_dict, model, pretrained_bands, model_bands)
+        return checkpoint_filter_fn(
+            state_dict, model, pretrained_bands, model_bands
+        )
 
     model = build_model_with_cfg(
         TemporalViTEncoder,
@@ -137,9 +186,8 @@ def _create_prithvi(
         model.feature_info = FeatureInfo(model.feature_info, out_indices)
         model.encode_decode_forward = model.forward
 
-        def forward_filter_indices(*args, **kwargs):
-            features = model.forward_features(*args, **kwargs)
-            return [features[i] for i in out_indices]
+        def forward_filter_indices(x):
+            return forward_selected_features(model, x, out_indices)
 
         model.forward = forward_filter_indices
         model.model_bands = model_bands
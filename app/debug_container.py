@@ -11,18 +11,21 @@ print(f"GDAL_DATA: {os.environ.get('GDAL_DATA', 'Not set')}")
 print("\n=== Library Versions ===")
 try:
     import rasterio
+
     print(f"Rasterio version: {rasterio.__version__}")
 except ImportError:
     print("Rasterio not installed")
 
 try:
     from osgeo import gdal
+
     print(f"GDAL version: {gdal.VersionInfo()}")
 except ImportError:
     print("GDAL not installed")
 
 try:
     import rioxarray
+
     print(f"Rioxarray version: {rioxarray.__version__}")
 except ImportError:
     print("Rioxarray not installed")
@@ -48,26 +51,24 @@ if os.path.exists(input_dir):
         else:
             print(f"  File: {item}")
 
-# Check for TIF files
+# Check for TIF files, reading only their headers
 print("\n=== TIF Files ===")
-tif_count = 0
-for root, dirs, files in os.walk(input_dir):
-    for file in files:
-        if file.endswith('.tif'):
-            tif_count += 1
-            if tif_count <= 5:  # Show details for up to 5 files
-                tif_path = os.path.join(root, file)
-                print(f"Found TIF: {tif_path}")
-                try:
-                    # Try to open with rasterio
-                    import rasterio
-                    with rasterio.open(tif_path) as src:
-                        print(f"  - Bands: {src.count}")
-                        print(f"  - Size: {src.width}x{src.height}")
-                except Exception as e:
-                    print(f"  - Error opening file: {e}")
+try:
+    from granite_geo_flood.scan import scan_directory
+
+    entries = scan_directory(input_dir, "**/*.tif")
+except ImportError as e:
+    print(f"Cannot scan the input files: {e}")
+    entries = []
+for entry in entries[:5]:  # Show details for up to 5 files
+    print(f"Found TIF: {entry['path']}")
+    if "error" in entry:
+        print(f"  - Error opening file: {entry['error']}")
+    else:
+        print(f"  - Bands: {entry['bands']}")
+        print(f"  - Size: {entry['width']}x{entry['height']}")
 
-print(f"\nTotal TIF files found: {tif_count}")
+print(f"\nTotal TIF files found: {len(entries)}")
 
 # Check terratorch configuration
 print("\n=== Config Check ===")
@@ -75,4 +76,4 @@ model_dir = "/app/models"
 if os.path.exists(model_dir):
     print(f"Models directory exists: {os.listdir(model_dir)}")
 else:
-    print("Models directory doesn't exist")
\ No newline at end of file
+    print("Models directory doesn't exist")
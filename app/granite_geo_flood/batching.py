@@ -0,0 +1,174 @@
+"""grouping tiles into batches for the flood model"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+
+def group_batches(shapes: list, batch_size: int) -> list:
+    """group tiles with the same shape into batches of at most `batch_size`.
+    The last batch of each shape may be partial.
+
+    Args:
+        shapes (list): shape of each tile, e.g. (bands, h, w)
+        batch_size (int): maximum number of tiles per batch
+
+    Returns:
+        list: batches, each a list of indices into `shapes`
+    """
+    groups = {}
+    for i, shape in enumerate(shapes):
+        groups.setdefault(tuple(shape), []).append(i)
+
+    batches = []
+    for ids in groups.values():
+        batches.extend(
+            ids[start : start + batch_size]
+            for start in range(0, len(ids), batch_size)
+        )
+    return batches
+
+
+def available_memory() -> int:
+    """bytes of physical memory currently available"""
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def estimate_tile_memory(
+    height: int,
+    width: int,
+    patch_size: int = 16,
+    embed_dim: int = 768,
+    num_heads: int = 12,
+    mlp_ratio: int = 4,
+    decoder_channels: int = 256,
+) -> int:
+    """rough peak inference memory in bytes for one tile through the
+    ViT encoder and FCN decoder (float32 activations)
+
+    Args:
+        height (int): tile height
+        width (int): tile width
+        patch_size (int): ViT patch size. Defaults to 16.
+        embed_dim (int): token embedding size. Defaults to 768.
+        num_heads (int): attention heads. Defaults to 12.
+        mlp_ratio (int): MLP hidden size over embedding size. Defaults to 4.
+        decoder_channels (int): FCN decoder channels. Defaults to 256.
+
+    Returns:
+        int: estimated bytes
+    """
+    tokens = (height // patch_size) * (width // patch_size) + 1
+    encoder = tokens * embed_dim * (4 + mlp_ratio) + num_heads * tokens**2
+    decoder = 2 * decoder_channels * height * width
+    return 4 * (encoder + decoder)
+
+
+def auto_batch_size(
+    height: int,
+    width: int,
+    memory_fraction: float = 0.5,
+    max_batch_size: int = 32,
+    **kwargs,
+) -> int:
+    """choose a batch size from the memory currently available
+
+    Args:
+        height (int): tile height
+        width (int): tile width
+        memory_fraction (float): share of the available memory to use.
+            Defaults to 0.5.
+        max_batch_size (int): upper limit on the batch size. Defaults to 32.
+        **kwargs: model sizes passed to `estimate_tile_memory`
+
+    Returns:
+        int: batch size, at least 1
+    """
+    budget = available_memory() * memory_fraction
+    batch_size = int(budget // estimate_tile_memory(height, width, **kwargs))
+    return max(1, min(batch_size, max_batch_size))
+
+
+def measure_throughput(
+    predictor,
+    batch_sizes: list,
+    num_tiles: int = 16,
+    tile_size: int = 512,
+    warmup: int = 1,
+) -> dict:
+    """time the forward pass over random tiles at several batch sizes
+
+    Args:
+        predictor (FloodPredictor): loaded model
+        batch_sizes (list): batch sizes to try
+        num_tiles (int): tiles predicted per batch size. Defaults to 16.
+        tile_size (int): tile height and width. Defaults to 512.
+        warmup (int): untimed batches run first. Defaults to 1.
+
+    Returns:
+        dict: tiles per second for each batch size
+    """
+    bands = predictor.preprocessor.num_bands
+    rng = np.random.default_rng(0)
+
+    results = {}
+    for batch_size in batch_sizes:
+        batch = rng.standard_normal(
+            (batch_size, bands, tile_size, tile_size), dtype=np.float32
+        )
+        for _ in range(warmup):
+            predictor.forward(batch)
+
+        num_batches = max(1, num_tiles // batch_size)
+        start = time.perf_counter()
+        for _ in range(num_batches):
+            predictor.forward(batch)
+        elapsed = time.perf_counter() - start
+
+        results[batch_size] = num_batches * batch_size / elapsed
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Report flood model throughput over batch sizes."
+    )
+    parser.add_argument("--config", required=True, help="Path to config.yaml")
+    parser.add_argument(
+        "--checkpoint", default=None, help="Path to model.ckpt"
+    )
+    parser.add_argument(
+        "--batch_sizes",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="Batch sizes to time",
+    )
+    parser.add_argument("--num_tiles", type=int, default=16)
+    parser.add_argument("--tile_size", type=int, default=512)
+    args = parser.parse_args()
+
+    from granite_geo_flood.predictor import FloodPredictor
+
+    predictor = FloodPredictor(args.config, args.checkpoint)
+    batch_sizes = sorted(set([1] + args.batch_sizes))
+    results = measure_throughput(
+        predictor, batch_sizes, args.num_tiles, args.tile_size
+    )
+
+    print(
+        f"auto batch size: {auto_batch_size(args.tile_size, args.tile_size)}"
+    )
+    for batch_size, tiles_per_second in results.items():
+        gain = tiles_per_second / results[1]
+        print(
+            f"batch size {batch_size:>3}: {tiles_per_second:7.2f} tiles/s "
+            f"({gain:.2f}x batch size 1)"
+        )
+
+
+if __name__ == "__main__":
+    main()
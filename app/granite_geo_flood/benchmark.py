@@ -0,0 +1,373 @@
+"""end-to-end inference benchmark on synthetic GeoTIFFs, timed stage by
+stage"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import torch
+from rasterio.transform import from_origin
+
+from granite_geo_flood.batching import group_batches
+from granite_geo_flood.predictor import (
+    FloodPredictor,
+    read_image,
+    write_prediction,
+)
+from granite_geo_flood.scan import scan_file
+from granite_geo_flood.utils.helper import calc_metrics
+
+STAGES = (
+    "scan",
+    "decode",
+    "preprocess",
+    "forward",
+    "postprocess",
+    "write",
+    "evaluate",
+)
+
+
+def make_fixtures(
+    output_dir: Path | str,
+    config: dict,
+    tile_size: int = 512,
+    num_tiles: int = 8,
+    seed: int = 0,
+) -> tuple[list, list]:
+    """write synthetic float32 tiles with the config's `dataset_bands`, and
+    random labels for them. A strip along the left edge of each tile is
+    NaN, so the nodata handling is timed too.
+
+    Args:
+        output_dir (Path | str): directory for the tiles
+        config (dict): parsed config (see `predictor.load_config`)
+        tile_size (int): tile height and width. Defaults to 512.
+        num_tiles (int): tiles to write. Defaults to 8.
+        seed (int): random seed. Defaults to 0.
+
+    Returns:
+        tuple[list, list]: `*_image.tif` files and their `*_label.tif` files
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    bands = config["data"]["init_args"]["dataset_bands"]
+    rng = np.random.default_rng(seed)
+
+    profile = {
+        "driver": "GTiff",
+        "width": tile_size,
+        "height": tile_size,
+        "crs": "EPSG:4326",
+        "transform": from_origin(-9.2, 53.7, 0.0001, 0.0001),
+    }
+    image_files, label_files = [], []
+    for i in range(num_tiles):
+        # raw values on the scale `constant_scale` brings to reflectance
+        image = rng.uniform(
+            0, 5000, (len(bands), tile_size, tile_size)
+        ).astype(np.float32)
+        image[:, :, : tile_size // 32] = np.nan
+        label = rng.integers(0, 2, (tile_size, tile_size)).astype(np.int16)
+        label[:, : tile_size // 32] = -1
+
+        stem = f"BENCH_{tile_size}_tile_{i}"
+        image_files.append(output_dir / f"{stem}_image.tif")
+        with rasterio.open(
+            image_files[-1],
+            "w",
+            count=len(bands),
+            dtype="float32",
+            nodata=np.nan,
+            **profile,
+        ) as dst:
+            dst.write(image)
+            dst.descriptions = tuple(bands)
+
+        label_files.append(output_dir / f"{stem}_label.tif")
+        with rasterio.open(
+            label_files[-1], "w", count=1, dtype="int16", nodata=-1, **profile
+        ) as dst:
+            dst.write(label, 1)
+
+    return image_files, label_files
+
+
+def peak_memory(reset: bool = False) -> int:
+    """bytes of peak resident memory of this process since the last reset.
+    Resetting needs Linux 4.0 or later; elsewhere the peak is of the
+    process."""
+    if reset:
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def benchmark_run(
+    predictor: FloodPredictor,
+    image_files: list,
+    label_files: list,
+    output_dir: Path | str,
+    batch_size: int = 1,
+) -> dict:
+    """predict and evaluate tiles once, timing each stage separately.
+
+    Scan and evaluate run over all the tiles; the other stages run per
+    batch. The latency of a tile is the time from decoding its batch to
+    writing it.
+
+    Args:
+        predictor (FloodPredictor): loaded model
+        image_files (list): input tiles
+        label_files (list): truth labels of the tiles
+        output_dir (Path | str): directory for the predictions
+        batch_size (int): tiles per forward pass. Defaults to 1.
+
+    Returns:
+        dict: tiles_per_second, latency p50/p95, peak_rss_mb and the
+            seconds per tile of each stage
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    seconds = dict.fromkeys(STAGES, 0.0)
+    latencies = []
+
+    def timed(stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds[stage] += time.perf_counter() - start
+        return result
+
+    peak_memory(reset=True)
+    run_start = time.perf_counter()
+
+    entries = timed("scan", lambda: [scan_file(f) for f in image_files])
+    shapes = [(e["bands"], e["height"], e["width"]) for e in entries]
+
+    pred_files = [None] * len(image_files)
+    for batch_ids in group_batches(shapes, batch_size):
+        batch_start = time.perf_counter()
+        images, profiles = timed(
+            "decode",
+            lambda: list(
+                zip(*(read_image(image_files[i]) for i in batch_ids))
+            ),
+        )
+        batch = timed(
+            "preprocess", predictor.preprocess_batch, np.stack(images)
+        )
+        logits = timed("forward", predictor.forward, batch)
+        preds = timed(
+            "postprocess", lambda: logits.argmax(axis=1).astype(np.int16)
+        )
+        for i, pred, profile in zip(batch_ids, preds, profiles):
+            pred_files[i] = (
+                output_dir / f"{Path(image_files[i]).stem}_pred.tif"
+            )
+            timed("write", write_prediction, pred, profile, pred_files[i])
+        latencies += [time.perf_counter() - batch_start] * len(batch_ids)
+
+    timed("evaluate", calc_metrics, label_files, pred_files)
+
+    elapsed = time.perf_counter() - run_start
+    num_tiles = len(image_files)
+    return {
+        "tiles_per_second": num_tiles / elapsed,
+        "latency_p50_seconds": float(np.percentile(latencies, 50)),
+        "latency_p95_seconds": float(np.percentile(latencies, 95)),
+        "peak_rss_mb": peak_memory() / 2**20,
+        "stage_seconds_per_tile": {
+            stage: total / num_tiles for stage, total in seconds.items()
+        },
+    }
+
+
+def _environment() -> dict:
+    """commit and machine the results were measured on"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+    }
+
+
+def run_benchmarks(
+    predictor: FloodPredictor,
+    work_dir: Path | str,
+    tile_sizes: list = (256, 512),
+    num_tiles: int = 8,
+    batch_sizes: list = (1, 4),
+    threads: list = (None,),
+) -> dict:
+    """benchmark every combination of tile size, batch size and torch
+    thread count on synthetic tiles (see `make_fixtures`)
+
+    Args:
+        predictor (FloodPredictor): loaded model
+        work_dir (Path | str): scratch directory for the tiles and predictions
+        tile_sizes (list): tile heights and widths. Defaults to (256, 512).
+        num_tiles (int): tiles per run. Defaults to 8.
+        batch_sizes (list): tiles per forward pass. Defaults to (1, 4).
+        threads (list): torch intra-op threads, None for torch's default.
+            Defaults to (None,).
+
+    Returns:
+        dict: environment and one result per combination (see `benchmark_run`)
+    """
+    work_dir = Path(work_dir)
+    default_threads = torch.get_num_threads()
+
+    runs = []
+    for tile_size in tile_sizes:
+        image_files, label_files = make_fixtures(
+            work_dir / f"tiles_{tile_size}",
+            predictor.config,
+            tile_size,
+            num_tiles,
+        )
+        # untimed first forward pass at this tile size
+        predictor.predict(read_image(image_files[0])[0])
+
+        for num_threads in threads:
+            torch.set_num_threads(num_threads or default_threads)
+            for batch_size in batch_sizes:
+                result = benchmark_run(
+                    predictor,
+                    image_files,
+                    label_files,
+                    work_dir / f"preds_{tile_size}_{batch_size}",
+                    batch_size,
+                )
+                runs.append(
+                    dict(
+                        tile_size=tile_size,
+                        batch_size=batch_size,
+                        threads=torch.get_num_threads(),
+                        **result,
+                    )
+                )
+    torch.set_num_threads(default_threads)
+
+    return {"environment": _environment(), "runs": runs}
+
+
+def compare_results(
+    baseline: dict, current: dict, tolerance: float = 0.1
+) -> list:
+    """runs of `current` slower than the same configuration of `baseline`
+    by more than `tolerance`, as a share of the baseline throughput
+
+    Returns:
+        list: (tile_size, batch_size, threads, baseline, current tiles/s)
+    """
+
+    def key(run: dict) -> tuple:
+        return run["tile_size"], run["batch_size"], run["threads"]
+
+    previous = {key(run): run["tiles_per_second"] for run in baseline["runs"]}
+
+    regressions = []
+    for run in current["runs"]:
+        before = previous.get(key(run))
+        if before is not None and run["tiles_per_second"] < before * (
+            1 - tolerance
+        ):
+            regressions.append((*key(run), before, run["tiles_per_second"]))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark flood inference end to end on synthetic tiles."
+    )
+    parser.add_argument("--config", required=True, help="Path to config.yaml")
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="Path to model.ckpt (default: randomly initialised weights)",
+    )
+    parser.add_argument("--work_dir", required=True, help="Scratch directory")
+    parser.add_argument(
+        "--results", required=True, help="JSON file for the results"
+    )
+    parser.add_argument(
+        "--baseline", default=None, help="Earlier results to compare with"
+    )
+    parser.add_argument(
+        "--tile_sizes", type=int, nargs="+", default=[256, 512]
+    )
+    parser.add_argument("--num_tiles", type=int, default=8)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--threads", type=int, nargs="+", default=[None])
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    predictor = FloodPredictor(args.config, args.checkpoint)
+    results = run_benchmarks(
+        predictor,
+        args.work_dir,
+        args.tile_sizes,
+        args.num_tiles,
+        args.batch_sizes,
+        args.threads,
+    )
+    with open(args.results, "w") as f:
+        json.dump(results, f, indent=1)
+
+    for run in results["runs"]:
+        stages = ", ".join(
+            f"{stage} {seconds * 1000:.0f}"
+            for stage, seconds in run["stage_seconds_per_tile"].items()
+        )
+        print(
+            f"{run['tile_size']:>4} px, batch {run['batch_size']:>2}, "
+            f"{run['threads']:>2} threads: "
+            f"{run['tiles_per_second']:6.2f} tiles/s, "
+            f"p50 {run['latency_p50_seconds'] * 1000:.0f} ms, "
+            f"p95 {run['latency_p95_seconds'] * 1000:.0f} ms, "
+            f"RSS {run['peak_rss_mb']:.0f} MB ({stages} ms/tile)"
+        )
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(
+                json.load(f), results, args.tolerance
+            )
+        for tile_size, batch_size, threads, before, after in regressions:
+            print(
+                f"regression at {tile_size} px, batch {batch_size}, "
+                f"{threads} threads: "
+                f"{before:.2f} -> {after:.2f} tiles/s"
+            )
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""before/after flood change detection and flooded-area statistics"""
+
+import argparse
+import json
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.features import rasterize
+from rasterio.warp import transform_geom
+from rasterio.windows import Window
+
+from granite_geo_flood.utils.area import row_pixel_areas
+
+# transition classes of a pixel between two flood maps
+TRANSITIONS = ("dry", "new_water", "receded", "persistent_water")
+CHANGE_NODATA = -1
+
+# transition of each (before + 1) * 3 + (after + 1), no data if either is -1
+_TRANSITION_LUT = np.array([-1, -1, -1, -1, 0, 1, -1, 2, 3], dtype=np.int8)
+
+# <AOI>_<YYYYMMDD>..., e.g. EMSR1_AOI01_20240101_mosaic.tif
+SERIES_PATTERN = re.compile(r"^(?P<aoi>.+?)_(?P<date>\d{8})(?:_|\.)")
+
+
+def transition_map(before: np.ndarray, after: np.ndarray) -> np.ndarray:
+    """transition class (index into TRANSITIONS) of each pixel of two flood
+    maps with classes 0 (not water), 1 (water) and -1 (no data)
+
+    Returns:
+        np.ndarray: int8 transitions, CHANGE_NODATA where either map has no
+            data
+    """
+    index = (before.astype(np.intp) + 1) * 3 + (after + 1)
+    return _TRANSITION_LUT[index]
+
+
+def _read_classes(src, window: Window) -> np.ndarray:
+    """a window of a flood map, with its nodata (e.g. 255 of uint8 maps) as
+    -1"""
+    data = src.read(1, window=window, masked=True)
+    return np.where(np.ma.getmaskarray(data), -1, data.data).astype(np.int8)
+
+
+def _check_aligned(before, after) -> None:
+    if (
+        before.crs != after.crs
+        or before.shape != after.shape
+        or not before.transform.almost_equals(after.transform)
+    ):
+        raise ValueError(
+            f"{after.name} is not aligned with {before.name}: "
+            f"{after.crs} {after.shape} {tuple(after.transform)[:6]} against "
+            f"{before.crs} {before.shape} {tuple(before.transform)[:6]}"
+        )
+
+
+def _summarise(pixels: np.ndarray, km2: np.ndarray) -> dict:
+    stats = {}
+    for name, count, area in zip(TRANSITIONS, pixels, km2):
+        stats[f"{name}_pixels"] = int(count)
+        stats[f"{name}_km2"] = float(area)
+    return stats
+
+
+def change_stats(
+    before_file: Path | str,
+    after_file: Path | str,
+    zones: dict | None = None,
+    zones_crs: str | None = None,
+    blocksize: int = 1024,
+    save_file: Path | str | None = None,
+) -> dict:
+    """pixels and km² of each transition class between two aligned flood
+    maps, computed one block at a time, so memory depends on the block size
+    and not on the raster size.
+
+    Areas come from the geotransform (see `utils.area.row_pixel_areas`).
+    With `zones`, only pixels inside the polygons count, and each polygon
+    gets its own statistics; where polygons overlap the last one wins.
+
+    Args:
+        before_file (Path | str): earlier flood map
+        after_file (Path | str): later flood map on the same grid
+        zones (dict | None): GeoJSON-like polygon of each zone, keyed by
+            name. Defaults to None (the whole raster).
+        zones_crs (str | None): CRS of the polygons. Defaults to None (the
+            raster CRS).
+        blocksize (int): block height and width. Defaults to 1024.
+        save_file (Path | str | None): GeoTIFF in which to write the
+            transition map. Defaults to None.
+
+    Returns:
+        dict: `<transition>_pixels` and `<transition>_km2` of each of
+            TRANSITIONS, and of each zone under "zones"
+
+    Raises:
+        ValueError: if the flood maps are not on the same grid
+    """
+    num_classes = len(TRANSITIONS)
+    with ExitStack() as stack:
+        before = stack.enter_context(rasterio.open(before_file))
+        after = stack.enter_context(rasterio.open(after_file))
+        _check_aligned(before, after)
+
+        areas = row_pixel_areas(before.crs, before.transform, before.height)
+        names = list(zones or {})
+        geoms = list((zones or {}).values())
+        if zones_crs is not None:
+            geoms = [
+                transform_geom(zones_crs, before.crs, geom) for geom in geoms
+            ]
+        num_zones = max(len(names), 1)
+
+        dst = None
+        if save_file is not None:
+            dst = stack.enter_context(
+                rasterio.open(
+                    save_file,
+                    "w",
+                    driver="GTiff",
+                    width=before.width,
+                    height=before.height,
+                    count=1,
+                    dtype="int8",
+                    nodata=CHANGE_NODATA,
+                    crs=before.crs,
+                    transform=before.transform,
+                    tiled=True,
+                    compress="deflate",
+                )
+            )
+
+        pixels = np.zeros((num_zones, num_classes), dtype=np.int64)
+        km2 = np.zeros((num_zones, num_classes))
+        for row in range(0, before.height, blocksize):
+            height = min(blocksize, before.height - row)
+            rows = np.arange(height)[:, None]
+            for col in range(0, before.width, blocksize):
+                window = Window(
+                    col, row, min(blocksize, before.width - col), height
+                )
+                changes = transition_map(
+                    _read_classes(before, window), _read_classes(after, window)
+                )
+                if dst is not None:
+                    dst.write(changes, 1, window=window)
+
+                zone, valid = 0, changes >= 0
+                if geoms:
+                    zone = rasterize(
+                        [(geom, i) for i, geom in enumerate(geoms)],
+                        out_shape=changes.shape,
+                        transform=before.window_transform(window),
+                        fill=-1,
+                        dtype="int16",
+                    )
+                    valid &= zone >= 0
+
+                # one count per zone, transition and row, so that rows get
+                # their own area
+                index = (
+                    (zone * num_classes + changes.astype(np.intp)) * height
+                    + rows
+                )[valid]
+                counts = np.bincount(
+                    index, minlength=num_zones * num_classes * height
+                ).reshape(num_zones, num_classes, height)
+                pixels += counts.sum(axis=2)
+                km2 += counts @ areas[row : row + height]
+
+    stats = {
+        "before": str(before_file),
+        "after": str(after_file),
+        **_summarise(pixels.sum(axis=0), km2.sum(axis=0)),
+    }
+    if names:
+        stats["zones"] = {
+            name: _summarise(pixels[i], km2[i]) for i, name in enumerate(names)
+        }
+    return stats
+
+
+def series_stats(
+    pred_files: list,
+    zones: dict | None = None,
+    zones_crs: str | None = None,
+    blocksize: int = 1024,
+) -> list:
+    """`change_stats` of each consecutive pair of a time series of flood
+    maps, and of the first against the last if there are more than two
+
+    Args:
+        pred_files (list): flood maps on the same grid, in date order
+
+    Returns:
+        list: statistics of each pair
+    """
+    pairs = list(zip(pred_files[:-1], pred_files[1:]))
+    if len(pred_files) > 2:
+        pairs.append((pred_files[0], pred_files[-1]))
+    return [
+        change_stats(before, after, zones, zones_crs, blocksize)
+        for before, after in pairs
+    ]
+
+
+def group_series(pred_files: list) -> dict:
+    """group flood maps named `<AOI>_<YYYYMMDD>...` into time series
+
+    Returns:
+        dict: files of each AOI in date order, keyed by AOI
+    """
+    series = {}
+    for pred_file in pred_files:
+        match = SERIES_PATTERN.match(Path(pred_file).name)
+        if match is None:
+            continue
+        series.setdefault(match["aoi"], []).append(
+            (match["date"], Path(pred_file))
+        )
+    return {
+        aoi: [pred_file for _, pred_file in sorted(files)]
+        for aoi, files in sorted(series.items())
+    }
+
+
+def load_zones(geojson_file: Path | str, name_property: str = "name") -> dict:
+    """polygons of a GeoJSON FeatureCollection keyed by a feature property,
+    or by feature index if it is missing. GeoJSON is in EPSG:4326."""
+    with open(geojson_file) as f:
+        features = json.load(f)["features"]
+    return {
+        str(feature.get("properties", {}).get(name_property, i)): feature[
+            "geometry"
+        ]
+        for i, feature in enumerate(features)
+    }
+
+
+def _aoi_stats(
+    aoi: str,
+    pred_files: list,
+    zones: dict | None,
+    zones_crs: str | None,
+    blocksize: int,
+) -> dict:
+    result = {"aoi": aoi, "files": [str(f) for f in pred_files]}
+    try:
+        result["changes"] = series_stats(
+            pred_files, zones, zones_crs, blocksize
+        )
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def change_stats_many(
+    series: dict,
+    zones: dict | None = None,
+    zones_crs: str | None = None,
+    blocksize: int = 1024,
+    num_workers: int | None = None,
+):
+    """`series_stats` of many AOIs in parallel processes, yielded as each
+    AOI finishes. An AOI that fails gets an "error" instead of "changes",
+    without stopping the others.
+
+    Args:
+        series (dict): flood maps of each AOI in date order (see
+            `group_series`)
+        zones (dict | None): see `change_stats`. Defaults to None.
+        zones_crs (str | None): see `change_stats`. Defaults to None.
+        blocksize (int): block height and width. Defaults to 1024.
+        num_workers (int | None): processes. Defaults to None (one per CPU).
+
+    Yields:
+        dict: aoi, files and changes (or error) of each AOI
+    """
+    with ProcessPoolExecutor(num_workers) as executor:
+        futures = [
+            executor.submit(
+                _aoi_stats, aoi, files, zones, zones_crs, blocksize
+            )
+            for aoi, files in series.items()
+            if len(files) > 1
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Flooded, receded and persistent water areas between flood maps."
+        )
+    )
+    parser.add_argument(
+        "--pred_dir", required=True, help="Directory of flood maps"
+    )
+    parser.add_argument(
+        "--pattern",
+        default="*_mosaic.tif",
+        help="Glob of the flood maps, named <AOI>_<YYYYMMDD>...",
+    )
+    parser.add_argument(
+        "--zones", default=None, help="GeoJSON polygons to clip to"
+    )
+    parser.add_argument(
+        "--zone_name", default="name", help="Property naming each polygon"
+    )
+    parser.add_argument(
+        "--output", required=True, help="JSON lines file for the statistics"
+    )
+    parser.add_argument("--blocksize", type=int, default=1024)
+    parser.add_argument("--num_workers", type=int, default=None)
+    args = parser.parse_args()
+
+    series = group_series(sorted(Path(args.pred_dir).glob(args.pattern)))
+    zones, zones_crs = None, None
+    if args.zones:
+        zones, zones_crs = load_zones(args.zones, args.zone_name), "EPSG:4326"
+
+    with open(args.output, "w") as f:
+        for result in change_stats_many(
+            series, zones, zones_crs, args.blocksize, args.num_workers
+        ):
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            if "error" in result:
+                print(f"{result['aoi']}: {result['error']}")
+                continue
+            # the last pair is the first map against the last
+            overall = result["changes"][-1]
+            print(
+                f"{result['aoi']}: "
+                f"{overall['new_water_km2']:.2f} km2 newly flooded, "
+                f"{overall['persistent_water_km2']:.2f} km2 persistent, "
+                f"{overall['receded_km2']:.2f} km2 receded"
+            )
+
+
+if __name__ == "__main__":
+    main()
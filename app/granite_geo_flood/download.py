@@ -0,0 +1,608 @@
+"""resumable, parallel, checksum-verified downloads into a content-addressed
+cache"""
+
+import argparse
+import hashlib
+import http.client
+import io
+import json
+import os
+import shutil
+import tarfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ZENODO_RECORD = "https://zenodo.org/api/records/14216851"
+_DATASET_PREFIX = "granite-geospatial-uki-flooddetection-dataset"
+DATASETS = {
+    "uki": f"{_DATASET_PREFIX}-uki.tar.gz",
+    "uki_and_spain": f"{_DATASET_PREFIX}-combined-uki-spain.tar.gz",
+    "valencia": f"{_DATASET_PREFIX}-valencia.tar.gz",
+}
+MODEL_URL = (
+    "https://huggingface.co/ibm-granite/"
+    "granite-geospatial-uki-flooddetection/resolve/main"
+)
+MODEL_FILES = ("granite_geospatial_uki_flood_detection_v1.ckpt", "config.yaml")
+
+CACHE_DIR = Path(
+    os.environ.get(
+        "GRANITE_GEO_FLOOD_CACHE", Path.home() / ".cache" / "granite_geo_flood"
+    )
+)
+
+# bytes fetched by one range request, and read or written at once
+PART_SIZE = 16 * 2**20
+BLOCK_SIZE = 2**20
+
+
+def dataset_url(name: str) -> str:
+    """Zenodo download URL of one of DATASETS"""
+    record = ZENODO_RECORD.replace("/api/", "/")
+    return f"{record}/files/{DATASETS[name]}?download=1"
+
+
+def zenodo_checksum(
+    filename: str, record_url: str = ZENODO_RECORD
+) -> str | None:
+    """checksum ("md5:<hex>") Zenodo publishes for a file of a record, or
+    None if the record has no such file"""
+    with urllib.request.urlopen(record_url, timeout=60) as response:
+        record = json.load(response)
+    for entry in record.get("files", []):
+        if entry.get("key") == filename:
+            return entry.get("checksum")
+    return None
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs) -> None:
+        return None
+
+
+def huggingface_checksum(url: str, timeout: float = 60) -> str:
+    """checksum Hugging Face publishes for a file of a repo: the sha256
+    ("sha256:<hex>") of files stored with git LFS, from the X-Linked-Etag
+    of the redirect to the LFS storage, or else the git blob hash
+    ("git-sha1:<hex>") from the ETag
+
+    Raises:
+        ValueError: if the response has neither header
+    """
+    request = urllib.request.Request(
+        url, method="HEAD", headers={"User-Agent": "granite-geo-flood"}
+    )
+    try:
+        opener = urllib.request.build_opener(_NoRedirect)
+        with opener.open(request, timeout=timeout) as response:
+            headers = response.headers
+    except urllib.error.HTTPError as e:
+        if not 300 <= e.code < 400:
+            raise
+        headers = e.headers
+
+    if headers.get("X-Linked-Etag"):
+        return "sha256:" + headers["X-Linked-Etag"].strip('"')
+    if headers.get("ETag"):
+        return "git-sha1:" + headers["ETag"].removeprefix("W/").strip('"')
+    raise ValueError(f"{url} has no published checksum")
+
+
+def _parse_checksum(checksum: str) -> tuple[str, str]:
+    """("<algorithm>", "<hex>") of "<algorithm>:<hex>", or of a bare sha256.
+    Besides hashlib's algorithms, "git-sha1" is the hash git gives a file."""
+    algorithm, _, digest = checksum.rpartition(":")
+    algorithm = algorithm or "sha256"
+    if algorithm != "git-sha1":
+        hashlib.new(algorithm)  # raises for unknown algorithms
+    return algorithm, digest.lower()
+
+
+def _request(
+    url: str,
+    start: int | None = None,
+    end: int | None = None,
+    timeout: float = 60,
+):
+    headers = {"User-Agent": "granite-geo-flood"}
+    if start is not None:
+        headers["Range"] = f"bytes={start}-{'' if end is None else end - 1}"
+    return urllib.request.urlopen(
+        urllib.request.Request(url, headers=headers), timeout=timeout
+    )
+
+
+def probe(url: str, timeout: float = 60) -> dict:
+    """size, validator and range support of a remote file, from a request
+    for its first byte
+
+    Returns:
+        dict: "size" (None if unknown), "ranges" (bool) and "etag"
+    """
+    with _request(url, 0, 1, timeout) as response:
+        headers = response.headers
+        total = headers.get("Content-Range", "").rpartition("/")[2]
+        if response.status == 206 and total.isdigit():
+            size, ranges = int(total), True
+        else:
+            length = headers.get("Content-Length")
+            size, ranges = (int(length) if length else None), False
+    return {
+        "size": size,
+        "ranges": ranges,
+        "etag": headers.get("ETag") or headers.get("Last-Modified"),
+    }
+
+
+class _PartialFile:
+    """a file being downloaded in parts, possibly out of order, into a
+    preallocated file in the cache, with its progress saved so that a later
+    download can resume. `reader` returns its bytes in order as soon as
+    they are written."""
+
+    def __init__(self, path: Path, info: dict, part_size: int) -> None:
+        self.path = path
+        self.state_file = path.with_suffix(".json")
+        self.size = info["size"]
+        self.ranges = info["ranges"] and self.size is not None
+        self.part_size = part_size if self.ranges else None
+        if self.ranges:
+            self.parts = [
+                (start, min(start + part_size, self.size))
+                for start in range(0, self.size, part_size)
+            ]
+        else:
+            self.parts = [(0, self.size)]
+        self.state = {
+            "size": self.size,
+            "etag": info["etag"],
+            "part_size": self.part_size,
+            "done": [],
+        }
+
+        done = set()
+        if self.ranges and self.path.exists() and self.state_file.exists():
+            saved = json.loads(self.state_file.read_text())
+            if {k: saved.get(k) for k in ("size", "etag", "part_size")} == {
+                k: self.state[k] for k in ("size", "etag", "part_size")
+            }:
+                done = set(saved["done"])
+        self.done = done
+        self.written = [
+            end - start if i in done else 0
+            for i, (start, end) in enumerate(self.parts)
+        ]
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(
+            path, os.O_RDWR | os.O_CREAT | (0 if done else os.O_TRUNC)
+        )
+        if self.size is not None:
+            os.ftruncate(self.fd, self.size)
+
+        self.error = None
+        self.cancelled = False
+        self._cond = threading.Condition()
+
+    @property
+    def missing(self) -> list:
+        return [i for i in range(len(self.parts)) if i not in self.done]
+
+    def fetch(self, url: str, i: int, retries: int, timeout: float) -> None:
+        """download part `i`, continuing from where a failed attempt stopped"""
+        start, end = self.parts[i]
+        for attempt in range(retries + 1):
+            try:
+                if not self.ranges:
+                    with self._cond:
+                        self.written[i] = 0
+                offset = start + self.written[i]
+                span = (offset, end) if self.ranges else (None, None)
+                with _request(url, *span, timeout=timeout) as response:
+                    if self.ranges and response.status != 206:
+                        raise OSError(f"{url} ignored the byte range request")
+                    while not self.cancelled and (
+                        block := response.read(BLOCK_SIZE)
+                    ):
+                        os.pwrite(self.fd, block, offset)
+                        offset += len(block)
+                        with self._cond:
+                            self.written[i] = offset - start
+                            self._cond.notify_all()
+                if self.cancelled:
+                    return
+                if end is not None and offset != end:
+                    raise OSError(
+                        f"{url} ended after {offset - start} of "
+                        f"{end - start} bytes"
+                    )
+                with self._cond:
+                    if end is None:
+                        self.size = offset
+                        self.parts[i] = (start, offset)
+                    self.done.add(i)
+                    self._save()
+                    self._cond.notify_all()
+                return
+            except (OSError, http.client.HTTPException) as e:
+                if attempt == retries or self.cancelled:
+                    with self._cond:
+                        self.error = e
+                        self._cond.notify_all()
+                    raise
+                time.sleep(0.5 * 2**attempt)
+
+    def _save(self) -> None:
+        if not self.ranges:
+            return
+        self.state["done"] = sorted(self.done)
+        tmp_file = self.state_file.with_name(f".{self.state_file.name}.tmp")
+        tmp_file.write_text(json.dumps(self.state))
+        os.replace(tmp_file, self.state_file)
+
+    def readinto_at(self, position: int, buffer) -> int:
+        """bytes from `position` on, waiting until they have been written"""
+        with self._cond:
+            while True:
+                if self.error is not None:
+                    raise self.error
+                if self.size is not None and position >= self.size:
+                    return 0
+                i = position // self.part_size if self.ranges else 0
+                available = self.parts[i][0] + self.written[i] - position
+                if available > 0:
+                    break
+                if i in self.done:
+                    return 0
+                self._cond.wait()
+        data = os.pread(self.fd, min(len(buffer), available), position)
+        buffer[: len(data)] = data
+        return len(data)
+
+    def reader(self, digests: list) -> io.BufferedReader:
+        """in-order reader of the file that updates `digests` as it reads"""
+        partial = self
+
+        class Reader(io.RawIOBase):
+            position = 0
+
+            def readable(self) -> bool:
+                return True
+
+            def readinto(self, buffer) -> int:
+                n = partial.readinto_at(self.position, buffer)
+                for digest in digests:
+                    digest.update(memoryview(buffer)[:n])
+                self.position += n
+                return n
+
+        return io.BufferedReader(Reader(), BLOCK_SIZE)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+        self.state_file.unlink(missing_ok=True)
+
+
+def _move_tree(src: Path, dst: Path) -> None:
+    """move the contents of `src` into `dst`, replacing files but keeping
+    anything else already in `dst`"""
+    shutil.copytree(src, dst, dirs_exist_ok=True, copy_function=os.replace)
+    shutil.rmtree(src)
+
+
+def extract_tar(tar_file: Path | str, extract_dir: Path | str) -> None:
+    """extract a (compressed) tarball, e.g. one already in the cache"""
+    extract_dir = Path(extract_dir)
+    extract_dir.mkdir(parents=True, exist_ok=True)
+    with tarfile.open(tar_file) as tar:
+        tar.extractall(extract_dir, filter="data")
+
+
+def _url_key(url: str) -> str:
+    """name of the cache ref of a URL"""
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+def _load_ref(cache_dir: Path, key: str) -> dict | None:
+    """URL, size and checksums of the last file downloaded for a ref"""
+    ref_file = cache_dir / "refs" / f"{key}.json"
+    return json.loads(ref_file.read_text()) if ref_file.exists() else None
+
+
+def _verified_checksum(cache_dir: Path, url: str) -> str | None:
+    """checksum the cached copy of `url` was verified against when it was
+    downloaded, or None if there is none or it was not verified"""
+    key = _url_key(url)
+    ref = _load_ref(cache_dir, key)
+    if ref is None or "verified" not in ref:
+        return None
+    algorithm = ref["verified"]
+    if _cached(cache_dir, key, algorithm, ref[algorithm]) is None:
+        return None
+    return f"{algorithm}:{ref[algorithm]}"
+
+
+def _cached(
+    cache_dir: Path, key: str, algorithm: str, expected: str | None
+) -> Path | None:
+    ref = _load_ref(cache_dir, key)
+    if ref is not None:
+        blob = cache_dir / "blobs" / f"sha256-{ref['sha256']}"
+        if (
+            blob.exists()
+            and blob.stat().st_size == ref["size"]
+            and expected in (None, ref.get(algorithm))
+        ):
+            return blob
+    if algorithm == "sha256" and expected is not None:
+        # the same content from another URL
+        blob = cache_dir / "blobs" / f"sha256-{expected}"
+        if blob.exists():
+            return blob
+    return None
+
+
+def fetch(
+    url: str,
+    checksum: str | None = None,
+    cache_dir: Path | str | None = None,
+    extract_dir: Path | str | None = None,
+    connections: int = 4,
+    part_size: int = PART_SIZE,
+    retries: int = 3,
+    timeout: float = 60,
+) -> Path:
+    """download a file into the cache, unless it is already there, and
+    return its cached copy.
+
+    Files are stored by the sha256 of their content, under `blobs/`, and
+    found again from their URL or checksum. Servers that accept byte ranges
+    are downloaded `part_size` bytes at a time over `connections`
+    connections; finished parts are recorded, so a download that fails or
+    is interrupted resumes from the parts it is missing, and a part whose
+    connection drops continues from its last byte. The file is hashed, and
+    extracted if it is a tarball, while it downloads, from the parts
+    written so far. The extracted files only replace those in
+    `extract_dir` once the checksum matches.
+
+    Args:
+        url (str): file to download
+        checksum (str | None): expected "<algorithm>:<hex>" (e.g. "md5:…" as
+            published by Zenodo, or "git-sha1:…" as by Hugging Face) or bare
+            sha256. Defaults to None (not verified).
+        cache_dir (Path | str | None): cache location. Defaults to CACHE_DIR.
+        extract_dir (Path | str | None): directory into which to extract a
+            tarball. Defaults to None (not extracted).
+        connections (int): parallel range requests. Defaults to 4.
+        part_size (int): bytes per range request. Defaults to PART_SIZE.
+        retries (int): retries of each part. Defaults to 3.
+        timeout (float): seconds to wait on the server. Defaults to 60.
+
+    Returns:
+        Path: cached file
+
+    Raises:
+        ValueError: if the file does not match `checksum`
+        tarfile.TarError: if `extract_dir` is given and the file is not a
+            tarball
+    """
+    cache_dir = Path(cache_dir) if cache_dir is not None else CACHE_DIR
+    algorithm, expected = (
+        _parse_checksum(checksum) if checksum else ("sha256", None)
+    )
+    key = _url_key(url)
+
+    blob = _cached(cache_dir, key, algorithm, expected)
+    if blob is not None:
+        if extract_dir is not None:
+            extract_tar(blob, extract_dir)
+        return blob
+
+    info = probe(url, timeout)
+    digests = {"sha256": hashlib.sha256()}
+    if algorithm == "git-sha1":
+        if info["size"] is None:
+            raise ValueError(f"{url} has no size to compute its git hash")
+        # git hashes a header with the size, then the content
+        digests[algorithm] = hashlib.sha1(f"blob {info['size']}\0".encode())
+    else:
+        digests.setdefault(algorithm, hashlib.new(algorithm))
+    partial = _PartialFile(cache_dir / "partial" / key, info, part_size)
+    staging = None
+    if extract_dir is not None:
+        extract_dir = Path(extract_dir)
+        staging = extract_dir.parent / f".{extract_dir.name}.{key}.partial"
+        shutil.rmtree(staging, ignore_errors=True)
+
+    try:
+        with ThreadPoolExecutor(max(1, connections)) as executor:
+            futures = [
+                executor.submit(partial.fetch, url, i, retries, timeout)
+                for i in partial.missing
+            ]
+            try:
+                reader = partial.reader(list(digests.values()))
+                if staging is not None:
+                    with tarfile.open(fileobj=reader, mode="r|*") as tar:
+                        tar.extractall(staging, filter="data")
+                # the rest: tar padding, or the whole file if not extracting
+                while reader.read(BLOCK_SIZE):
+                    pass
+            except BaseException:
+                partial.cancel()
+                executor.shutdown(cancel_futures=True)
+                raise
+            for future in futures:
+                future.result()
+    except BaseException as e:
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+        if isinstance(e, tarfile.TarError):
+            # the server's file is not a tarball, resuming it would not help
+            partial.discard()
+        raise
+    finally:
+        partial.close()
+
+    hexdigests = {name: digest.hexdigest() for name, digest in digests.items()}
+    if expected is not None and hexdigests[algorithm] != expected:
+        partial.discard()
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+        raise ValueError(
+            f"{url} has {algorithm} {hexdigests[algorithm]}, "
+            f"expected {expected}"
+        )
+
+    blob = cache_dir / "blobs" / f"sha256-{hexdigests['sha256']}"
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(partial.path, blob)
+    partial.discard()
+    ref_file = cache_dir / "refs" / f"{key}.json"
+    ref_file.parent.mkdir(parents=True, exist_ok=True)
+    ref_file.write_text(
+        json.dumps(
+            {
+                "url": url,
+                "size": blob.stat().st_size,
+                **hexdigests,
+                **({"verified": algorithm} if expected is not None else {}),
+            }
+        )
+    )
+
+    if staging is not None:
+        _move_tree(staging, extract_dir)
+    return blob
+
+
+def _place(blob: Path, save_file: Path | str) -> Path:
+    """put a cached file at `save_file`, as a hard link where possible"""
+    save_file = Path(save_file)
+    save_file.parent.mkdir(parents=True, exist_ok=True)
+    save_file.unlink(missing_ok=True)
+    try:
+        os.link(blob, save_file)
+    except OSError:
+        shutil.copyfile(blob, save_file)
+    return save_file
+
+
+def download_dataset(
+    name: str,
+    save_file: Path | str | None = None,
+    extract_dir: Path | str | None = None,
+    checksum: str | None = None,
+    **kwargs,
+) -> Path:
+    """download one of DATASETS through the cache (see `fetch`), verified
+    against the checksum Zenodo publishes for it. Zenodo is only asked for
+    the checksum if the dataset is not already in the cache.
+
+    Args:
+        name (str): "uki", "uki_and_spain" or "valencia"
+        save_file (Path | str | None): where to put the tarball. Defaults to
+            None (only in the cache).
+        extract_dir (Path | str | None): directory into which to extract
+            it. Defaults to None.
+        checksum (str | None): expected checksum. Defaults to None (looked up
+            on Zenodo).
+        **kwargs: passed to `fetch`
+
+    Returns:
+        Path: the tarball, at `save_file` if given
+
+    Raises:
+        ValueError: if no `checksum` is given and Zenodo publishes none
+    """
+    url = dataset_url(name)
+    if checksum is None:
+        cache_dir = kwargs.get("cache_dir")
+        cache_dir = Path(cache_dir) if cache_dir is not None else CACHE_DIR
+        checksum = _verified_checksum(cache_dir, url) or zenodo_checksum(
+            DATASETS[name]
+        )
+        if checksum is None:
+            raise ValueError(
+                f"Zenodo publishes no checksum for {DATASETS[name]}, "
+                "pass the checksum to expect"
+            )
+    blob = fetch(url, checksum, extract_dir=extract_dir, **kwargs)
+    return _place(blob, save_file) if save_file is not None else blob
+
+
+def download_model(target_dir: Path | str, **kwargs) -> list:
+    """download the fine-tuned checkpoint and its config through the cache
+    (see `fetch`) into `target_dir`, verified against the checksums Hugging
+    Face publishes for them (see `huggingface_checksum`). These are only
+    looked up for files not already in the cache.
+
+    Returns:
+        list: the checkpoint and config files
+    """
+    cache_dir = kwargs.get("cache_dir")
+    cache_dir = Path(cache_dir) if cache_dir is not None else CACHE_DIR
+
+    files = []
+    for filename in MODEL_FILES:
+        url = f"{MODEL_URL}/{filename}"
+        checksum = _verified_checksum(cache_dir, url) or huggingface_checksum(
+            url, kwargs.get("timeout", 60)
+        )
+        blob = fetch(url, checksum, **kwargs)
+        files.append(_place(blob, Path(target_dir) / filename))
+    return files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Download the flood detection datasets or model "
+            "through a local cache."
+        )
+    )
+    parser.add_argument("name", choices=[*DATASETS, "model"])
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Tarball to write for a dataset, or directory of the model files",
+    )
+    parser.add_argument(
+        "--extract_dir", default=None, help="Extract a dataset here"
+    )
+    parser.add_argument(
+        "--checksum",
+        default=None,
+        help="Expected <algorithm>:<hex> of a dataset (default: Zenodo's)",
+    )
+    parser.add_argument(
+        "--cache_dir", default=None, help=f"Defaults to {CACHE_DIR}"
+    )
+    parser.add_argument("--connections", type=int, default=4)
+    args = parser.parse_args()
+
+    kwargs = {"cache_dir": args.cache_dir, "connections": args.connections}
+    if args.name == "model":
+        for path in download_model(args.output or ".", **kwargs):
+            print(f"Saved {path}")
+        return
+    path = download_dataset(
+        args.name, args.output, args.extract_dir, args.checksum, **kwargs
+    )
+    print(f"Saved {path}")
+    if args.extract_dir:
+        print(f"Extracted to {args.extract_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""compare the encoder computing only the needed blocks against all blocks"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+_ENCODER_RUN = """
+import json, resource, time
+import torch
+from granite_geo_flood.predictor import FloodPredictor
+predictor = FloodPredictor({config_file!r})
+encoder = predictor.model.encoder
+out_indices = encoder.feature_info.out_indices
+bands = predictor.preprocessor.num_bands
+x = torch.randn({batch_size}, bands, {tile_size}, {tile_size})
+
+def all_blocks(x):
+    # what the encoder did before: copy every block output, then select
+    features = encoder.forward_features(x)
+    return [features[i] for i in out_indices]
+
+run = {{"all_blocks": all_blocks, "selected_blocks": encoder}}[{variant!r}]
+with torch.inference_mode():
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    run(x)  # warm up
+    start = time.perf_counter()
+    for _ in range({num_batches}):
+        run(x)
+    seconds = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "tiles_per_second": {num_batches} * {batch_size} / seconds,
+    "peak_rss_mb": after / 1024,
+    "forward_peak_mb": max(after - before, 0) / 1024,
+}}))
+"""
+
+
+def compare_encoder_forward(
+    config_file: Path | str,
+    batch_size: int = 4,
+    tile_size: int = 512,
+    num_batches: int = 2,
+) -> dict:
+    """throughput and peak memory of the encoder keeping every block output
+    (`forward_features`) against computing only the configured `out_indices`.
+    Each runs in a fresh interpreter so that its peak memory is its own.
+
+    Args:
+        config_file (Path | str): YAML config of the model (random weights
+            are used)
+        batch_size (int): tiles per forward pass. Defaults to 4.
+        tile_size (int): tile height and width. Defaults to 512.
+        num_batches (int): timed batches. Defaults to 2.
+
+    Returns:
+        dict: tiles_per_second, peak_rss_mb and forward_peak_mb for
+            "all_blocks" and "selected_blocks"
+    """
+    results = {}
+    for variant in ("all_blocks", "selected_blocks"):
+        code = _ENCODER_RUN.format(
+            config_file=str(config_file),
+            batch_size=batch_size,
+            tile_size=tile_size,
+            num_batches=num_batches,
+            variant=variant,
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results[variant] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare encoder memory and throughput with and without "
+        "keeping every block output."
+    )
+    parser.add_argument("--config", required=True, help="Path to config.yaml")
+    parser.add_argument("--batch_size", type=int, default=4)
+    parser.add_argument("--tile_size", type=int, default=512)
+    parser.add_argument("--num_batches", type=int, default=2)
+    args = parser.parse_args()
+
+    results = compare_encoder_forward(
+        args.config, args.batch_size, args.tile_size, args.num_batches
+    )
+    for variant, stats in results.items():
+        print(
+            f"{variant:>15}: {stats['tiles_per_second']:6.2f} tiles/s, "
+            f"forward peak {stats['forward_peak_mb']:.0f} MB, "
+            f"process peak {stats['peak_rss_mb']:.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
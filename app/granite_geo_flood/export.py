@@ -0,0 +1,165 @@
+"""slim, inference-only model artifacts with memory-mapped loading"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import torch
+
+from granite_geo_flood.predictor import build_model, load_config
+
+
+def inference_config(config: dict) -> dict:
+    """copy of a config without the training-only auxiliary heads"""
+    config = json.loads(json.dumps(config))
+    init_args = config["model"]["init_args"]
+    init_args["aux_heads"] = None
+    init_args["aux_loss"] = None
+    return config
+
+
+def export_artifact(
+    config_file: Path | str, checkpoint: Path | str, save_file: Path | str
+) -> Path:
+    """write the weights needed for inference, with the config they belong to.
+
+    The artifact holds the encoder, necks and main decoder/head weights in
+    the layout of the built model (band selection already applied), without
+    optimizer state, hyperparameters or the auxiliary FCN head.
+
+    Args:
+        config_file (Path | str): YAML config used to train the model
+        checkpoint (Path | str): lightning checkpoint
+        save_file (Path | str): artifact location, e.g. `model.pt`
+
+    Returns:
+        Path: the written artifact
+    """
+    config = load_config(config_file)
+    model = build_model(config, checkpoint)
+
+    state_dict = {
+        k: v.contiguous()
+        for k, v in model.state_dict().items()
+        if not k.startswith("aux_heads.")
+    }
+    torch.save(
+        {"config": inference_config(config), "state_dict": state_dict},
+        save_file,
+    )
+
+    return Path(save_file)
+
+
+def load_artifact(artifact_file: Path | str) -> tuple[dict, torch.nn.Module]:
+    """load an artifact written by `export_artifact`.
+
+    The model is built on the meta device, so no weights are allocated or
+    randomly initialised, and the memory-mapped weights are then assigned
+    to it without copying. Worker processes loading the same artifact share
+    its pages through the OS page cache.
+
+    Args:
+        artifact_file (Path | str): artifact location
+
+    Returns:
+        tuple[dict, torch.nn.Module]: config, model in eval mode
+    """
+    artifact = torch.load(
+        artifact_file, map_location="cpu", mmap=True, weights_only=True
+    )
+    config = artifact["config"]
+
+    with torch.device("meta"):
+        model = build_model(config)
+    model.load_state_dict(artifact["state_dict"], assign=True)
+    if any(t.is_meta for t in (*model.parameters(), *model.buffers())):
+        # buffers outside the state dict only get their values from a real init
+        model = build_model(config)
+        model.load_state_dict(artifact["state_dict"], assign=True)
+    model.eval()
+    model.requires_grad_(False)
+
+    return config, model
+
+
+_COLD_START = """
+import json, resource, time
+start = time.perf_counter()
+from granite_geo_flood.predictor import FloodPredictor
+{load}
+seconds = time.perf_counter() - start
+status = dict(
+    line.split(":", 1) for line in open("/proc/self/status") if ":" in line
+)
+print(json.dumps({{
+    "seconds": seconds,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "rss_anon_mb": int(status.get("RssAnon", "0 kB").split()[0]) / 1024,
+}}))
+"""
+
+
+def measure_cold_start(
+    config_file: Path | str, checkpoint: Path | str, artifact_file: Path | str
+) -> dict:
+    """time a fresh interpreter loading the model from the checkpoint and
+    from the artifact, with its peak and private (anonymous) memory
+
+    Returns:
+        dict: seconds, max_rss_mb and rss_anon_mb for each path
+    """
+    loads = {
+        "checkpoint": (
+            f"FloodPredictor({str(config_file)!r}, {str(checkpoint)!r})"
+        ),
+        "artifact": f"FloodPredictor.from_artifact({str(artifact_file)!r})",
+    }
+    results = {}
+    for name, load in loads.items():
+        output = subprocess.run(
+            [sys.executable, "-c", _COLD_START.format(load=load)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results[name] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Export an inference-only flood model artifact."
+    )
+    parser.add_argument("--config", required=True, help="Path to config.yaml")
+    parser.add_argument(
+        "--checkpoint", required=True, help="Path to model.ckpt"
+    )
+    parser.add_argument("--output", required=True, help="Artifact to write")
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Compare cold start time and memory against the checkpoint",
+    )
+    args = parser.parse_args()
+
+    artifact = export_artifact(args.config, args.checkpoint, args.output)
+    size = artifact.stat().st_size / 2**20
+    ckpt_size = Path(args.checkpoint).stat().st_size / 2**20
+    print(f"Wrote {artifact} ({size:.1f} MB, checkpoint {ckpt_size:.1f} MB)")
+
+    if args.benchmark:
+        for name, stats in measure_cold_start(
+            args.config, args.checkpoint, artifact
+        ).items():
+            print(
+                f"{name:>10}: {stats['seconds']:.2f} s, "
+                f"peak RSS {stats['max_rss_mb']:.0f} MB, "
+                f"private RSS {stats['rss_anon_mb']:.0f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
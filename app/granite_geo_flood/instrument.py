@@ -0,0 +1,284 @@
+"""structured per-tile events, run metrics and sampled profiles of inference
+runs"""
+
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# per-tile durations recorded in each event and histogram
+STAGES = ("read", "preprocess", "queue_wait", "forward", "write")
+
+# Prometheus' default histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROFILERS = ("torch", "cprofile")
+
+
+class Histogram:
+    """cumulative bucket counts, sum and count of observations, as in
+    Prometheus histograms"""
+
+    def __init__(self, buckets: tuple = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list:
+        """(le, count of observations up to le) for each bucket"""
+        bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+        totals, total = [], 0
+        for count in self.counts:
+            total += count
+            totals.append(total)
+        return list(zip(bounds, totals))
+
+
+class RunRecorder:
+    """collects a structured event per predicted tile and run-level
+    counters and histograms, and optionally profiles a sample of batches.
+
+    Events are appended to `events_file` as JSON lines as tiles are
+    written. `close` adds a run summary event and writes the metrics in the
+    Prometheus text format to `metrics_file`, e.g. for the node exporter's
+    textfile collector. Recording is thread-safe; inference code takes a
+    recorder of None to skip it altogether.
+
+    Args:
+        events_file (Path | str | None): JSON lines file for the events.
+            Defaults to None (metrics only).
+        metrics_file (Path | str | None): Prometheus text file for the
+            metrics. Defaults to None.
+        profiler (str | None): "torch" (torch.profiler Chrome traces) or
+            "cprofile" (pstats files) to profile the sampled batches.
+            Defaults to None.
+        profile_tiles (list): indices of the tiles whose batches are
+            profiled. Defaults to (0,).
+        profile_dir (Path | str | None): directory for the profiles.
+            Defaults to the directory of the events or metrics file.
+    """
+
+    def __init__(
+        self,
+        events_file: Path | str | None = None,
+        metrics_file: Path | str | None = None,
+        profiler: str | None = None,
+        profile_tiles: list = (0,),
+        profile_dir: Path | str | None = None,
+    ) -> None:
+        if profiler not in (None, *PROFILERS):
+            raise ValueError(
+                f"Unknown profiler {profiler}, expected one of {PROFILERS}"
+            )
+
+        self.metrics_file = (
+            Path(metrics_file) if metrics_file is not None else None
+        )
+        self.profiler = profiler
+        self.profile_tiles = set(profile_tiles)
+        if profile_dir is None:
+            profile_dir = Path(events_file or metrics_file or ".").parent
+        self.profile_dir = Path(profile_dir)
+
+        self._events = None
+        if events_file is not None:
+            Path(events_file).parent.mkdir(parents=True, exist_ok=True)
+            self._events = open(events_file, "a")
+
+        self.counters = {
+            "tiles": 0,
+            "batches": 0,
+            "skipped": 0,
+            "bytes_read": 0,
+            "errors": 0,
+        }
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def tile(
+        self,
+        image_file: Path | str,
+        shape: tuple,
+        batch_size: int,
+        **seconds: float,
+    ) -> None:
+        """record a written tile and the seconds each stage spent on it
+
+        Args:
+            image_file (Path | str): input GeoTIFF of the tile
+            shape (tuple): shape [bands x h x w] of the tile
+            batch_size (int): tiles in the batch it was predicted in
+            **seconds (float): `<stage>_seconds` for each of STAGES the
+                tile went through. Skipped tiles have no forward pass, and
+                their missing stages are left out of the histograms.
+        """
+        bytes_read = os.path.getsize(image_file)
+        event = {
+            "event": "tile",
+            "time": time.time(),
+            "path": str(image_file),
+            "shape": list(shape),
+            "batch_size": batch_size,
+            "bytes_read": bytes_read,
+            **seconds,
+        }
+        with self._lock:
+            self.counters["tiles"] += 1
+            self.counters["bytes_read"] += bytes_read
+            for stage in STAGES:
+                if f"{stage}_seconds" in seconds:
+                    self.histograms[stage].observe(seconds[f"{stage}_seconds"])
+            self._write_event(event)
+
+    def batch(self) -> None:
+        """count a predicted batch"""
+        with self._lock:
+            self.counters["batches"] += 1
+
+    def skip(self, image_file: Path | str, reason: str) -> None:
+        """record a tile written without a forward pass (see
+        `granite_geo_flood.skip`). It is also recorded by `tile` once
+        written."""
+        with self._lock:
+            self.counters["skipped"] += 1
+            self._write_event(
+                {
+                    "event": "skip",
+                    "time": time.time(),
+                    "path": str(image_file),
+                    "reason": reason,
+                }
+            )
+
+    def error(self, image_file: Path | str, error: Exception) -> None:
+        """record a tile that could not be predicted or written"""
+        with self._lock:
+            self.counters["errors"] += 1
+            self._write_event(
+                {
+                    "event": "error",
+                    "time": time.time(),
+                    "path": str(image_file),
+                    "error": str(error),
+                }
+            )
+
+    def profile(self, tile_ids: list):
+        """context in which to run the forward pass of a batch, profiling it
+        if it holds one of the sampled tiles"""
+        if self.profiler is None or self.profile_tiles.isdisjoint(tile_ids):
+            return nullcontext()
+        return self._profile(min(tile_ids))
+
+    @contextmanager
+    def _profile(self, tile_id: int):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        if self.profiler == "torch":
+            from torch.profiler import ProfilerActivity, profile
+
+            with profile(
+                activities=[ProfilerActivity.CPU], record_shapes=True
+            ) as prof:
+                yield
+            prof.export_chrome_trace(
+                str(self.profile_dir / f"trace_tile_{tile_id}.json")
+            )
+        else:
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                yield
+            finally:
+                prof.disable()
+                prof.dump_stats(
+                    self.profile_dir / f"profile_tile_{tile_id}.prof"
+                )
+
+    def _write_event(self, event: dict) -> None:
+        if self._events is not None:
+            self._events.write(json.dumps(event) + "\n")
+
+    def prometheus(self, prefix: str = "flood_inference") -> str:
+        """counters and histograms in the Prometheus text exposition format"""
+        lines = [
+            f"# HELP {prefix}_run_seconds Seconds since the run started.",
+            f"# TYPE {prefix}_run_seconds gauge",
+            f"{prefix}_run_seconds {time.perf_counter() - self._start:.6f}",
+        ]
+        for name, value in self.counters.items():
+            help_text = name.replace("_", " ").capitalize()
+            lines += [
+                f"# HELP {prefix}_{name}_total {help_text} so far.",
+                f"# TYPE {prefix}_{name}_total counter",
+                f"{prefix}_{name}_total {value}",
+            ]
+
+        name = f"{prefix}_stage_seconds"
+        lines += [
+            f"# HELP {name} Seconds per tile spent in each stage.",
+            f"# TYPE {name} histogram",
+        ]
+        for stage, histogram in self.histograms.items():
+            for le, count in histogram.cumulative():
+                lines.append(
+                    f'{name}_bucket{{stage="{stage}",le="{le}"}} {count}'
+                )
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self) -> None:
+        """replace the metrics file, atomically so a scraper never reads
+        half of it"""
+        if self.metrics_file is None:
+            return
+        self.metrics_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.metrics_file.with_name(
+            f".{self.metrics_file.name}.tmp"
+        )
+        with self._lock:
+            tmp_file.write_text(self.prometheus())
+        os.replace(tmp_file, self.metrics_file)
+
+    def summary(self) -> dict:
+        """run-level counters and mean seconds per tile of each stage"""
+        return {
+            "seconds": time.perf_counter() - self._start,
+            **self.counters,
+            **{
+                f"mean_{stage}_seconds": h.sum / h.count if h.count else 0.0
+                for stage, h in self.histograms.items()
+            },
+        }
+
+    def close(self) -> None:
+        """write the run summary event and the metrics file"""
+        with self._lock:
+            self._write_event(
+                {"event": "run", "time": time.time(), **self.summary()}
+            )
+            if self._events is not None:
+                self._events.close()
+                self._events = None
+        self.write_metrics()
+
+    def __enter__(self) -> "RunRecorder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
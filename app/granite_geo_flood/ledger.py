@@ -0,0 +1,212 @@
+"""persistent run ledger for resuming interrupted batch inference"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from granite_geo_flood.batching import group_batches
+
+
+def file_hash(path: Path | str, chunk_size: int = 2**20) -> str:
+    """sha256 of a file's contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_hash(config: dict) -> str:
+    """sha256 of a parsed config, independent of key order"""
+    return hashlib.sha256(
+        json.dumps(config, sort_keys=True).encode()
+    ).hexdigest()
+
+
+class RunLedger:
+    """append-only JSON-lines record of the tiles of a run, kept in the
+    output directory. Each line records an input's content hash, the model
+    and config hashes, the output path and a status of "started", "done"
+    or "failed"; the last line of an input is its current state.
+
+    A tile is complete if its last record is "done" with the same input,
+    model and config hashes and its output still exists. Input hashes are
+    reused while a file's size and mtime are unchanged.
+
+    Args:
+        ledger_file (Path | str): JSON-lines file, created if missing
+        model_hash (str): hash of the model weights (see `file_hash`)
+        config_hash (str): hash of the model config (see `config_hash`)
+    """
+
+    def __init__(
+        self, ledger_file: Path | str, model_hash: str, config_hash: str
+    ) -> None:
+        self.ledger_file = Path(ledger_file)
+        self.model_hash = model_hash
+        self.config_hash = config_hash
+
+        self.records = {}
+        if self.ledger_file.exists():
+            with open(self.ledger_file) as f:
+                for line in f:
+                    # the last line may be cut short by a crash
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.records[record["input"]] = record
+
+    def input_hash(self, image_file: Path | str) -> dict:
+        """content hash of an input, reusing the ledger's if the file is
+        unchanged"""
+        stat = os.stat(image_file)
+        key = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        record = self.records.get(str(image_file))
+        if record is not None and all(
+            record.get(k) == v for k, v in key.items()
+        ):
+            return dict(key, input_hash=record["input_hash"])
+        return dict(key, input_hash=file_hash(image_file))
+
+    def is_done(self, image_file: Path | str) -> bool:
+        record = self.records.get(str(image_file))
+        return (
+            record is not None
+            and record["status"] == "done"
+            and record["model_hash"] == self.model_hash
+            and record["config_hash"] == self.config_hash
+            and record["input_hash"]
+            == self.input_hash(image_file)["input_hash"]
+            and Path(record["output"]).exists()
+        )
+
+    def pending(self, image_files: list) -> list:
+        """inputs still to predict: new, changed, failed or interrupted ones.
+        Outputs of interrupted tiles may be partly written and are removed.
+
+        Args:
+            image_files (list): all inputs of the run
+
+        Returns:
+            list: indices into `image_files` of the inputs to predict
+        """
+        todo = []
+        for i, image_file in enumerate(image_files):
+            if self.is_done(image_file):
+                continue
+            record = self.records.get(str(image_file))
+            if record is not None and record["status"] == "started":
+                Path(record["output"]).unlink(missing_ok=True)
+            todo.append(i)
+        return todo
+
+    def record(
+        self,
+        image_files: list,
+        output_files: list,
+        status: str,
+        error: str | None = None,
+    ) -> None:
+        """append the status of some tiles, flushed to disk before returning"""
+        with open(self.ledger_file, "a") as f:
+            for image_file, output_file in zip(image_files, output_files):
+                previous = self.records.get(str(image_file), {})
+                record = {
+                    "input": str(image_file),
+                    **self.input_hash(image_file),
+                    "model_hash": self.model_hash,
+                    "config_hash": self.config_hash,
+                    "output": str(output_file),
+                    "status": status,
+                    "attempts": previous.get("attempts", 0)
+                    + (status == "started"),
+                }
+                if error is not None:
+                    record["error"] = error
+                self.records[record["input"]] = record
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def run_resumable(
+    predictor,
+    image_files: list,
+    output_dir: Path | str,
+    ledger: RunLedger,
+    batch_size: int = 1,
+    shapes: list | None = None,
+    writer=None,
+    tile_filter=None,
+) -> tuple[list, list]:
+    """predict the tiles the ledger does not have as done, one batch at a
+    time. A batch that fails is recorded as failed and the run moves on, so
+    one bad tile only costs its own batch; it is retried by the next run.
+
+    Args:
+        predictor (FloodPredictor): loaded model
+        image_files (list): all inputs of the run
+        output_dir (Path | str): directory in which to write
+            `<image name>_pred.tif`
+        ledger (RunLedger): ledger of the output directory
+        batch_size (int): tiles per forward pass. Defaults to 1.
+        shapes (list | None): shape of each file if already known. Defaults
+            to None.
+        writer (AsyncWriter | None): output writer passed to
+            `FloodPredictor.predict_files`. Defaults to None.
+        tile_filter (TileFilter | None): tile filter passed to
+            `FloodPredictor.predict_files`. Defaults to None.
+
+    Returns:
+        tuple[list, list]: written files (skipped tiles included) in input
+            order with None for failed tiles, and (input, error) of each
+            failure
+    """
+    from granite_geo_flood.predictor import read_shape
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_files = [
+        output_dir / f"{Path(f).stem}_pred.tif" for f in image_files
+    ]
+    saved = [
+        output_file if ledger.is_done(image_file) else None
+        for image_file, output_file in zip(image_files, output_files)
+    ]
+
+    todo = ledger.pending(image_files)
+    if shapes is None:
+        shapes = [read_shape(image_files[i]) for i in todo]
+    else:
+        shapes = [shapes[i] for i in todo]
+
+    failures = []
+    for batch_ids in group_batches(shapes, batch_size):
+        ids = [todo[i] for i in batch_ids]
+        files = [image_files[i] for i in ids]
+        outputs = [output_files[i] for i in ids]
+
+        ledger.record(files, outputs, "started")
+        try:
+            predictor.predict_files(
+                files,
+                output_dir,
+                batch_size=len(files),
+                shapes=[shapes[i] for i in batch_ids],
+                writer=writer,
+                tile_filter=tile_filter,
+            )
+        except Exception as e:
+            for output_file in outputs:
+                output_file.unlink(missing_ok=True)
+            ledger.record(files, outputs, "failed", error=str(e))
+            failures.extend((f, str(e)) for f in files)
+            continue
+
+        ledger.record(files, outputs, "done")
+        for i, output_file in zip(ids, outputs):
+            saved[i] = output_file
+
+    return saved, failures
@@ -0,0 +1,150 @@
+"""load generator measuring throughput and tail latency of the inference
+service"""
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import aiohttp
+import numpy as np
+
+
+async def generate_load(
+    url: str,
+    image_file: Path | str,
+    num_requests: int = 100,
+    concurrency: int = 8,
+    output: str = "stats",
+    local_path: bool = False,
+) -> dict:
+    """send the same tile to `granite_geo_flood.server` from `concurrency`
+    clients at once until `num_requests` have been answered
+
+    Args:
+        url (str): service root, e.g. "http://localhost:8080"
+        image_file (Path | str): tile to send
+        num_requests (int): requests in total. Defaults to 100.
+        concurrency (int): requests in flight at once. Defaults to 8.
+        output (str): "mask" or "stats". Defaults to "stats".
+        local_path (bool): send the tile's path, relative to the service's
+            data directory, instead of uploading it. Defaults to False.
+
+    Returns:
+        dict: requests, errors by status, seconds, requests_per_second and
+            latency p50/p95/p99 of the successful requests
+    """
+    if local_path:
+        body = {"json": {"path": str(image_file)}}
+    else:
+        body = {
+            "data": Path(image_file).read_bytes(),
+            "headers": {"Content-Type": "image/tiff"},
+        }
+
+    latencies, errors = [], {}
+    remaining = iter(range(num_requests))
+
+    async def client(session: aiohttp.ClientSession) -> None:
+        for _ in remaining:
+            start = time.perf_counter()
+            async with session.post(
+                f"{url}/predict", params={"output": output}, **body
+            ) as response:
+                await response.read()
+            if response.status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors[response.status] = errors.get(response.status, 0) + 1
+
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        seconds = time.perf_counter() - start
+
+    p50, p95, p99 = (
+        np.percentile(latencies, [50, 95, 99]) if latencies else (0.0,) * 3
+    )
+    return {
+        "requests": num_requests,
+        "errors": errors,
+        "seconds": seconds,
+        "requests_per_second": len(latencies) / seconds,
+        "latency_p50_seconds": float(p50),
+        "latency_p95_seconds": float(p95),
+        "latency_p99_seconds": float(p99),
+    }
+
+
+async def wait_until_ready(url: str, timeout: float = 600.0) -> None:
+    """poll the service's readiness endpoint until the model is loaded"""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{url}/readyz") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientConnectionError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{url} was not ready within {timeout} s")
+            await asyncio.sleep(0.5)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Measure throughput and tail latency of the flood inference "
+            "service."
+        )
+    )
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--image", required=True, help="GeoTIFF tile to send")
+    parser.add_argument("--num_requests", type=int, default=100)
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 4, 16]
+    )
+    parser.add_argument("--output", default="stats", choices=["mask", "stats"])
+    parser.add_argument(
+        "--local_path",
+        action="store_true",
+        help="Send --image as a path under the service's data directory",
+    )
+    parser.add_argument(
+        "--results", default=None, help="JSON file for the results"
+    )
+    args = parser.parse_args()
+
+    asyncio.run(wait_until_ready(args.url))
+    results = {}
+    for concurrency in args.concurrency:
+        stats = asyncio.run(
+            generate_load(
+                args.url,
+                args.image,
+                args.num_requests,
+                concurrency,
+                args.output,
+                args.local_path,
+            )
+        )
+        results[concurrency] = stats
+        print(
+            f"concurrency {concurrency:>3}: "
+            f"{stats['requests_per_second']:6.2f} req/s, "
+            f"p50 {stats['latency_p50_seconds'] * 1000:.0f} ms, "
+            f"p95 {stats['latency_p95_seconds'] * 1000:.0f} ms, "
+            f"p99 {stats['latency_p99_seconds'] * 1000:.0f} ms, "
+            f"errors {stats['errors'] or 0}"
+        )
+
+    if args.results:
+        with open(args.results, "w") as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""streaming mosaics of tile predictions into scene-level flood maps"""
+
+import argparse
+import os
+import re
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.shutil import copy as copy_dataset
+from rasterio.windows import Window
+
+# <EVENT>_<AOI>_<date>_tile_<row>_<col>_..._pred.tif
+TILE_PATTERN = re.compile(
+    r"^(?P<scene>.+)_tile_(?P<row>\d+)_(?P<col>\d+)(?:_.*)?_pred\.tif$"
+)
+
+MOSAIC_NODATA = -1
+
+
+@dataclass
+class Tile:
+    """header of a prediction tile and where it sits in its mosaic"""
+
+    path: Path
+    crs: object
+    transform: Affine
+    width: int
+    height: int
+    nodata: float | None
+    row_off: int = 0
+    col_off: int = 0
+
+    @classmethod
+    def open(cls, path: Path | str) -> "Tile":
+        with rasterio.open(path) as src:
+            return cls(
+                Path(path),
+                src.crs,
+                src.transform,
+                src.width,
+                src.height,
+                src.nodata,
+            )
+
+
+def scene_key(pred_file: Path | str) -> str | None:
+    """event/AOI/date prefix of a tile named by the tiling schema, or None"""
+    match = TILE_PATTERN.match(Path(pred_file).name)
+    return match["scene"] if match else None
+
+
+def group_tiles(pred_files: list) -> dict:
+    """group prediction tiles into scenes by the `<EVENT>_<AOI>_<date>`
+    prefix of their names. Tiles not named by the schema are grouped by
+    CRS and pixel size instead, so each group shares a grid.
+
+    Args:
+        pred_files (list): prediction GeoTIFFs
+
+    Returns:
+        dict: files of each scene, keyed by scene name
+    """
+    scenes = {}
+    for pred_file in sorted(pred_files):
+        key = scene_key(pred_file)
+        if key is None:
+            with rasterio.open(pred_file) as src:
+                xres, yres = src.res
+                epsg = src.crs.to_epsg() if src.crs else None
+            key = f"{epsg}_{xres:g}_{yres:g}"
+        scenes.setdefault(key, []).append(Path(pred_file))
+    return scenes
+
+
+def mosaic_grid(tiles: list) -> tuple[Affine, int, int]:
+    """transform and size of the grid covering all the tiles, with the
+    pixel offset of each tile set on it
+
+    Raises:
+        ValueError: if the tiles do not share a CRS and pixel grid
+    """
+    first = tiles[0]
+    xres, yres = first.transform.a, -first.transform.e
+    left = min(tile.transform.c for tile in tiles)
+    top = max(tile.transform.f for tile in tiles)
+    right = max(tile.transform.c + tile.width * xres for tile in tiles)
+    bottom = min(tile.transform.f - tile.height * yres for tile in tiles)
+
+    for tile in tiles:
+        if tile.crs != first.crs or not np.allclose(
+            (tile.transform.a, -tile.transform.e), (xres, yres)
+        ):
+            raise ValueError(
+                f"{tile.path} is not on the CRS and pixel size of {first.path}"
+            )
+        col = (tile.transform.c - left) / xres
+        row = (top - tile.transform.f) / yres
+        if abs(col - round(col)) > 0.01 or abs(row - round(row)) > 0.01:
+            raise ValueError(
+                f"{tile.path} is not aligned with the pixel grid of "
+                f"{first.path}"
+            )
+        tile.col_off, tile.row_off = round(col), round(row)
+
+    transform = Affine(xres, 0, left, 0, -yres, top)
+    return (
+        transform,
+        round((right - left) / xres),
+        round((top - bottom) / yres),
+    )
+
+
+def write_vrt(tiles: list, vrt_file: Path | str) -> Path:
+    """write a VRT index of the tiles, referencing them by relative path.
+    Where tiles overlap the last one wins, as in GDAL.
+
+    Args:
+        tiles (list): tiles of one scene (see `Tile`)
+        vrt_file (Path | str): output VRT location
+
+    Returns:
+        Path: the written VRT
+    """
+    vrt_file = Path(vrt_file)
+    transform, width, height = mosaic_grid(tiles)
+    geotransform = ", ".join(repr(v) for v in transform.to_gdal())
+
+    sources = []
+    for tile in tiles:
+        source = os.path.relpath(tile.path, vrt_file.parent)
+        nodata = (
+            f"<NODATA>{tile.nodata:g}</NODATA>"
+            if tile.nodata is not None
+            else ""
+        )
+        sources.append(
+            f"""    <ComplexSource>
+      <SourceFilename relativeToVRT="1">{escape(source)}</SourceFilename>
+      <SourceBand>1</SourceBand>
+      <SrcRect xOff="0" yOff="0" xSize="{tile.width}" ySize="{tile.height}"/>
+      <DstRect xOff="{tile.col_off}" yOff="{tile.row_off}"
+        xSize="{tile.width}" ySize="{tile.height}"/>
+      {nodata}
+    </ComplexSource>"""
+        )
+
+    crs = tiles[0].crs.to_wkt() if tiles[0].crs else ""
+    vrt_file.write_text(
+        f"""<VRTDataset rasterXSize="{width}" rasterYSize="{height}">
+  <SRS>{escape(crs)}</SRS>
+  <GeoTransform>{geotransform}</GeoTransform>
+  <VRTRasterBand dataType="Int16" band="1">
+    <NoDataValue>{MOSAIC_NODATA}</NoDataValue>
+{chr(10).join(sources)}
+  </VRTRasterBand>
+</VRTDataset>
+"""
+    )
+    return vrt_file
+
+
+def _read_tile(src, window: Window) -> np.ndarray:
+    """a window of a tile as int8, with its nodata set to the mosaic's"""
+    data = src.read(1, window=window)
+    out = data.astype(np.int8)
+    if src.nodata is not None:
+        out[data == src.nodata] = MOSAIC_NODATA
+    return out
+
+
+def _mosaic_block(
+    sources: list, row: int, col: int, height: int, width: int, overlap: str
+) -> np.ndarray:
+    """one output block from the (tile, open dataset) pairs overlapping it"""
+    block = np.full((height, width), MOSAIC_NODATA, np.int8)
+    for tile, src in sources:
+        # overlap of the tile and the block, in mosaic pixels
+        top = max(row, tile.row_off)
+        left = max(col, tile.col_off)
+        bottom = min(row + height, tile.row_off + tile.height)
+        right = min(col + width, tile.col_off + tile.width)
+        if top >= bottom or left >= right:
+            continue
+
+        window = Window(
+            left - tile.col_off, top - tile.row_off, right - left, bottom - top
+        )
+        data = _read_tile(src, window)
+        region = block[top - row : bottom - row, left - col : right - col]
+        if overlap == "max":
+            np.maximum(region, data, out=region)
+        else:
+            np.copyto(region, data, where=data != MOSAIC_NODATA)
+    return block
+
+
+def build_mosaic(
+    pred_files: list,
+    save_file: Path | str,
+    overlap: str = "max",
+    blocksize: int = 512,
+    compress: str = "deflate",
+) -> Path:
+    """stitch prediction tiles into one scene-level int8 COG, one output
+    block at a time, so memory depends on the block size and not on the
+    size of the mosaic.
+
+    Args:
+        pred_files (list): prediction tiles of one scene on a shared pixel grid
+        save_file (Path | str): output COG location
+        overlap (str): value of pixels covered by several tiles, "max" (water
+            if any tile saw water) or "last" (the last tile with data, as in
+            the VRT). Defaults to "max".
+        blocksize (int): output block size. Defaults to 512.
+        compress (str): "deflate" or "zstd". Defaults to "deflate".
+
+    Returns:
+        Path: the written COG
+    """
+    if overlap not in ("max", "last"):
+        raise ValueError(
+            f"Unknown overlap rule {overlap}, expected max or last"
+        )
+
+    tiles = [Tile.open(pred_file) for pred_file in pred_files]
+    transform, width, height = mosaic_grid(tiles)
+    save_file = Path(save_file)
+    # the COG driver can only copy, so blocks go to a tiled GTiff first
+    staging_file = save_file.with_name(f".{save_file.name}.staging.tif")
+
+    profile = {
+        "driver": "GTiff",
+        "width": width,
+        "height": height,
+        "count": 1,
+        "dtype": "int8",
+        "nodata": MOSAIC_NODATA,
+        "crs": tiles[0].crs,
+        "transform": transform,
+        "tiled": True,
+        "blockxsize": blocksize,
+        "blockysize": blocksize,
+        "compress": compress,
+        "BIGTIFF": "IF_SAFER",
+    }
+    try:
+        with rasterio.Env(), rasterio.open(
+            staging_file, "w", **profile
+        ) as dst:
+            for row in range(0, height, blocksize):
+                block_height = min(blocksize, height - row)
+                # only the tiles of this row of blocks are open at once
+                row_tiles = [
+                    tile
+                    for tile in tiles
+                    if tile.row_off < row + block_height
+                    and row < tile.row_off + tile.height
+                ]
+                with ExitStack() as stack:
+                    sources = [
+                        (tile, stack.enter_context(rasterio.open(tile.path)))
+                        for tile in row_tiles
+                    ]
+                    for col in range(0, width, blocksize):
+                        block_width = min(blocksize, width - col)
+                        block = _mosaic_block(
+                            sources,
+                            row,
+                            col,
+                            block_height,
+                            block_width,
+                            overlap,
+                        )
+                        dst.write(
+                            block,
+                            1,
+                            window=Window(col, row, block_width, block_height),
+                        )
+
+        with rasterio.open(staging_file) as src:
+            copy_dataset(
+                src,
+                str(save_file),
+                driver="COG",
+                COMPRESS=compress.upper(),
+                BLOCKSIZE=blocksize,
+                OVERVIEW_RESAMPLING="NEAREST",
+                BIGTIFF="IF_SAFER",
+            )
+    finally:
+        staging_file.unlink(missing_ok=True)
+
+    return save_file
+
+
+def build_mosaics(
+    pred_files: list,
+    output_dir: Path | str,
+    overlap: str = "max",
+    blocksize: int = 512,
+) -> dict:
+    """group tiles into scenes and write a VRT index and COG mosaic of each
+
+    Returns:
+        dict: (VRT, COG) of each scene, keyed by scene name
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    mosaics = {}
+    for scene, files in group_tiles(pred_files).items():
+        vrt_file = write_vrt(
+            [Tile.open(f) for f in files], output_dir / f"{scene}_mosaic.vrt"
+        )
+        cog_file = build_mosaic(
+            files,
+            output_dir / f"{scene}_mosaic.tif",
+            overlap=overlap,
+            blocksize=blocksize,
+        )
+        mosaics[scene] = (vrt_file, cog_file)
+    return mosaics
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Stitch tile predictions into scene-level flood maps."
+    )
+    parser.add_argument(
+        "--pred_dir", required=True, help="Directory of *_pred.tif tiles"
+    )
+    parser.add_argument(
+        "--output_dir", required=True, help="Directory for the mosaics"
+    )
+    parser.add_argument(
+        "--overlap",
+        default="max",
+        choices=["max", "last"],
+        help="Value of pixels covered by several tiles",
+    )
+    parser.add_argument("--blocksize", type=int, default=512)
+    args = parser.parse_args()
+
+    pred_files = sorted(Path(args.pred_dir).glob("*_pred.tif"))
+    mosaics = build_mosaics(
+        pred_files, args.output_dir, args.overlap, args.blocksize
+    )
+    for scene, (vrt_file, cog_file) in mosaics.items():
+        print(f"{scene}: {vrt_file}, {cog_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""bounded producer/consumer pipeline overlapping GeoTIFF I/O with inference"""
+
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from granite_geo_flood.batching import group_batches
+from granite_geo_flood.predictor import (
+    WATER,
+    read_image,
+    read_shape,
+    write_prediction,
+)
+from granite_geo_flood.preprocess import Preprocessor
+from granite_geo_flood.skip import skipped_probability
+from granite_geo_flood.tiling import softmax
+
+_DONE = object()
+
+
+@dataclass
+class PipelineStats:
+    """where the time of a pipeline run went. A model waiting on input
+    means the run is I/O bound; readers waiting on a full queue means it is
+    compute bound."""
+
+    tiles: int = 0
+    batches: int = 0
+    skipped: int = (
+        0  # tiles written without a forward pass, see `skip.TileFilter`
+    )
+    seconds: float = 0.0
+    compute_seconds: float = 0.0
+    model_input_wait: float = 0.0  # model idle, waiting for a decoded batch
+    model_output_wait: float = 0.0  # model blocked on a full writer queue
+    reader_stall: float = 0.0  # readers blocked on a full input queue, summed
+    max_input_queue: int = 0
+
+    @property
+    def bound(self) -> str:
+        if self.model_input_wait > self.reader_stall:
+            return "io"
+        return "compute"
+
+    def summary(self) -> str:
+        rate = self.tiles / self.seconds if self.seconds else 0.0
+        skipped = f" ({self.skipped} skipped)" if self.skipped else ""
+        return (
+            f"{self.tiles} tiles{skipped} in {self.seconds:.1f} s "
+            f"({rate:.2f} tiles/s), "
+            f"compute {self.compute_seconds:.1f} s, "
+            f"model waited {self.model_input_wait:.1f} s for input and "
+            f"{self.model_output_wait:.1f} s for the writer, "
+            f"readers stalled {self.reader_stall:.1f} s: {self.bound} bound"
+        )
+
+
+def run_pipeline(
+    predictor,
+    image_files: list,
+    output_dir: Path | str,
+    batch_size: int = 1,
+    num_readers: int = 2,
+    queue_depth: int = 4,
+    shapes: list | None = None,
+    writer=None,
+    recorder=None,
+    tile_filter=None,
+) -> tuple[list, PipelineStats]:
+    """predict flood maps for GeoTIFF files, decoding and preprocessing
+    ahead of the model on reader threads and writing on a writer thread.
+
+    Both queues hold at most `queue_depth` batches, so readers block when
+    the model falls behind and the model blocks when the writer does, which
+    bounds memory to roughly `queue_depth * 2 + num_readers` batches.
+    rasterio and NumPy release the GIL while decoding and preprocessing, so
+    threads overlap with the forward pass.
+
+    Args:
+        predictor (FloodPredictor): loaded model
+        image_files (list): input GeoTIFFs
+        output_dir (Path | str): directory in which to write
+            `<image name>_pred.tif`
+        batch_size (int): tiles per forward pass. Defaults to 1.
+        num_readers (int): reader threads. Defaults to 2.
+        queue_depth (int): batches buffered between stages. Defaults to 4.
+        shapes (list | None): shape of each file if already known. Defaults
+            to None.
+        writer (AsyncWriter | None): writes the flood maps (and water
+            probabilities if it is set to) on its own threads. Defaults to
+            None (int16 GeoTIFFs written by the writer thread).
+        recorder (RunRecorder | None): records an event per written tile
+            and profiles sampled batches (see `granite_geo_flood.instrument`).
+            Read and preprocess times are averaged over the batch; with a
+            `writer`, write is the time to queue the write. Defaults to None.
+        tile_filter (TileFilter | None): writes the flood maps of tiles that
+            are all nodata, ocean or cloud (see `granite_geo_flood.skip`)
+            from the readers, without running the model. Defaults to None.
+
+    Returns:
+        tuple[list, PipelineStats]: written files in input order, timings
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if shapes is None:
+        shapes = [read_shape(image_file) for image_file in image_files]
+
+    jobs = queue.SimpleQueue()
+    for batch_ids in group_batches(shapes, batch_size):
+        jobs.put(batch_ids)
+    inputs = queue.Queue(maxsize=queue_depth)
+    outputs = queue.Queue(maxsize=queue_depth)
+    stats = PipelineStats()
+    stats_lock = threading.Lock()
+    saved = [None] * len(image_files)
+    errors = []
+    writes = []
+
+    def read() -> None:
+        # scratch buffers are per Preprocessor, so one per thread
+        preprocessor = Preprocessor.from_config(predictor.config)
+        try:
+            while True:
+                try:
+                    batch_ids = jobs.get_nowait()
+                except queue.Empty:
+                    break
+                start = time.perf_counter()
+                images, profiles = zip(
+                    *(read_image(image_files[i]) for i in batch_ids)
+                )
+                read_done = time.perf_counter()
+                seconds = {
+                    "read_seconds": (read_done - start) / len(batch_ids)
+                }
+
+                if tile_filter is not None:
+                    kept, skipped = [], []
+                    for i, image, profile in zip(batch_ids, images, profiles):
+                        reason, pred = tile_filter(
+                            image, profile, image_files[i]
+                        )
+                        if reason is None:
+                            kept.append((i, image, profile))
+                            continue
+                        skipped.append((i, pred, profile))
+                        if recorder is not None:
+                            recorder.skip(image_files[i], reason)
+                    if skipped:
+                        ids, preds, skipped_profiles = zip(*skipped)
+                        probabilities = [None] * len(ids)
+                        if writer is not None and writer.probability:
+                            probabilities = [
+                                skipped_probability(p) for p in preds
+                            ]
+                        outputs.put(
+                            (
+                                ids,
+                                preds,
+                                probabilities,
+                                skipped_profiles,
+                                seconds,
+                            )
+                        )
+                        with stats_lock:
+                            stats.skipped += len(skipped)
+                    if not kept:
+                        continue
+                    batch_ids, images, profiles = zip(*kept)
+                    read_done = time.perf_counter()
+
+                batch = preprocessor(np.stack(images))
+                seconds["preprocess_seconds"] = (
+                    time.perf_counter() - read_done
+                ) / len(batch_ids)
+
+                start = time.perf_counter()
+                inputs.put((batch_ids, batch, profiles, seconds, start))
+                with stats_lock:
+                    stats.reader_stall += time.perf_counter() - start
+                    stats.max_input_queue = max(
+                        stats.max_input_queue, inputs.qsize()
+                    )
+        except Exception as e:
+            errors.append(e)
+        finally:
+            inputs.put(_DONE)
+
+    def write() -> None:
+        while (item := outputs.get()) is not _DONE:
+            batch_ids, preds, probabilities, profiles, seconds = item
+            try:
+                for i, pred, probability, profile in zip(
+                    batch_ids, preds, probabilities, profiles
+                ):
+                    save_file = (
+                        output_dir / f"{Path(image_files[i]).stem}_pred.tif"
+                    )
+                    start = time.perf_counter()
+                    if writer is not None:
+                        writes.append(
+                            writer.submit(
+                                pred, profile, save_file, probability
+                            )
+                        )
+                    else:
+                        write_prediction(pred, profile, save_file)
+                    saved[i] = save_file
+                    if recorder is not None:
+                        recorder.tile(
+                            image_files[i],
+                            shapes[i],
+                            len(batch_ids),
+                            write_seconds=time.perf_counter() - start,
+                            **seconds,
+                        )
+            except Exception as e:
+                if recorder is not None:
+                    recorder.error(image_files[i], e)
+                errors.append(e)
+
+    start_run = time.perf_counter()
+    readers = [
+        threading.Thread(target=read, daemon=True) for _ in range(num_readers)
+    ]
+    write_thread = threading.Thread(target=write, daemon=True)
+    for thread in [*readers, write_thread]:
+        thread.start()
+
+    finished = 0
+    try:
+        while finished < num_readers:
+            start = time.perf_counter()
+            item = inputs.get()
+            stats.model_input_wait += time.perf_counter() - start
+            if item is _DONE:
+                finished += 1
+                continue
+
+            batch_ids, batch, profiles, seconds, queued = item
+            start = time.perf_counter()
+            with recorder.profile(
+                batch_ids
+            ) if recorder is not None else nullcontext():
+                logits = predictor.forward(batch)
+            seconds = dict(
+                seconds,
+                queue_wait_seconds=start - queued,
+                forward_seconds=(time.perf_counter() - start) / len(batch_ids),
+            )
+            preds = logits.argmax(axis=1).astype(np.int16)
+            probabilities = [None] * len(batch_ids)
+            if writer is not None and writer.probability:
+                probabilities = softmax(logits, axis=1)[:, WATER]
+            stats.compute_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            outputs.put((batch_ids, preds, probabilities, profiles, seconds))
+            stats.model_output_wait += time.perf_counter() - start
+            stats.tiles += len(batch_ids)
+            stats.batches += 1
+            if recorder is not None:
+                recorder.batch()
+    finally:
+        # after a model error, drop the remaining jobs and let the readers
+        # and writer finish what they hold, so no thread is left blocked
+        while True:
+            try:
+                jobs.get_nowait()
+            except queue.Empty:
+                break
+        while finished < num_readers:
+            if inputs.get() is _DONE:
+                finished += 1
+        outputs.put(_DONE)
+        write_thread.join()
+        for write in writes:
+            try:
+                write.result()
+            except Exception as e:
+                errors.append(e)
+    stats.seconds = time.perf_counter() - start_run
+    stats.tiles += stats.skipped
+
+    if errors:
+        raise errors[0]
+
+    return saved, stats
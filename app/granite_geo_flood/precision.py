@@ -0,0 +1,204 @@
+"""reduced precision CPU inference modes with an accuracy guard"""
+
+import argparse
+import io
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch import nn
+
+from granite_geo_flood.utils.helper import calc_metrics
+
+PRECISIONS = ("fp32", "bf16", "int8-dynamic")
+
+
+def apply_precision(model: nn.Module, precision: str) -> nn.Module:
+    """model to run in a precision mode.
+
+    "bf16" runs the unchanged model under bfloat16 autocast (see
+    `FloodPredictor.forward`), so the model itself is returned. "int8-dynamic"
+    returns a copy with every Linear layer, where the ViT backbone spends
+    nearly all its time, dynamically quantized to int8.
+
+    Args:
+        model (nn.Module): float32 model
+        precision (str): one of PRECISIONS
+
+    Returns:
+        nn.Module: model for the precision mode
+    """
+    match precision:
+        case "fp32" | "bf16":
+            return model
+        case "int8-dynamic":
+            return torch.ao.quantization.quantize_dynamic(
+                model, {nn.Linear}, dtype=torch.qint8
+            )
+        case _:
+            raise ValueError(
+                f"Unknown precision {precision}, expected one of {PRECISIONS}"
+            )
+
+
+def reference_labels(image_files: list) -> list:
+    """label file of each `*_image.tif` reference tile, named `*_label.tif`"""
+    return [
+        Path(image_file).with_name(
+            Path(image_file).name.replace("_image.tif", "_label.tif")
+        )
+        for image_file in image_files
+    ]
+
+
+def guard_precision(
+    predictor,
+    precision: str,
+    image_files: list,
+    label_files: list | None = None,
+    tolerance: float = 0.01,
+):
+    """switch a float32 predictor to a precision mode only if it keeps its
+    accuracy on a reference tile set.
+
+    Both modes predict the reference tiles and are scored with
+    `calc_metrics` against the labels, or against the float32 predictions
+    if there are no labels.
+
+    Args:
+        predictor (FloodPredictor): float32 predictor
+        precision (str): one of PRECISIONS
+        image_files (list): reference tiles
+        label_files (list | None): truth labels of the reference tiles.
+            Defaults to None.
+        tolerance (float): largest allowed drop in mIoU or F1. Defaults to
+            0.01.
+
+    Returns:
+        tuple[FloodPredictor, dict]: predictor in the precision mode, and the
+            metrics of both modes
+
+    Raises:
+        ValueError: if mIoU or F1 drop by more than `tolerance`
+    """
+    candidate = predictor.with_precision(precision)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reference = predictor.predict_files(
+            image_files, Path(tmp_dir) / "fp32"
+        )
+        predicted = candidate.predict_files(
+            image_files, Path(tmp_dir) / precision
+        )
+        truth = label_files if label_files is not None else reference
+        metrics = {
+            "fp32": calc_metrics(truth, reference),
+            precision: calc_metrics(truth, predicted),
+        }
+
+    for name in ("mIoU", "F1"):
+        drop = metrics["fp32"][name] - metrics[precision][name]
+        if drop > tolerance:
+            raise ValueError(
+                f"{precision} inference refused: {name} drops by {drop:.4f} "
+                f"({metrics['fp32'][name]:.4f} -> "
+                f"{metrics[precision][name]:.4f}), "
+                f"more than the tolerance of {tolerance}"
+            )
+
+    return candidate, metrics
+
+
+def model_size(model: nn.Module) -> int:
+    """bytes of the serialized weights, which includes packed int8 weights"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def resident_memory() -> int:
+    """bytes of resident memory of this process"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def benchmark_precisions(
+    predictor,
+    precisions: list = PRECISIONS,
+    batch_size: int = 1,
+    num_batches: int = 4,
+    tile_size: int = 512,
+) -> dict:
+    """throughput and memory of a float32 predictor in each precision mode
+
+    Returns:
+        dict: tiles_per_second, model_mb and rss_mb for each mode
+    """
+    rng = np.random.default_rng(0)
+    batch = rng.standard_normal(
+        (batch_size, predictor.preprocessor.num_bands, tile_size, tile_size),
+        dtype=np.float32,
+    )
+
+    results = {}
+    for precision in precisions:
+        candidate = predictor.with_precision(precision)
+        candidate.forward(batch)  # warm up
+
+        start = time.perf_counter()
+        for _ in range(num_batches):
+            candidate.forward(batch)
+        elapsed = time.perf_counter() - start
+
+        results[precision] = {
+            "tiles_per_second": num_batches * batch_size / elapsed,
+            "model_mb": model_size(candidate.model) / 2**20,
+            "rss_mb": resident_memory() / 2**20,
+        }
+        del candidate
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare flood model throughput and memory across precisions."
+        )
+    )
+    parser.add_argument("--config", default=None, help="Path to config.yaml")
+    parser.add_argument(
+        "--checkpoint", default=None, help="Path to model.ckpt"
+    )
+    parser.add_argument(
+        "--artifact", default=None, help="Inference-only artifact"
+    )
+    parser.add_argument("--precisions", nargs="+", default=list(PRECISIONS))
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--tile_size", type=int, default=512)
+    args = parser.parse_args()
+
+    from granite_geo_flood.predictor import FloodPredictor
+
+    if args.artifact:
+        predictor = FloodPredictor.from_artifact(args.artifact)
+    else:
+        predictor = FloodPredictor(args.config, args.checkpoint)
+
+    results = benchmark_precisions(
+        predictor, args.precisions, args.batch_size, tile_size=args.tile_size
+    )
+    for precision, stats in results.items():
+        print(
+            f"{precision:>12}: {stats['tiles_per_second']:6.2f} tiles/s, "
+            f"model {stats['model_mb']:.0f} MB, RSS {stats['rss_mb']:.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""in-process inference for the granite geospatial UKI flood detection model"""
+
+import copy
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import torch
+import yaml
+
+from granite_geo_flood.batching import auto_batch_size, group_batches
+from granite_geo_flood.preprocess import Preprocessor
+from granite_geo_flood.tiling import softmax
+
+# index of the water class in the model output
+WATER = 1
+
+
+def load_config(config_file: Path | str) -> dict:
+    """read a terratorch/lightning YAML config into a dictionary
+
+    Args:
+        config_file (Path | str): location of the YAML config
+
+    Returns:
+        dict: parsed config
+    """
+    with open(config_file) as f:
+        return yaml.safe_load(f)
+
+
+def build_model(
+    config: dict, checkpoint: Path | str | None = None
+) -> torch.nn.Module:
+    """build the segmentation model described by the config and load its
+    weights
+
+    Args:
+        config (dict): parsed config (see `load_config`)
+        checkpoint (Path | str | None): lightning checkpoint to load weights
+            from.
+            Defaults to None (randomly initialised weights).
+
+    Returns:
+        torch.nn.Module: the encoder-decoder model in eval mode
+    """
+    # registers the granite_geospatial_uki backbone with timm
+    from terratorch.tasks import SemanticSegmentationTask
+
+    import custom_modules  # noqa: F401
+
+    init_args = dict(config["model"]["init_args"])
+    task = SemanticSegmentationTask(**init_args)
+
+    if checkpoint is not None:
+        ckpt = torch.load(checkpoint, map_location="cpu", weights_only=False)
+        task.load_state_dict(ckpt["state_dict"])
+
+    model = task.model
+    model.eval()
+    model.requires_grad_(False)
+
+    return model
+
+
+def read_image(image_file: Path | str) -> tuple[np.ndarray, dict]:
+    """read a multi-band GeoTIFF, with nodata pixels set to NaN
+
+    Args:
+        image_file (Path | str): GeoTIFF file [bands x h x w]
+
+    Returns:
+        tuple[np.ndarray, dict]: float32 image, rasterio profile of the file
+    """
+    with rasterio.open(image_file) as src:
+        image = src.read(out_dtype="float32", masked=True).filled(np.nan)
+        profile = src.profile
+
+    return image, profile
+
+
+def read_shape(image_file: Path | str) -> tuple[int, int, int]:
+    """shape [bands x h x w] of a GeoTIFF, read from its header only"""
+    with rasterio.open(image_file) as src:
+        return src.count, src.height, src.width
+
+
+def write_prediction(
+    pred: np.ndarray, profile: dict, save_file: Path | str
+) -> None:
+    """write a flood map with the georeferencing of its input image
+
+    Args:
+        pred (np.ndarray): predicted classes [h x w]
+        profile (dict): rasterio profile of the input image
+        save_file (Path | str): output GeoTIFF location
+    """
+    profile = dict(
+        profile,
+        count=1,
+        dtype="int16",
+        nodata=-1,
+        compress="lzw",
+    )
+    with rasterio.open(save_file, "w", **profile) as dst:
+        dst.write(pred.astype(np.int16), 1)
+
+
+class FloodPredictor:
+    """keeps the flood model loaded and warm so that many tiles can be
+    predicted without paying for interpreter start, config parsing and
+    checkpoint loading each time.
+
+    Args:
+        config_file (Path | str): YAML config used to train the model
+        checkpoint (Path | str | None): lightning checkpoint with the trained
+            weights
+        device (str): torch device to run on. Defaults to "cpu".
+    """
+
+    def __init__(
+        self,
+        config_file: Path | str,
+        checkpoint: Path | str | None = None,
+        device: str = "cpu",
+    ) -> None:
+        config = load_config(config_file)
+        self._setup(config, build_model(config, checkpoint), device)
+
+    @classmethod
+    def from_model(
+        cls,
+        config: dict,
+        model: torch.nn.Module | None,
+        device: str = "cpu",
+        runtime=None,
+    ) -> "FloodPredictor":
+        """predictor around an already built model, e.g. one loaded elsewhere
+        or a small stand-in
+
+        Args:
+            config (dict): parsed config of the model (see `load_config`)
+            model (torch.nn.Module | None): model returning an output with
+                class logits, or None when running through `runtime`
+            device (str): torch device to run on. Defaults to "cpu".
+            runtime: compiled model to run instead (see `from_runtime`).
+                Defaults to None.
+        """
+        predictor = cls.__new__(cls)
+        predictor._setup(config, model, device, runtime)
+        return predictor
+
+    @classmethod
+    def from_artifact(
+        cls, artifact_file: Path | str, device: str = "cpu"
+    ) -> "FloodPredictor":
+        """load the model from an inference-only artifact written by
+        `granite_geo_flood.export`, which is memory mapped rather than read
+
+        Args:
+            artifact_file (Path | str): artifact location
+            device (str): torch device to run on. Defaults to "cpu".
+        """
+        from granite_geo_flood.export import load_artifact
+
+        config, model = load_artifact(artifact_file)
+        return cls.from_model(config, model, device)
+
+    @classmethod
+    def from_runtime(cls, runtime, device: str = "cpu") -> "FloodPredictor":
+        """predictor running a compiled model through a runtime backend from
+        `granite_geo_flood.runtime`, e.g. TorchScript or ONNX Runtime
+
+        Args:
+            runtime: loaded runtime, holding the `config` of its model
+            device (str): torch device to run on. Defaults to "cpu".
+        """
+        return cls.from_model(runtime.config, None, device, runtime)
+
+    def _setup(
+        self,
+        config: dict,
+        model: torch.nn.Module | None,
+        device: str,
+        runtime=None,
+    ) -> None:
+        self.config = config
+        self.device = torch.device(device)
+        self.model = model.to(self.device) if model is not None else None
+        self.runtime = runtime
+        self.precision = "fp32"
+
+        self.preprocessor = Preprocessor.from_config(config)
+        self._batch_buffer = None
+
+    def with_precision(self, precision: str) -> "FloodPredictor":
+        """predictor sharing this one's config, running the model in a
+        precision mode (see `granite_geo_flood.precision`). Only "fp32" and
+        "bf16" share the model weights; "int8-dynamic" makes a quantized copy.
+
+        Args:
+            precision (str): "fp32", "bf16" or "int8-dynamic"
+        """
+        from granite_geo_flood.precision import apply_precision
+
+        if self.precision != "fp32":
+            raise ValueError(
+                f"Can only change precision from fp32, not {self.precision}"
+            )
+        if self.runtime is not None:
+            raise ValueError(
+                "Precision modes need the eager model, not a compiled runtime"
+            )
+
+        predictor = copy.copy(self)
+        predictor.model = apply_precision(self.model, precision)
+        predictor.precision = precision
+        predictor.preprocessor = Preprocessor.from_config(self.config)
+        predictor._batch_buffer = None
+        return predictor
+
+    def preprocess(self, image: np.ndarray) -> np.ndarray:
+        """select, scale and normalise the bands of a raw image
+        [bands x h x w]"""
+        return self.preprocessor(image)
+
+    @torch.inference_mode()
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        """run the model on a preprocessed batch [n x bands x h x w]
+
+        Returns:
+            np.ndarray: class logits [n x classes x h x w]
+        """
+        if self.runtime is not None:
+            return self.runtime(batch)
+
+        x = torch.from_numpy(np.ascontiguousarray(batch)).to(self.device)
+        weight = next(self.model.parameters(), None)
+        x = x.to(weight.dtype if weight is not None else torch.float32)
+        with torch.autocast(
+            self.device.type,
+            dtype=torch.bfloat16,
+            enabled=self.precision == "bf16",
+        ):
+            return self.model(x).output.float().cpu().numpy()
+
+    def predict(self, array: np.ndarray) -> np.ndarray:
+        """predict flood maps for raw images with all the dataset bands
+
+        Args:
+            array (np.ndarray): image [bands x h x w] or batch
+                [n x bands x h x w]
+
+        Returns:
+            np.ndarray: predicted classes [h x w] or [n x h x w]
+        """
+        single = array.ndim == 3
+        if single:
+            array = array[None]
+
+        pred = (
+            self.forward(self.preprocess_batch(array))
+            .argmax(axis=1)
+            .astype(np.int16)
+        )
+
+        return pred[0] if single else pred
+
+    def predict_proba(self, array: np.ndarray) -> np.ndarray:
+        """class probabilities for raw images with all the dataset bands
+
+        Args:
+            array (np.ndarray): image [bands x h x w] or batch
+                [n x bands x h x w]
+
+        Returns:
+            np.ndarray: probabilities [classes x h x w] or
+                [n x classes x h x w]
+        """
+        single = array.ndim == 3
+        if single:
+            array = array[None]
+
+        probs = softmax(self.forward(self.preprocess_batch(array)), axis=1)
+
+        return probs[0] if single else probs
+
+    def preprocess_batch(self, array: np.ndarray) -> np.ndarray:
+        """preprocess a raw batch [n x bands x h x w] into a buffer that is
+        reused between batches of the same shape, so the result is only
+        valid until the next call"""
+        shape = self.preprocessor.output_shape(array.shape)
+        if self._batch_buffer is None or self._batch_buffer.shape != shape:
+            self._batch_buffer = self.preprocessor.allocate(array.shape)
+        return self.preprocessor(array, out=self._batch_buffer)
+
+    @staticmethod
+    def auto_batch_size(shapes: list) -> int:
+        """batch size that fits the largest of the tile shapes in memory"""
+        height = max((shape[1] for shape in shapes), default=1)
+        width = max((shape[2] for shape in shapes), default=1)
+        return auto_batch_size(height, width)
+
+    def predict_files(
+        self,
+        image_files: list,
+        output_dir: Path | str | None = None,
+        batch_size: int | str = 1,
+        shapes: list | None = None,
+        writer=None,
+        tile_filter=None,
+    ) -> list:
+        """predict flood maps for GeoTIFF files, batching tiles of the same
+        shape
+
+        Args:
+            image_files (list): input GeoTIFFs
+            output_dir (Path | str | None): directory in which to write a
+                `<image name>_pred.tif` per input. Defaults to None, in which
+                case the predictions are returned instead of written.
+            batch_size (int | str): tiles per forward pass, or "auto" to choose
+                it from the available memory. Defaults to 1.
+            shapes (list | None): shape [bands x h x w] of each file if already
+                known, e.g. from a scan manifest. Defaults to None (read from
+                the file headers).
+            writer (AsyncWriter | None): writes the flood maps (and water
+                probabilities if it is set to) on its threads while the next
+                batch is predicted. Defaults to None (int16 GeoTIFFs written
+                in turn, see `write_prediction`).
+            tile_filter (TileFilter | None): gives the flood maps of tiles
+                that are all nodata, ocean or cloud without running the model
+                (see `granite_geo_flood.skip`). Defaults to None.
+
+        Returns:
+            list: written prediction files, or predicted arrays if no
+                output_dir, in the same order as image_files
+        """
+        if output_dir is not None:
+            output_dir = Path(output_dir)
+            output_dir.mkdir(parents=True, exist_ok=True)
+
+        if shapes is None:
+            shapes = [read_shape(image_file) for image_file in image_files]
+        if batch_size == "auto":
+            batch_size = self.auto_batch_size(shapes)
+
+        if tile_filter is not None:
+            from granite_geo_flood.skip import skipped_probability
+
+        results = [None] * len(image_files)
+        writes = []
+        for batch_ids in group_batches(shapes, int(batch_size)):
+            images, profiles = zip(
+                *(read_image(image_files[i]) for i in batch_ids)
+            )
+            done = []
+            if tile_filter is not None:
+                kept = []
+                for i, image, profile in zip(batch_ids, images, profiles):
+                    reason, pred = tile_filter(image, profile, image_files[i])
+                    if reason is None:
+                        kept.append((i, image, profile))
+                        continue
+                    probability = None
+                    if writer is not None and writer.probability:
+                        probability = skipped_probability(pred)
+                    done.append((i, pred, profile, probability))
+                batch_ids, images, profiles = (
+                    zip(*kept) if kept else ((), (), ())
+                )
+
+            if batch_ids:
+                probabilities = [None] * len(batch_ids)
+                if writer is not None and writer.probability:
+                    probs = self.predict_proba(np.stack(images))
+                    preds = probs.argmax(axis=1).astype(np.int16)
+                    probabilities = probs[:, WATER]
+                else:
+                    preds = self.predict(np.stack(images))
+                done.extend(zip(batch_ids, preds, profiles, probabilities))
+
+            for i, pred, profile, probability in done:
+                if output_dir is None:
+                    results[i] = pred
+                    continue
+                save_file = (
+                    output_dir / f"{Path(image_files[i]).stem}_pred.tif"
+                )
+                if writer is not None:
+                    writes.append(
+                        writer.submit(pred, profile, save_file, probability)
+                    )
+                else:
+                    write_prediction(pred, profile, save_file)
+                results[i] = save_file
+
+        # the files are complete once this returns
+        for write in writes:
+            write.result()
+
+        return results
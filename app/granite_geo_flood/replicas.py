@@ -0,0 +1,265 @@
+"""multi-process CPU inference with one model replica per slice of cores"""
+
+import argparse
+import multiprocessing as mp
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from pathlib import Path
+
+from granite_geo_flood.batching import group_batches
+
+# set in each worker process by _init_replica
+_predictor = None
+
+
+def core_slices(num_replicas: int, threads_per_replica: int) -> list:
+    """split the cores this process may run on into one slice per replica
+
+    Args:
+        num_replicas (int): number of replicas
+        threads_per_replica (int): cores per replica
+
+    Returns:
+        list: cores of each replica
+    """
+    if num_replicas < 1 or threads_per_replica < 1:
+        raise ValueError(
+            "Need at least one replica and thread, not "
+            f"{num_replicas} x {threads_per_replica}"
+        )
+    cores = sorted(os.sched_getaffinity(0))
+    needed = num_replicas * threads_per_replica
+    if needed > len(cores):
+        raise ValueError(
+            f"{num_replicas} replicas x {threads_per_replica} threads needs "
+            f"{needed} cores, only {len(cores)} available"
+        )
+    return [
+        cores[i * threads_per_replica : (i + 1) * threads_per_replica]
+        for i in range(num_replicas)
+    ]
+
+
+def _load_predictor(
+    config_file: str | None, checkpoint: str | None, artifact: str | None
+):
+    """the default loader of `run_replicas`"""
+    from granite_geo_flood.predictor import FloodPredictor
+
+    if artifact is not None:
+        return FloodPredictor.from_artifact(artifact)
+    return FloodPredictor(config_file, checkpoint)
+
+
+def _init_replica(slices, loader: Callable, precision: str) -> None:
+    """pin the worker to a free slice of cores and load its model replica"""
+    global _predictor
+
+    # one slice per replica, and the executor never starts more replicas
+    cores = slices.get()
+    os.sched_setaffinity(0, cores)
+
+    import torch
+
+    torch.set_num_threads(len(cores))
+    torch.set_num_interop_threads(1)
+
+    _predictor = loader()
+    if precision != "fp32":
+        _predictor = _predictor.with_precision(precision)
+
+
+def _predict_batch(job: tuple) -> tuple[list, list]:
+    batch_ids, image_files, shapes, output_dir = job
+    saved = _predictor.predict_files(
+        image_files, output_dir, batch_size=len(image_files), shapes=shapes
+    )
+    return batch_ids, saved
+
+
+def run_replicas(
+    image_files: list,
+    output_dir: Path | str,
+    num_replicas: int,
+    threads_per_replica: int,
+    config_file: Path | str | None = None,
+    checkpoint: Path | str | None = None,
+    artifact: Path | str | None = None,
+    batch_size: int = 1,
+    shapes: list | None = None,
+    precision: str = "fp32",
+    loader: Callable | None = None,
+) -> list:
+    """predict flood maps with several model replicas, each a process pinned
+    to its own cores with its own intra-op thread pool, pulling batches of
+    files from a shared work queue.
+
+    Replicas loading the same `artifact` memory map it, so its weights are
+    held once in the page cache however many replicas there are. Replicas
+    loading a checkpoint each keep their own copy.
+
+    Args:
+        image_files (list): input GeoTIFFs
+        output_dir (Path | str): directory in which to write
+            `<image name>_pred.tif`
+        num_replicas (int): model replicas (processes)
+        threads_per_replica (int): cores and torch threads per replica
+        config_file (Path | str | None): YAML config, if not loading an
+            artifact
+        checkpoint (Path | str | None): lightning checkpoint, if not loading
+            an artifact
+        artifact (Path | str | None): inference-only artifact from
+            `granite_geo_flood.export`
+        batch_size (int): tiles per forward pass. Defaults to 1.
+        shapes (list | None): shape of each file if already known. Defaults
+            to None.
+        precision (str): precision mode of the replicas (see
+            `granite_geo_flood.precision`). Defaults to "fp32".
+        loader (Callable | None): picklable function returning the model of
+            a replica, in place of the config, checkpoint or artifact.
+            Defaults to None.
+
+    Returns:
+        list: written files in input order
+    """
+    from granite_geo_flood.predictor import read_shape
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    if shapes is None:
+        shapes = [read_shape(image_file) for image_file in image_files]
+
+    jobs = [
+        (
+            batch_ids,
+            [str(image_files[i]) for i in batch_ids],
+            [shapes[i] for i in batch_ids],
+            str(output_dir),
+        )
+        for batch_ids in group_batches(shapes, batch_size)
+    ]
+
+    # spawn, so that no torch thread pools are inherited from this process
+    ctx = mp.get_context("spawn")
+    slices = ctx.Queue()
+    for cores in core_slices(num_replicas, threads_per_replica):
+        slices.put(cores)
+    if loader is None:
+        loader = partial(
+            _load_predictor,
+            str(config_file) if config_file is not None else None,
+            str(checkpoint) if checkpoint is not None else None,
+            str(artifact) if artifact is not None else None,
+        )
+    initargs = (slices, loader, precision)
+
+    # unlike multiprocessing.Pool, the executor does not replace a replica
+    # that fails to load or dies; the run fails with BrokenProcessPool
+    saved = [None] * len(image_files)
+    with ProcessPoolExecutor(
+        num_replicas,
+        mp_context=ctx,
+        initializer=_init_replica,
+        initargs=initargs,
+    ) as pool:
+        futures = [pool.submit(_predict_batch, job) for job in jobs]
+        try:
+            for future in as_completed(futures):
+                batch_ids, batch_saved = future.result()
+                for i, save_file in zip(batch_ids, batch_saved):
+                    saved[i] = save_file
+        except BaseException:
+            pool.shutdown(cancel_futures=True)
+            raise
+
+    return saved
+
+
+def sweep(
+    image_files: list,
+    output_dir: Path | str,
+    cores: int | None = None,
+    **kwargs,
+) -> list:
+    """time every replicas x threads split that fills the available cores.
+    Timings include starting the replicas, so the sample should be large
+    enough for inference to dominate.
+
+    Args:
+        image_files (list): sample of input GeoTIFFs to predict for each split
+        output_dir (Path | str): scratch directory for the predictions
+        cores (int | None): cores to fill. Defaults to all available cores.
+        **kwargs: model and batching arguments passed to `run_replicas`
+
+    Returns:
+        list: (replicas, threads, tiles per second), fastest first
+    """
+    cores = cores or len(os.sched_getaffinity(0))
+    splits = [(r, cores // r) for r in range(1, cores + 1) if cores % r == 0]
+
+    results = []
+    for num_replicas, threads in splits:
+        # each replica needs at least one batch to be measured fairly
+        if num_replicas > len(image_files):
+            continue
+        start = time.perf_counter()
+        run_replicas(image_files, output_dir, num_replicas, threads, **kwargs)
+        elapsed = time.perf_counter() - start
+        results.append((num_replicas, threads, len(image_files) / elapsed))
+
+    return sorted(results, key=lambda result: result[2], reverse=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Find the fastest replicas x threads split on this machine."
+        )
+    )
+    parser.add_argument(
+        "--input_dir", required=True, help="Directory of sample .tif tiles"
+    )
+    parser.add_argument(
+        "--output_dir", required=True, help="Scratch output directory"
+    )
+    parser.add_argument("--config", default=None, help="Path to config.yaml")
+    parser.add_argument(
+        "--checkpoint", default=None, help="Path to model.ckpt"
+    )
+    parser.add_argument(
+        "--artifact", default=None, help="Inference-only artifact"
+    )
+    parser.add_argument(
+        "--num_tiles",
+        type=int,
+        default=64,
+        help="Sample tiles predicted by each split",
+    )
+    parser.add_argument(
+        "--cores", type=int, default=None, help="Cores to fill"
+    )
+    parser.add_argument("--batch_size", type=int, default=1)
+    args = parser.parse_args()
+
+    image_files = sorted(Path(args.input_dir).glob("*.tif"))[: args.num_tiles]
+
+    results = sweep(
+        image_files,
+        args.output_dir,
+        cores=args.cores,
+        config_file=args.config,
+        checkpoint=args.checkpoint,
+        artifact=args.artifact,
+        batch_size=args.batch_size,
+    )
+    for num_replicas, threads, tiles_per_second in results:
+        print(
+            f"{num_replicas:>3} replicas x {threads:>3} threads: "
+            f"{tiles_per_second:7.2f} tiles/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""quicklook panels and an HTML index of per-tile metrics, rendered in
+parallel"""
+
+import argparse
+import html
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib as mpl
+import numpy as np
+import rasterio
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from granite_geo_flood.precision import reference_labels
+from granite_geo_flood.utils.helper import scale_s2_image
+from granite_geo_flood.utils.metrics import ConfusionMatrix
+
+# dataset band order: VV, VH, BLUE, GREEN, RED, ...
+S1_BAND = 0
+S2_RGB = (4, 3, 2)
+
+FLOOD_CMAP = mpl.colors.ListedColormap(["black", "tan", "paleturquoise"])
+FLOOD_NORM = mpl.colors.BoundaryNorm([-1.5, -0.5, 0.5, 1.5], FLOOD_CMAP.N)
+
+# one figure per worker process, cleared and reused for every tile
+_figure = None
+
+
+def _read_class_map(path: Path | str) -> np.ndarray:
+    with rasterio.open(path) as src:
+        data = src.read(1, masked=True)
+    return np.where(np.ma.getmaskarray(data), -1, data.data).astype(np.int8)
+
+
+def _read_quicklook(
+    image_file: Path | str, bands: list, max_size: int
+) -> np.ndarray:
+    """only the plotted bands of an image, decimated by GDAL while reading
+    to at most `max_size` pixels a side [bands x h x w]"""
+    with rasterio.open(image_file) as src:
+        step = max(1, -(-max(src.height, src.width) // max_size))
+        out_shape = (len(bands), -(-src.height // step), -(-src.width // step))
+        data = src.read(
+            [b + 1 for b in bands], out_shape=out_shape, masked=True
+        )
+    return data.astype(np.float32).filled(np.nan)
+
+
+def _downsample(array: np.ndarray, max_size: int) -> np.ndarray:
+    """nearest neighbour decimation, which keeps class maps categorical"""
+    step = max(1, -(-max(array.shape) // max_size))
+    return array[::step, ::step]
+
+
+def render_tile(
+    image_file: Path | str,
+    label_file: Path | str,
+    pred_files: dict,
+    save_file: Path | str,
+    s1_band: int = S1_BAND,
+    s2_rgb: tuple = S2_RGB,
+    max_size: int = 256,
+    dpi: int = 100,
+) -> dict:
+    """render the S1 VV and S2 RGB bands of a tile, its truth label and each
+    model's prediction side by side, and score the predictions.
+
+    Every file is read once: the image at reduced resolution and only its
+    plotted bands, the label and predictions in full for the metrics and
+    then decimated for plotting. The figure of the worker is reused.
+
+    Args:
+        image_file (Path | str): input image [bands x h x w]
+        label_file (Path | str): truth label
+        pred_files (dict): predicted flood map of each model, keyed by name
+        save_file (Path | str): PNG to write
+        s1_band (int): index of the VV band. Defaults to S1_BAND.
+        s2_rgb (tuple): indices of the red, green and blue bands. Defaults
+            to S2_RGB.
+        max_size (int): largest side of the plotted arrays. Defaults to 256.
+        dpi (int): PNG resolution. Defaults to 100.
+
+    Returns:
+        dict: tile name, PNG and the confusion matrix of each model
+    """
+    global _figure
+
+    quicklook = _read_quicklook(image_file, [s1_band, *s2_rgb], max_size)
+    truth = _read_class_map(label_file)
+    preds = {
+        name: _read_class_map(pred_file)
+        for name, pred_file in pred_files.items()
+    }
+
+    matrices = {
+        name: ConfusionMatrix(num_classes=3, ignore_index=-1)
+        .update(truth, pred)
+        .matrix
+        for name, pred in preds.items()
+    }
+
+    rgb = scale_s2_image(np.nan_to_num(quicklook[1:].transpose(1, 2, 0)))
+    flood = {"cmap": FLOOD_CMAP, "norm": FLOOD_NORM}
+    panels = [
+        ("S1 - VV", quicklook[0], {"cmap": "afmhot"}),
+        ("S2 - RGB", rgb.clip(0, 1), {}),
+        ("truth map", _downsample(truth, max_size), flood),
+    ]
+    for name, pred in preds.items():
+        panels.append(
+            (f"predicted: {name}", _downsample(pred, max_size), flood)
+        )
+
+    if _figure is None:
+        _figure = Figure(layout="constrained")
+        FigureCanvasAgg(_figure)
+    _figure.clear()
+    _figure.set_size_inches(2.5 * len(panels), 2.8)
+    for ax, (title, array, kwargs) in zip(
+        _figure.subplots(1, len(panels)), panels
+    ):
+        ax.imshow(array, **kwargs)
+        ax.set_title(title, fontsize=9)
+        ax.axis("off")
+    _figure.suptitle(Path(label_file).name, fontsize=9)
+    _figure.savefig(save_file, dpi=dpi)
+
+    return {
+        "tile": Path(image_file).name,
+        "png": str(save_file),
+        "matrices": matrices,
+    }
+
+
+def _render_job(job: tuple) -> dict:
+    return render_tile(*job)
+
+
+def _metrics(matrix: np.ndarray) -> dict:
+    confmat = ConfusionMatrix(num_classes=3, ignore_index=-1)
+    confmat.matrix = matrix
+    return {"mIoU": float(confmat.miou()), "F1": float(confmat.f1())}
+
+
+def write_index(rows: list, models: list, index_file: Path | str) -> Path:
+    """static HTML page with the aggregate metrics of each model and a row
+    per tile with its quicklook and metrics"""
+    index_file = Path(index_file)
+    totals = {
+        name: sum(row["matrices"][name] for row in rows) for name in models
+    }
+
+    def cells(matrices: dict) -> str:
+        return "".join(
+            f"<td>{m['mIoU']:.4f}</td><td>{m['F1']:.4f}</td>"
+            for m in (_metrics(matrices[name]) for name in models)
+        )
+
+    header = "".join(
+        f"<th>{html.escape(name)} mIoU</th><th>{html.escape(name)} F1</th>"
+        for name in models
+    )
+    lines = [
+        "<!DOCTYPE html>",
+        "<html><head><meta charset='utf-8'>"
+        "<title>Flood detection report</title>",
+        "<style>body{font-family:sans-serif}"
+        "td,th{padding:2px 8px;text-align:right}"
+        "img{max-width:100%}</style></head><body>",
+        f"<h1>Flood detection report: {len(rows)} tiles</h1>",
+        f"<table><tr><th>tiles</th>{header}</tr>",
+        f"<tr><td>all</td>{cells(totals)}</tr></table>",
+        f"<table><tr><th>tile</th>{header}<th></th></tr>",
+    ]
+    for row in rows:
+        png = os.path.relpath(row["png"], index_file.parent)
+        lines.append(
+            f"<tr><td>{html.escape(row['tile'])}</td>{cells(row['matrices'])}"
+            f"<td><img loading='lazy' src='{html.escape(png)}'></td></tr>"
+        )
+    lines.append("</table></body></html>")
+    index_file.write_text("\n".join(lines))
+    return index_file
+
+
+def render_report(
+    image_files: list,
+    pred_dirs: dict,
+    output_dir: Path | str,
+    label_files: list | None = None,
+    num_workers: int | None = None,
+    max_size: int = 256,
+) -> Path:
+    """quicklooks of many tiles rendered on a process pool, and an HTML
+    index of them with per-tile and aggregate metrics. Workers return only
+    confusion matrices, so memory stays flat however many tiles there are.
+
+    Args:
+        image_files (list): `*_image.tif` tiles
+        pred_dirs (dict): directory of `<image name>_pred.tif` predictions
+            of each model, keyed by model name
+        output_dir (Path | str): directory for the PNGs and `index.html`
+        label_files (list | None): truth label of each tile. Defaults to
+            None (the `*_label.tif` next to each image).
+        num_workers (int | None): processes. Defaults to None (one per CPU).
+        max_size (int): largest side of the plotted arrays. Defaults to 256.
+
+    Returns:
+        Path: the HTML index
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if label_files is None:
+        label_files = reference_labels(image_files)
+
+    jobs = [
+        (
+            image_file,
+            label_file,
+            {
+                name: Path(pred_dir) / f"{Path(image_file).stem}_pred.tif"
+                for name, pred_dir in pred_dirs.items()
+            },
+            output_dir / f"{Path(image_file).stem}_quicklook.png",
+            S1_BAND,
+            S2_RGB,
+            max_size,
+        )
+        for image_file, label_file in zip(image_files, label_files)
+    ]
+    with ProcessPoolExecutor(num_workers) as executor:
+        chunksize = max(1, len(jobs) // (4 * (num_workers or os.cpu_count())))
+        rows = list(executor.map(_render_job, jobs, chunksize=chunksize))
+
+    return write_index(rows, list(pred_dirs), output_dir / "index.html")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Render quicklooks and an HTML index of flood predictions."
+    )
+    parser.add_argument(
+        "--image_dir", required=True, help="Directory of *_image.tif tiles"
+    )
+    parser.add_argument(
+        "--label_dir", default=None, help="Directory of *_label.tif labels"
+    )
+    parser.add_argument(
+        "--pred_dir",
+        nargs="+",
+        required=True,
+        help="Prediction directories, as name=directory or directory",
+    )
+    parser.add_argument("--output_dir", required=True)
+    parser.add_argument("--pattern", default="*_image.tif")
+    parser.add_argument("--num_workers", type=int, default=None)
+    parser.add_argument("--max_size", type=int, default=256)
+    args = parser.parse_args()
+
+    image_files = sorted(Path(args.image_dir).glob(args.pattern))
+    label_files = None
+    if args.label_dir:
+        label_files = [
+            Path(args.label_dir) / label_file.name
+            for label_file in reference_labels(image_files)
+        ]
+    pred_dirs = dict(
+        spec.split("=", 1) if "=" in spec else (Path(spec).name, spec)
+        for spec in args.pred_dir
+    )
+    index_file = render_report(
+        image_files,
+        pred_dirs,
+        args.output_dir,
+        label_files,
+        args.num_workers,
+        args.max_size,
+    )
+    print(f"Report written to {index_file}")
+
+
+if __name__ == "__main__":
+    main()
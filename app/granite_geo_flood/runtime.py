@@ -0,0 +1,384 @@
+"""ahead-of-time compiled models (TorchScript, ONNX) and the runtimes to run
+them"""
+
+import argparse
+import copy
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch import nn
+
+from granite_geo_flood.predictor import FloodPredictor
+
+BACKENDS = ("eager", "compile", "torchscript", "onnxruntime")
+
+
+class LogitsModel(nn.Module):
+    """the segmentation model (backbone, necks and decoder head) returning
+    its logits as a plain tensor, which tracing and ONNX export need"""
+
+    def __init__(self, model: nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.model(x).output
+
+
+def example_batch(
+    predictor: FloodPredictor, batch_size: int, tile_size: int
+) -> torch.Tensor:
+    """random model input used to trace the model"""
+    generator = torch.Generator().manual_seed(0)
+    return torch.randn(
+        batch_size,
+        predictor.preprocessor.num_bands,
+        tile_size,
+        tile_size,
+        generator=generator,
+    ).to(predictor.device)
+
+
+def export_torchscript(
+    predictor: FloodPredictor,
+    save_file: Path | str,
+    batch_size: int = 1,
+    tile_size: int = 512,
+) -> Path:
+    """trace the full inference graph to TorchScript, with the config stored
+    in the file. The tile size is fixed by the trace (the positional
+    embedding is computed for it); the batch size is not.
+
+    Args:
+        predictor (FloodPredictor): eager float32 predictor
+        save_file (Path | str): output location, e.g. `model.ts`
+        batch_size (int): batch size of the example traced. Defaults to 1.
+        tile_size (int): tile height and width. Defaults to 512.
+
+    Returns:
+        Path: the written file
+    """
+    example = example_batch(predictor, batch_size, tile_size)
+    with torch.inference_mode(False), torch.no_grad():
+        traced = torch.jit.trace(LogitsModel(predictor.model).eval(), example)
+        traced = torch.jit.freeze(traced)
+    torch.jit.save(
+        traced,
+        str(save_file),
+        _extra_files={"config.json": json.dumps(predictor.config)},
+    )
+    return Path(save_file)
+
+
+def export_onnx(
+    predictor: FloodPredictor,
+    save_file: Path | str,
+    batch_size: int | None = None,
+    tile_size: int = 512,
+    opset_version: int = 17,
+) -> Path:
+    """export the full inference graph to ONNX, with the config stored in
+    the model metadata
+
+    Args:
+        predictor (FloodPredictor): eager float32 predictor
+        save_file (Path | str): output location, e.g. `model.onnx`
+        batch_size (int | None): fixed batch size, or None for a dynamic
+            batch axis. Defaults to None.
+        tile_size (int): tile height and width. Defaults to 512.
+        opset_version (int): ONNX opset. Defaults to 17.
+
+    Returns:
+        Path: the written file
+    """
+    import onnx
+
+    example = example_batch(predictor, batch_size or 1, tile_size)
+    dynamic_axes = None
+    if batch_size is None:
+        dynamic_axes = {"image": {0: "batch"}, "logits": {0: "batch"}}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            LogitsModel(predictor.model).eval(),
+            (example,),
+            str(save_file),
+            input_names=["image"],
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset_version,
+        )
+
+    model = onnx.load(str(save_file))
+    onnx.helper.set_model_props(
+        model, {"config": json.dumps(predictor.config)}
+    )
+    onnx.save(model, str(save_file))
+    return Path(save_file)
+
+
+class TorchScriptRuntime:
+    """runs a model exported by `export_torchscript`
+
+    Args:
+        model_file (Path | str): TorchScript file
+        device (str): torch device to run on. Defaults to "cpu".
+    """
+
+    def __init__(self, model_file: Path | str, device: str = "cpu") -> None:
+        extra_files = {"config.json": ""}
+        self.device = torch.device(device)
+        self.module = torch.jit.load(
+            str(model_file), map_location=self.device, _extra_files=extra_files
+        )
+        self.config = json.loads(extra_files["config.json"])
+
+    @torch.inference_mode()
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        x = torch.from_numpy(np.ascontiguousarray(batch, dtype=np.float32))
+        return self.module(x.to(self.device)).float().cpu().numpy()
+
+
+class OnnxRuntime:
+    """runs a model exported by `export_onnx` with ONNX Runtime on CPU
+
+    Args:
+        model_file (Path | str): ONNX file
+        num_threads (int | None): intra-op threads. Defaults to None
+            (ONNX Runtime's choice).
+    """
+
+    def __init__(
+        self, model_file: Path | str, num_threads: int | None = None
+    ) -> None:
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            str(model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.config = json.loads(
+            self.session.get_modelmeta().custom_metadata_map["config"]
+        )
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(["logits"], {"image": batch})[0]
+
+
+def compile_predictor(predictor: FloodPredictor) -> FloodPredictor:
+    """predictor sharing this one's weights, running the model through
+    `torch.compile`. Compilation happens on the first batch of each shape."""
+    compiled = copy.copy(predictor)
+    compiled.model = torch.compile(predictor.model)
+    return compiled
+
+
+def load_predictor(
+    backend: str, model_file: Path | str, device: str = "cpu"
+) -> FloodPredictor:
+    """load a predictor running on a runtime backend
+
+    Args:
+        backend (str): one of BACKENDS
+        model_file (Path | str): inference-only artifact (see
+            `granite_geo_flood.export`) for "eager" and "compile", or the
+            file written by `export_torchscript` or `export_onnx`
+        device (str): torch device to run on. Defaults to "cpu".
+
+    Returns:
+        FloodPredictor: predictor running on the backend
+    """
+    match backend:
+        case "eager":
+            return FloodPredictor.from_artifact(model_file, device)
+        case "compile":
+            return compile_predictor(
+                FloodPredictor.from_artifact(model_file, device)
+            )
+        case "torchscript":
+            return FloodPredictor.from_runtime(
+                TorchScriptRuntime(model_file, device), device
+            )
+        case "onnxruntime":
+            return FloodPredictor.from_runtime(OnnxRuntime(model_file))
+        case _:
+            raise ValueError(
+                f"Unknown backend {backend}, expected one of {BACKENDS}"
+            )
+
+
+def check_parity(
+    reference: FloodPredictor,
+    candidate: FloodPredictor,
+    batch: np.ndarray,
+    atol: float = 1e-3,
+) -> dict:
+    """compare a backend's logits with the eager model's on the same batch
+
+    Args:
+        reference (FloodPredictor): eager predictor
+        candidate (FloodPredictor): predictor on another backend
+        batch (np.ndarray): preprocessed batch [n x bands x h x w]
+        atol (float): largest allowed absolute logit difference. Defaults
+            to 1e-3.
+
+    Returns:
+        dict: max_abs_diff of the logits and class_agreement of their argmax
+
+    Raises:
+        ValueError: if the logits differ by more than `atol`
+    """
+    expected = reference.forward(batch)
+    logits = candidate.forward(batch)
+    if logits.shape != expected.shape:
+        raise ValueError(
+            f"Logits shape {logits.shape} differs from eager {expected.shape}"
+        )
+
+    parity = {
+        "max_abs_diff": float(np.abs(logits - expected).max()),
+        "class_agreement": float(
+            (logits.argmax(axis=1) == expected.argmax(axis=1)).mean()
+        ),
+    }
+    if parity["max_abs_diff"] > atol:
+        raise ValueError(
+            f"Logits differ from eager by {parity['max_abs_diff']:.2e}, "
+            f"more than {atol}"
+        )
+    return parity
+
+
+_BACKEND_RUN = """
+import json, time
+start = time.perf_counter()
+import numpy as np
+from granite_geo_flood.runtime import load_predictor
+predictor = load_predictor({backend!r}, {model_file!r})
+batch = np.random.default_rng(0).standard_normal(
+    ({batch_size}, predictor.preprocessor.num_bands, {tile_size}, {tile_size}),
+    dtype=np.float32,
+)
+predictor.forward(batch)
+startup = time.perf_counter() - start
+latencies = []
+for _ in range({num_batches}):
+    start = time.perf_counter()
+    predictor.forward(batch)
+    latencies.append(time.perf_counter() - start)
+latency = float(np.median(latencies))
+print(json.dumps({{"startup_seconds": startup, "latency_seconds": latency}}))
+"""
+
+
+def benchmark_backends(
+    model_files: dict,
+    batch_size: int = 1,
+    tile_size: int = 512,
+    num_batches: int = 4,
+) -> dict:
+    """startup (import, load and first batch) and median batch latency of
+    each backend, each in a fresh interpreter
+
+    Args:
+        model_files (dict): model file of each backend to compare
+        batch_size (int): tiles per forward pass. Defaults to 1.
+        tile_size (int): tile height and width. Defaults to 512.
+        num_batches (int): timed batches. Defaults to 4.
+
+    Returns:
+        dict: startup_seconds and latency_seconds for each backend
+    """
+    results = {}
+    for backend, model_file in model_files.items():
+        code = _BACKEND_RUN.format(
+            backend=backend,
+            model_file=str(model_file),
+            batch_size=batch_size,
+            tile_size=tile_size,
+            num_batches=num_batches,
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results[backend] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Export the flood model to TorchScript and ONNX, check "
+        "them against eager and compare backends."
+    )
+    parser.add_argument(
+        "--artifact", required=True, help="Inference-only artifact"
+    )
+    parser.add_argument(
+        "--output_dir", required=True, help="Directory for the exported models"
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=None,
+        help="Fixed ONNX batch size (default: dynamic batch)",
+    )
+    parser.add_argument("--tile_size", type=int, default=512)
+    parser.add_argument("--benchmark", action="store_true")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    predictor = FloodPredictor.from_artifact(args.artifact)
+    model_files = {
+        "eager": args.artifact,
+        "compile": args.artifact,
+        "torchscript": export_torchscript(
+            predictor,
+            output_dir / "model.ts",
+            args.batch_size or 1,
+            args.tile_size,
+        ),
+        "onnxruntime": export_onnx(
+            predictor,
+            output_dir / "model.onnx",
+            args.batch_size,
+            args.tile_size,
+        ),
+    }
+
+    # a different batch size from the traced one checks the batch axis too
+    batch_size = args.batch_size or 2
+    batch = example_batch(predictor, batch_size, args.tile_size).numpy()
+    for backend in ("compile", "torchscript", "onnxruntime"):
+        parity = check_parity(
+            predictor, load_predictor(backend, model_files[backend]), batch
+        )
+        print(
+            f"{backend:>12}: max logit difference "
+            f"{parity['max_abs_diff']:.2e}, "
+            f"{parity['class_agreement']:.2%} of pixels agree with eager"
+        )
+
+    if args.benchmark:
+        results = benchmark_backends(model_files, batch_size, args.tile_size)
+        for backend, stats in results.items():
+            print(
+                f"{backend:>12}: startup {stats['startup_seconds']:.2f} s, "
+                f"{stats['latency_seconds'] * 1000:.0f} ms per batch of "
+                f"{batch_size}"
+            )
+
+
+if __name__ == "__main__":
+    main()
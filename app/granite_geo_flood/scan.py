@@ -0,0 +1,127 @@
+"""header-only pre-flight scan of input GeoTIFFs with a cached manifest"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+
+def scan_file(image_file: Path | str, nan_sample: int = 0) -> dict:
+    """read the header of a GeoTIFF, without decoding the whole image
+
+    Args:
+        image_file (Path | str): GeoTIFF to scan
+        nan_sample (int): if above 0, estimate the share of NaN/nodata pixels
+            from a decimated read of about `nan_sample` x `nan_sample` pixels
+            per band. Defaults to 0 (no pixel data read).
+
+    Returns:
+        dict: path, mtime_ns, size, nan_sample, bands, dtype, height, width,
+            crs, nodata, nan_fraction (if sampled) or error (if the file could
+            not be read)
+    """
+    stat = os.stat(image_file)
+    entry = {
+        "path": str(image_file),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "nan_sample": nan_sample,
+    }
+
+    try:
+        with rasterio.open(image_file) as src:
+            entry.update(
+                bands=src.count,
+                dtype=src.dtypes[0],
+                height=src.height,
+                width=src.width,
+                crs=src.crs.to_string() if src.crs else None,
+                nodata=src.nodata,
+            )
+            if nan_sample > 0:
+                out_shape = (
+                    src.count,
+                    min(src.height, nan_sample),
+                    min(src.width, nan_sample),
+                )
+                sample = src.read(out_shape=out_shape, masked=True)
+                invalid = np.ma.getmaskarray(sample)
+                if np.issubdtype(sample.dtype, np.floating):
+                    invalid = invalid | np.isnan(sample.data)
+                entry["nan_fraction"] = float(invalid.mean())
+    except Exception as e:
+        entry["error"] = str(e)
+
+    return entry
+
+
+def load_manifest(manifest_file: Path | str) -> dict:
+    """entries of a manifest keyed by path, empty if there is none"""
+    manifest_file = Path(manifest_file)
+    if not manifest_file.exists():
+        return {}
+    with open(manifest_file) as f:
+        return {entry["path"]: entry for entry in json.load(f)["files"]}
+
+
+def scan_directory(
+    input_dir: Path | str,
+    pattern: str = "*.tif",
+    manifest_file: Path | str | None = None,
+    num_workers: int = 8,
+    nan_sample: int = 0,
+) -> list:
+    """scan the headers of every matching file on a thread pool. Files whose
+    path, mtime, size and `nan_sample` match an entry of an existing manifest
+    are not opened again.
+
+    Args:
+        input_dir (Path | str): directory holding the input images
+        pattern (str): glob pattern of the images. Defaults to "*.tif".
+        manifest_file (Path | str | None): JSON manifest to reuse and update.
+            Defaults to None (no manifest).
+        num_workers (int): scanning threads. Defaults to 8.
+        nan_sample (int): see `scan_file`. Defaults to 0.
+
+    Returns:
+        list: one entry per file (see `scan_file`), sorted by path
+    """
+    image_files = sorted(str(f) for f in Path(input_dir).glob(pattern))
+    cached = load_manifest(manifest_file) if manifest_file is not None else {}
+
+    entries, to_scan = {}, []
+    for image_file in image_files:
+        entry = cached.get(image_file)
+        stat = os.stat(image_file)
+        if (
+            entry is not None
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+            and entry.get("nan_sample", 0) == nan_sample
+        ):
+            entries[image_file] = entry
+        else:
+            to_scan.append(image_file)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for entry in executor.map(lambda f: scan_file(f, nan_sample), to_scan):
+            entries[entry["path"]] = entry
+
+    entries = [entries[image_file] for image_file in image_files]
+
+    if manifest_file is not None:
+        Path(manifest_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(manifest_file, "w") as f:
+            json.dump(
+                {"input_dir": str(input_dir), "files": entries}, f, indent=1
+            )
+
+    return entries
+
+
+def readable_files(entries: list) -> list:
+    """paths of the manifest entries that could be opened"""
+    return [entry["path"] for entry in entries if "error" not in entry]
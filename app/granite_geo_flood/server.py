@@ -0,0 +1,363 @@
+"""long-lived HTTP inference service micro-batching concurrent requests"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from aiohttp import web
+from rasterio.io import MemoryFile
+
+from granite_geo_flood.batching import group_batches
+from granite_geo_flood.predictor import (
+    FloodPredictor,
+    read_image,
+    write_prediction,
+)
+from granite_geo_flood.utils.area import water_stats
+
+OUTPUTS = ("mask", "stats")
+
+
+def decode_geotiff(data: bytes) -> tuple[np.ndarray, dict]:
+    """read an uploaded GeoTIFF as `predictor.read_image` reads files"""
+    with MemoryFile(data) as memfile, memfile.open() as src:
+        image = src.read(out_dtype="float32", masked=True).filled(np.nan)
+        return image, src.profile
+
+
+def encode_prediction(pred: np.ndarray, profile: dict) -> bytes:
+    """a flood map as the bytes of the GeoTIFF `write_prediction` writes"""
+    with MemoryFile() as memfile:
+        write_prediction(pred, dict(profile, driver="GTiff"), memfile.name)
+        return memfile.read()
+
+
+class MicroBatcher:
+    """combines concurrent requests into batches for one model.
+
+    Requests wait in an asyncio queue. Once one arrives the batcher waits
+    up to `max_delay` seconds, the latency budget, for more to fill the
+    batch, then predicts tiles of the same shape together on a single
+    model thread, so the event loop keeps accepting requests meanwhile.
+    Requests whose caller gave up are dropped before they reach the model.
+
+    Args:
+        predictor (FloodPredictor): loaded model
+        max_batch_size (int): most tiles per forward pass. Defaults to 8.
+        max_delay (float): seconds the first request of a batch waits for
+            others. Defaults to 0.02.
+        max_queue (int): requests queued before new ones are refused.
+            Defaults to 64.
+    """
+
+    def __init__(
+        self,
+        predictor: FloodPredictor,
+        max_batch_size: int = 8,
+        max_delay: float = 0.02,
+        max_queue: int = 64,
+    ) -> None:
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.batch_sizes = []
+
+        self._queue = asyncio.Queue(max_queue)
+        self._executor = ThreadPoolExecutor(1)
+
+    async def predict(self, image: np.ndarray) -> np.ndarray:
+        """predicted classes [h x w] of a raw image [bands x h x w]
+
+        Raises:
+            asyncio.QueueFull: if `max_queue` requests are already waiting
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((image, future))
+        return await future
+
+    async def warm_up(self, shape: tuple) -> None:
+        """predict a blank image once, which allocates the buffers and picks
+        the kernels the first request would otherwise wait for"""
+        await asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            self.predictor.predict,
+            np.zeros(shape, dtype=np.float32),
+        )
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        items = [await self._queue.get()]
+        deadline = loop.time() + self.max_delay
+        while len(items) < self.max_batch_size:
+            if not self._queue.empty():
+                items.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(
+                    await asyncio.wait_for(self._queue.get(), timeout)
+                )
+            except asyncio.TimeoutError:
+                break
+        return [item for item in items if not item[1].done()]
+
+    async def run(self) -> None:
+        """predict queued requests until cancelled"""
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect()
+            shapes = [image.shape for image, _ in items]
+            for batch_ids in group_batches(shapes, self.max_batch_size):
+                batch = np.stack([items[i][0] for i in batch_ids])
+                futures = [items[i][1] for i in batch_ids]
+                try:
+                    preds = await loop.run_in_executor(
+                        self._executor, self.predictor.predict, batch
+                    )
+                except Exception as e:
+                    preds = [e] * len(futures)
+                self.batch_sizes.append(len(batch_ids))
+
+                for future, pred in zip(futures, preds):
+                    if future.done():
+                        continue
+                    if isinstance(pred, Exception):
+                        future.set_exception(pred)
+                    else:
+                        future.set_result(pred)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({"error": message}, status=status)
+
+
+def create_app(
+    load_predictor,
+    max_batch_size: int = 8,
+    max_delay: float = 0.02,
+    max_queue: int = 64,
+    timeout: float = 60.0,
+    data_dir: Path | str | None = None,
+    max_upload_mb: int = 256,
+    warmup_size: int = 512,
+) -> web.Application:
+    """HTTP service predicting flood maps of GeoTIFFs.
+
+    `POST /predict` takes a GeoTIFF upload as the request body, or a JSON
+    body `{"path": ...}` naming a file under `data_dir`. With `?output=mask`
+    (the default) it returns the georeferenced flood map as a GeoTIFF, with
+    `?output=stats` the water pixels and area as JSON. `GET /healthz`
+    answers while the server runs; `GET /readyz` once the model is loaded
+    and warmed up.
+
+    Args:
+        load_predictor (callable): returns the FloodPredictor, called once
+            on startup in a thread
+        max_batch_size (int): most tiles per forward pass. Defaults to 8.
+        max_delay (float): latency budget for filling a batch, in seconds.
+            Defaults to 0.02.
+        max_queue (int): queued requests before new ones get a 503.
+            Defaults to 64.
+        timeout (float): seconds before a request gets a 504. Defaults to 60.
+        data_dir (Path | str | None): directory that local paths must be
+            under. Defaults to None (local paths refused).
+        max_upload_mb (int): largest upload. Defaults to 256.
+        warmup_size (int): height and width of the tile predicted before the
+            service reports ready. Defaults to 512.
+
+    Returns:
+        web.Application: the service, to run with `web.run_app`
+    """
+    app = web.Application(client_max_size=max_upload_mb * 2**20)
+    state = {"batcher": None, "error": None}
+    data_dir = Path(data_dir).resolve() if data_dir is not None else None
+
+    async def load(app: web.Application) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            predictor = await loop.run_in_executor(None, load_predictor)
+            batcher = MicroBatcher(
+                predictor, max_batch_size, max_delay, max_queue
+            )
+            bands = len(predictor.config["data"]["init_args"]["dataset_bands"])
+            await batcher.warm_up((bands, warmup_size, warmup_size))
+        except Exception as e:
+            state["error"] = str(e)
+            return
+        state["bands"] = bands
+        state["batcher"] = batcher
+        await batcher.run()
+
+    async def start(app: web.Application) -> None:
+        state["loader"] = asyncio.create_task(load(app))
+
+    async def stop(app: web.Application) -> None:
+        state["loader"].cancel()
+        if state["batcher"] is not None:
+            state["batcher"].close()
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def readyz(request: web.Request) -> web.Response:
+        if state["error"] is not None:
+            return web.json_response(
+                {"status": "failed", "error": state["error"]}, status=503
+            )
+        if state["batcher"] is None:
+            return web.json_response({"status": "loading"}, status=503)
+        batch_sizes = state["batcher"].batch_sizes
+        return web.json_response(
+            {
+                "status": "ready",
+                "batches": len(batch_sizes),
+                "mean_batch_size": float(np.mean(batch_sizes))
+                if batch_sizes
+                else 0.0,
+            }
+        )
+
+    async def read_request(request: web.Request) -> tuple[np.ndarray, dict]:
+        loop = asyncio.get_running_loop()
+        if request.content_type == "application/json":
+            if data_dir is None:
+                raise web.HTTPForbidden(
+                    text="Local paths are disabled, upload the file"
+                )
+            try:
+                body = await request.json()
+            except ValueError as e:
+                raise web.HTTPBadRequest(text=f"Invalid JSON: {e}")
+            path = body.get("path") if isinstance(body, dict) else None
+            if not isinstance(path, str):
+                raise web.HTTPBadRequest(
+                    text='Expected a JSON object with a "path" string'
+                )
+            image_file = (data_dir / path).resolve()
+            if (
+                not image_file.is_relative_to(data_dir)
+                or not image_file.is_file()
+            ):
+                raise web.HTTPNotFound(
+                    text=f"No file {path} under the data directory"
+                )
+            return await loop.run_in_executor(None, read_image, image_file)
+
+        data = await request.read()
+        try:
+            return await loop.run_in_executor(None, decode_geotiff, data)
+        except Exception as e:
+            raise web.HTTPBadRequest(text=f"Not a readable GeoTIFF: {e}")
+
+    async def handle(request: web.Request, output: str) -> web.Response:
+        image, profile = await read_request(request)
+        if len(image) != state["bands"]:
+            raise web.HTTPBadRequest(
+                text=f"Expected {state['bands']} bands, got {len(image)}"
+            )
+        pred = await state["batcher"].predict(image)
+
+        if output == "stats":
+            stats = water_stats(pred, profile["crs"], profile["transform"])
+            return web.json_response(dict(stats, shape=list(pred.shape)))
+        body = await asyncio.get_running_loop().run_in_executor(
+            None, encode_prediction, pred, profile
+        )
+        return web.Response(body=body, content_type="image/tiff")
+
+    async def predict(request: web.Request) -> web.Response:
+        output = request.query.get("output", "mask")
+        if output not in OUTPUTS:
+            return _error(
+                400, f"Unknown output {output}, expected one of {OUTPUTS}"
+            )
+        if state["batcher"] is None:
+            return _error(503, "Model is not loaded yet")
+        try:
+            return await asyncio.wait_for(handle(request, output), timeout)
+        except asyncio.TimeoutError:
+            return _error(504, f"Prediction took longer than {timeout} s")
+        except asyncio.QueueFull:
+            response = _error(503, "Too many queued requests")
+            response.headers["Retry-After"] = "1"
+            return response
+        except web.HTTPException as e:
+            return _error(e.status, e.text)
+
+    app.on_startup.append(start)
+    app.on_cleanup.append(stop)
+    app.add_routes(
+        [
+            web.get("/healthz", healthz),
+            web.get("/readyz", readyz),
+            web.post("/predict", predict),
+        ]
+    )
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve flood detection over HTTP with a model kept loaded."
+    )
+    parser.add_argument(
+        "--config",
+        default=(
+            "/app/configs/"
+            "config_granite_geospatial_uki_flood_detection_v1.yaml"
+        ),
+        help="Path to config.yaml",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default="/app/models/granite_geospatial_uki_flood_detection_v1.ckpt",
+        help="Path to model.ckpt",
+    )
+    parser.add_argument(
+        "--artifact", default=None, help="Inference-only artifact"
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max_batch_size", type=int, default=8)
+    parser.add_argument(
+        "--max_delay_ms",
+        type=float,
+        default=20,
+        help="Latency budget for combining requests into a batch",
+    )
+    parser.add_argument("--max_queue", type=int, default=64)
+    parser.add_argument(
+        "--timeout", type=float, default=60, help="Request timeout in seconds"
+    )
+    parser.add_argument(
+        "--data_dir",
+        default="/app/data",
+        help="Directory under which requests may name local files",
+    )
+    args = parser.parse_args()
+
+    def load_predictor() -> FloodPredictor:
+        if args.artifact:
+            return FloodPredictor.from_artifact(args.artifact)
+        return FloodPredictor(args.config, args.checkpoint)
+
+    app = create_app(
+        load_predictor,
+        max_batch_size=args.max_batch_size,
+        max_delay=args.max_delay_ms / 1000,
+        max_queue=args.max_queue,
+        timeout=args.timeout,
+        data_dir=args.data_dir,
+    )
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
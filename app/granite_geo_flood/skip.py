@@ -0,0 +1,209 @@
+"""cheap pre-classification of tiles whose flood map is known without the
+model"""
+
+import logging
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from affine import Affine
+
+from granite_geo_flood.predictor import WATER
+from granite_geo_flood.utils.land_mask import compute_land_mask
+
+logger = logging.getLogger(__name__)
+
+SKIP_REASONS = ("nodata", "ocean", "cloud")
+
+# raw CLOUD band values from which a pixel is cloud
+CLOUD_VALUE = 0.5
+
+# land is looked up on every OCEAN_STEP-th pixel first, and on every pixel
+# only for tiles that may be skipped
+OCEAN_STEP = 8
+
+
+def skipped_probability(pred: np.ndarray) -> np.ndarray:
+    """water probability of a skipped tile's flood map: 1 for water and
+    NaN for no data"""
+    return np.where(pred < 0, np.nan, pred == WATER).astype(np.float32)
+
+
+class TileFilter:
+    """recognises tiles that need no forward pass and gives their flood map:
+
+    - "nodata": at least `max_nodata` of the pixels have every band NaN or
+      `no_data_replace`. Written as nodata (-1).
+    - "ocean": at least `max_ocean` of the pixels with data are over the
+      ocean according to `global_land_mask`. Written as water, as
+      `helper.mask_image` does for plots, with nodata kept.
+    - "cloud": at least `max_cloud` of the pixels with data are flagged by
+      the CLOUD band. Written as nodata (-1). Off by default, as the model
+      also sees the S1 bands, which clouds do not hide.
+
+    A threshold of None turns its check off. Decisions are logged, and
+    counted for `summary`; one filter can be shared by reader threads.
+
+    Args:
+        dataset_bands (list): band names of the raw images
+        no_data_replace (float): raw value standing for no data. Defaults to 0.
+        max_nodata (float | None): nodata share to skip at. Defaults to 1.0.
+        max_ocean (float | None): ocean share to skip at. Defaults to 1.0.
+        max_cloud (float | None): cloud share to skip at. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        dataset_bands: list,
+        no_data_replace: float = 0,
+        max_nodata: float | None = 1.0,
+        max_ocean: float | None = 1.0,
+        max_cloud: float | None = None,
+    ) -> None:
+        self.no_data_replace = no_data_replace
+        self.max_nodata = max_nodata
+        self.max_ocean = max_ocean
+        self.max_cloud = max_cloud
+        self.cloud_band = (
+            dataset_bands.index("CLOUD") if "CLOUD" in dataset_bands else None
+        )
+        if max_cloud is not None and self.cloud_band is None:
+            raise ValueError(
+                "Cloud skipping needs a CLOUD band in the dataset bands"
+            )
+
+        self.checked = 0
+        self.skipped = {reason: 0 for reason in SKIP_REASONS}
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(
+        cls,
+        config: dict,
+        max_nodata: float | None = 1.0,
+        max_ocean: float | None = 1.0,
+        max_cloud: float | None = None,
+    ) -> "TileFilter":
+        """build from a parsed terratorch config (see
+        `predictor.load_config`)"""
+        data_args = config["data"]["init_args"]
+        return cls(
+            data_args["dataset_bands"],
+            data_args.get("no_data_replace", 0),
+            max_nodata,
+            max_ocean,
+            max_cloud,
+        )
+
+    def fractions(
+        self, image: np.ndarray, profile: dict
+    ) -> tuple[np.ndarray, dict]:
+        """pixels with no data, and the nodata, ocean and cloud shares of a
+        raw image [bands x h x w]. Ocean and cloud are shares of the pixels
+        with data; ocean is 0 for images without a CRS."""
+        nodata = (np.isnan(image) | (image == self.no_data_replace)).all(
+            axis=0
+        )
+        num_valid = nodata.size - np.count_nonzero(nodata)
+        fractions = {
+            "nodata": 1 - num_valid / nodata.size,
+            "ocean": 0.0,
+            "cloud": 0.0,
+        }
+        if num_valid == 0:
+            return nodata, fractions
+
+        crs = profile.get("crs")
+        if self.max_ocean is not None and crs is not None:
+            transform = profile["transform"]
+            fractions["ocean"] = self._ocean_fraction(
+                crs, transform, nodata, OCEAN_STEP
+            )
+            if fractions["ocean"] >= self.max_ocean:
+                fractions["ocean"] = self._ocean_fraction(
+                    crs, transform, nodata
+                )
+        if self.max_cloud is not None:
+            cloud = image[self.cloud_band] >= CLOUD_VALUE
+            fractions["cloud"] = np.count_nonzero(cloud & ~nodata) / num_valid
+        return nodata, fractions
+
+    @staticmethod
+    def _ocean_fraction(
+        crs, transform: Affine, nodata: np.ndarray, step: int = 1
+    ) -> float:
+        """ocean share of the pixels with data, sampling every `step`-th
+        pixel of each row and column"""
+        if step > 1:
+            nodata = nodata[::step, ::step]
+            # grid whose pixel centres are those of the sampled pixels
+            offset = 0.5 - step / 2
+            transform = (
+                transform
+                * Affine.translation(offset, offset)
+                * Affine.scale(step)
+            )
+        num_valid = nodata.size - np.count_nonzero(nodata)
+        if num_valid == 0:
+            return 0.0
+        land = compute_land_mask(crs, transform, nodata.shape)
+        return np.count_nonzero(~(land | nodata)) / num_valid
+
+    def __call__(
+        self, image: np.ndarray, profile: dict, image_file: Path | str = ""
+    ) -> tuple[str | None, np.ndarray | None]:
+        """reason to skip a raw image and its flood map [h x w], or
+        (None, None) if the model has to predict it
+
+        Args:
+            image (np.ndarray): raw image [bands x h x w], NaN for no data
+            profile (dict): rasterio profile of the image
+            image_file (Path | str): file the image came from, for the log.
+                Defaults to "".
+        """
+        start = time.perf_counter()
+        nodata, fractions = self.fractions(image, profile)
+        reason = None
+        for name, threshold in zip(
+            SKIP_REASONS, (self.max_nodata, self.max_ocean, self.max_cloud)
+        ):
+            if threshold is not None and fractions[name] >= threshold:
+                reason = name
+                break
+
+        pred = None
+        if reason is not None:
+            pred = np.full(nodata.shape, -1, dtype=np.int16)
+            if reason == "ocean":
+                pred[~nodata] = WATER
+
+        with self._lock:
+            self.checked += 1
+            self.seconds += time.perf_counter() - start
+            if reason is not None:
+                self.skipped[reason] += 1
+
+        shares = ", ".join(
+            f"{name} {share:.3f}" for name, share in fractions.items()
+        )
+        if reason is None:
+            logger.debug("predicting %s (%s)", image_file, shares)
+        else:
+            logger.info("skipped %s as %s (%s)", image_file, reason, shares)
+        return reason, pred
+
+    def summary(self, forward_seconds_per_tile: float = 0.0) -> str:
+        """tiles skipped for each reason and the compute saved, estimated
+        from the mean forward seconds of the predicted tiles"""
+        total = sum(self.skipped.values())
+        reasons = ", ".join(
+            f"{count} {reason}" for reason, count in self.skipped.items()
+        )
+        return (
+            f"skipped {total} of {self.checked} tiles ({reasons}), "
+            "saving about "
+            f"{total * forward_seconds_per_tile:.1f} s of model compute for "
+            f"{self.seconds:.2f} s of checks"
+        )
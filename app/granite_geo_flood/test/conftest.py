@@ -0,0 +1,150 @@
+"""stand-in models, GeoTIFF writers and the inference script shared by the
+tests"""
+
+import subprocess
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import rasterio
+import torch
+from rasterio.transform import from_origin
+
+from granite_geo_flood.predictor import FloodPredictor, load_config
+
+CONFIG_FILE = (
+    Path(__file__).parents[2]
+    / "configs"
+    / "config_granite_geospatial_uki_flood_detection_v1.yaml"
+)
+RUN_INFERENCE = Path(__file__).parents[2] / "run_inference.py"
+# 0.0001 degree pixels over Ireland
+TRANSFORM = from_origin(-9.2, 53.7, 0.0001, 0.0001)
+
+
+class ConvModel(torch.nn.Module):
+    """stand-in segmentation model returning a model output with logits"""
+
+    def __init__(self, bands=9, classes=2):
+        super().__init__()
+        self.encoder = torch.nn.Conv2d(bands, 8, 3, padding=1)
+        self.head = torch.nn.Conv2d(8, classes, 1)
+
+    def forward(self, x):
+        return SimpleNamespace(output=self.head(torch.relu(self.encoder(x))))
+
+
+class PixelModel(torch.nn.Module):
+    """stand-in model classifying each pixel with a Linear layer over its
+    bands"""
+
+    def __init__(self, bands=9, classes=3):
+        super().__init__()
+        self.head = torch.nn.Linear(bands, classes)
+
+    def forward(self, x):
+        logits = self.head(x.movedim(1, -1)).movedim(-1, 1)
+        return SimpleNamespace(output=logits)
+
+
+MODELS = {"conv": ConvModel, "pixel": PixelModel}
+
+
+class FirstBandsRuntime:
+    """stand-in runtime whose logits are the first two model bands. Records
+    the batch sizes it is called with."""
+
+    def __init__(self, config):
+        self.config = config
+        self.batch_sizes = []
+
+    def __call__(self, batch):
+        self.batch_sizes.append(len(batch))
+        return batch[:, :2].astype(np.float32)
+
+
+def write_raster(
+    path, data, transform=TRANSFORM, crs="EPSG:4326", nodata=None
+):
+    """write an image [bands x h x w] or a single band [h x w] as a GeoTIFF"""
+    data = data[None] if data.ndim == 2 else data
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=data.shape[2],
+        height=data.shape[1],
+        count=data.shape[0],
+        dtype=data.dtype,
+        nodata=nodata,
+        crs=crs,
+        transform=transform,
+    ) as dst:
+        dst.write(data)
+    return Path(path)
+
+
+@pytest.fixture
+def config_file():
+    return CONFIG_FILE
+
+
+@pytest.fixture
+def config():
+    return load_config(CONFIG_FILE)
+
+
+@pytest.fixture
+def make_predictor(config):
+    """FloodPredictor around a seeded stand-in model from MODELS"""
+
+    def make(model="conv", seed=0):
+        torch.manual_seed(seed)
+        return FloodPredictor.from_model(config, MODELS[model]().eval())
+
+    return make
+
+
+@pytest.fixture
+def first_bands(config):
+    """FloodPredictor on a `FirstBandsRuntime`, reachable as its `runtime`"""
+    return FloodPredictor.from_runtime(FirstBandsRuntime(config))
+
+
+def run_inference(*args) -> subprocess.CompletedProcess:
+    """run the run_inference.py script with the command line `args`"""
+    return subprocess.run(
+        [sys.executable, str(RUN_INFERENCE), *map(str, args)],
+        capture_output=True,
+        text=True,
+    )
+
+
+@pytest.fixture(name="write_raster")
+def write_raster_fixture():
+    return write_raster
+
+
+@pytest.fixture(name="run_inference")
+def run_inference_fixture():
+    return run_inference
+
+
+@pytest.fixture
+def write_tiles(tmp_path):
+    """write random raw tiles `tile_<i>_image.tif` with all nine bands, one
+    per size in `sizes` or `count` of `size`, and return their files"""
+
+    def write(count=3, size=32, sizes=None, seed=0, directory=tmp_path):
+        rng = np.random.default_rng(seed)
+        return [
+            write_raster(
+                directory / f"tile_{i}_image.tif",
+                rng.random((9, tile_size, tile_size), dtype=np.float32),
+            )
+            for i, tile_size in enumerate(sizes or [size] * count)
+        ]
+
+    return write
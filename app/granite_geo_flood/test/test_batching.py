@@ -0,0 +1,24 @@
+import pytest
+
+from granite_geo_flood.batching import auto_batch_size, group_batches
+
+
+@pytest.mark.parametrize(
+    "shapes,batch_size,expected",
+    [
+        ([(9, 512, 512)] * 5, 2, [[0, 1], [2, 3], [4]]),
+        ([(9, 512, 512)] * 3, 8, [[0, 1, 2]]),
+        (
+            [(9, 512, 512), (9, 256, 256), (9, 512, 512), (9, 256, 256)],
+            4,
+            [[0, 2], [1, 3]],
+        ),
+        ([], 4, []),
+    ],
+)
+def test_group_batches(shapes, batch_size, expected):
+    assert group_batches(shapes, batch_size) == expected
+
+
+def test_auto_batch_size():
+    assert 1 <= auto_batch_size(512, 512, max_batch_size=16) <= 16
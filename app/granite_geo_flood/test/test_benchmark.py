@@ -0,0 +1,67 @@
+import json
+
+import rasterio
+
+from granite_geo_flood.benchmark import (
+    STAGES,
+    compare_results,
+    make_fixtures,
+    run_benchmarks,
+)
+
+
+def test_make_fixtures(tmp_path, config):
+    image_files, label_files = make_fixtures(
+        tmp_path, config, tile_size=32, num_tiles=2
+    )
+
+    with rasterio.open(image_files[0]) as src:
+        assert src.count == 9 and src.shape == (32, 32)
+        assert (
+            list(src.descriptions)
+            == config["data"]["init_args"]["dataset_bands"]
+        )
+    with rasterio.open(label_files[1]) as src:
+        assert src.dtypes[0] == "int16" and src.read(1).min() == -1
+
+
+def test_run_benchmarks(tmp_path, make_predictor):
+    results = run_benchmarks(
+        make_predictor(),
+        tmp_path,
+        tile_sizes=[32],
+        num_tiles=3,
+        batch_sizes=[1, 2],
+        threads=[1],
+    )
+
+    assert json.loads(json.dumps(results)) == results
+    assert [
+        (run["batch_size"], run["threads"]) for run in results["runs"]
+    ] == [(1, 1), (2, 1)]
+    for run in results["runs"]:
+        assert run["tiles_per_second"] > 0 and run["peak_rss_mb"] > 0
+        assert run["latency_p50_seconds"] <= run["latency_p95_seconds"]
+        assert tuple(run["stage_seconds_per_tile"]) == STAGES
+    assert len(list((tmp_path / "preds_32_2").glob("*_pred.tif"))) == 3
+
+
+def test_compare_results():
+    def results(*speeds):
+        return {
+            "runs": [
+                {
+                    "tile_size": 512,
+                    "batch_size": b,
+                    "threads": 4,
+                    "tiles_per_second": s,
+                }
+                for b, s in zip([1, 4], speeds)
+            ]
+        }
+
+    regressions = compare_results(
+        results(2.0, 4.0), results(1.95, 3.0), tolerance=0.1
+    )
+
+    assert regressions == [(512, 4, 4, 4.0, 3.0)]
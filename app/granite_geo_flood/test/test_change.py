@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from granite_geo_flood.change import (
+    TRANSITIONS,
+    change_stats,
+    change_stats_many,
+    group_series,
+    transition_map,
+)
+
+# 10 m pixels, 1e-4 km2 each
+TRANSFORM = from_origin(700000, 5900000, 10, 10)
+
+
+@pytest.fixture
+def write_map(write_raster):
+    def write(path, pred, dtype="int8", nodata=-1, transform=TRANSFORM):
+        pred = np.where(pred < 0, nodata, pred).astype(dtype)
+        return write_raster(path, pred, transform, "EPSG:32630", nodata)
+
+    return write
+
+
+def random_map(seed, shape=(140, 150)):
+    return np.random.default_rng(seed).integers(-1, 2, shape).astype(np.int8)
+
+
+def test_transition_map():
+    before = np.array([0, 0, 1, 1, -1, 0])
+    after = np.array([0, 1, 0, 1, 1, -1])
+
+    np.testing.assert_array_equal(
+        transition_map(before, after), [0, 1, 2, 3, -1, -1]
+    )
+
+
+def test_change_stats(tmp_path, write_map):
+    before, after = random_map(0), random_map(1)
+    before_file = write_map(tmp_path / "before.tif", before)
+    after_file = write_map(
+        tmp_path / "after.tif", after, dtype="uint8", nodata=255
+    )
+    # top left 40 x 20 pixels, in the raster CRS
+    zones = {
+        "west": {
+            "type": "Polygon",
+            "coordinates": [
+                [
+                    (700000, 5900000),
+                    (700200, 5900000),
+                    (700200, 5899600),
+                    (700000, 5899600),
+                    (700000, 5900000),
+                ]
+            ],
+        }
+    }
+
+    stats = change_stats(
+        before_file, after_file, blocksize=128, save_file=tmp_path / "c.tif"
+    )
+    clipped = change_stats(before_file, after_file, zones=zones, blocksize=16)
+
+    expected = transition_map(before, after)
+    for i, name in enumerate(TRANSITIONS):
+        assert stats[f"{name}_pixels"] == (expected == i).sum()
+        assert stats[f"{name}_km2"] == pytest.approx(
+            (expected == i).sum() * 1e-4
+        )
+        assert (
+            clipped["zones"]["west"][f"{name}_pixels"]
+            == (expected[:40, :20] == i).sum()
+        )
+    with rasterio.open(tmp_path / "c.tif") as src:
+        np.testing.assert_array_equal(src.read(1), expected)
+
+
+def test_change_stats_rejects_misaligned(tmp_path, write_map):
+    before_file = write_map(tmp_path / "before.tif", random_map(0))
+    after_file = write_map(
+        tmp_path / "after.tif",
+        random_map(1),
+        transform=from_origin(700005, 5900000, 10, 10),
+    )
+
+    with pytest.raises(ValueError, match="aligned"):
+        change_stats(before_file, after_file)
+
+
+def test_change_stats_many(tmp_path, write_map):
+    for date, seed in [("20241029", 0), ("20241030", 1), ("20241105", 2)]:
+        write_map(
+            tmp_path / f"EMSR773_AOI01_{date}_mosaic.tif", random_map(seed)
+        )
+    write_map(tmp_path / "EMSR773_AOI02_20241029_mosaic.tif", random_map(0))
+    write_map(
+        tmp_path / "EMSR773_AOI02_20241030_mosaic.tif", random_map(0, (8, 8))
+    )
+
+    series = group_series(sorted(tmp_path.glob("*_mosaic.tif")))
+    results = {r["aoi"]: r for r in change_stats_many(series, num_workers=2)}
+
+    assert [f.name[14:22] for f in series["EMSR773_AOI01"]] == [
+        "20241029",
+        "20241030",
+        "20241105",
+    ]
+    # two consecutive pairs and first against last
+    changes = results["EMSR773_AOI01"]["changes"]
+    assert len(changes) == 3 and changes[2]["before"].endswith(
+        "20241029_mosaic.tif"
+    )
+    assert "aligned" in results["EMSR773_AOI02"]["error"]
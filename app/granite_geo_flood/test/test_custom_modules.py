@@ -0,0 +1,34 @@
+import pytest
+import torch
+
+pytest.importorskip("terratorch")
+# the module the backbone builds on, which recent terratorch releases dropped
+vit = pytest.importorskip("terratorch.models.backbones.vit_encoder_decoder")
+uki = pytest.importorskip("custom_modules.granite_geospatial_uki")
+
+
+@pytest.mark.parametrize("out_indices", [[0], [0, 2], [2, 1], [-1], [1, -1]])
+def test_forward_selected_features(out_indices):
+    torch.manual_seed(0)
+    model = vit.TemporalViTEncoder(
+        img_size=32,
+        patch_size=16,
+        num_frames=1,
+        in_chans=3,
+        embed_dim=64,
+        depth=3,
+        num_heads=2,
+        decoder_embed_dim=32,
+        decoder_depth=1,
+        decoder_num_heads=2,
+        encoder_only=True,
+    ).eval()
+    x = torch.randn(2, 3, 32, 32)
+
+    with torch.no_grad():
+        expected = model.forward_features(x)
+        selected = uki.forward_selected_features(model, x, out_indices)
+
+    assert len(selected) == len(out_indices)
+    for i, features in zip(out_indices, selected):
+        assert torch.equal(features, expected[i])
@@ -0,0 +1,307 @@
+import hashlib
+import io
+import json
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from granite_geo_flood import download
+from granite_geo_flood.download import (
+    download_dataset,
+    download_model,
+    fetch,
+    zenodo_checksum,
+)
+
+
+class FileServer(ThreadingHTTPServer):
+    """stand-in for Zenodo and Hugging Face: serves `files` by path, with
+    byte ranges unless `ranges` is False, records the Range header of each
+    request and cuts the responses listed in `drop` (by request number)
+    short. HEAD requests get the (status, headers) in `heads`."""
+
+    def __init__(self, files, ranges=True):
+        super().__init__(("127.0.0.1", 0), RangeHandler)
+        self.files = files
+        self.ranges = ranges
+        self.requests = []
+        self.drop = set()
+        self.heads = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_address[1]}/{path}"
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        path = self.path.lstrip("/")
+        with self.server.lock:
+            self.server.requests.append(f"HEAD {path}")
+        status, headers = self.server.heads.get(path, (404, {}))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            number = len(server.requests)
+            server.requests.append(self.headers.get("Range"))
+        data = server.files.get(self.path.lstrip("/"))
+        if data is None:
+            self.send_error(404)
+            return
+
+        start, end, status = 0, len(data), 200
+        if server.ranges and self.headers.get("Range"):
+            first, last = (
+                self.headers["Range"].removeprefix("bytes=").split("-")
+            )
+            start, end, status = (
+                int(first),
+                int(last) + 1 if last else len(data),
+                206,
+            )
+        self.send_response(status)
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("ETag", '"v1"')
+        if status == 206:
+            self.send_header(
+                "Content-Range", f"bytes {start}-{end - 1}/{len(data)}"
+            )
+        self.end_headers()
+        body = data[start:end]
+        if number in server.drop:
+            body = body[: len(body) // 2]
+        self.wfile.write(body)
+
+
+def make_tarball(num_files=4, size=50_000):
+    rng = np.random.default_rng(0)
+    contents = {
+        f"regions/valencia/tile_{i}.bin": rng.bytes(size)
+        for i in range(num_files)
+    }
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, data in contents.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue(), contents
+
+
+@pytest.fixture
+def tarball():
+    data, contents = make_tarball()
+    server = FileServer({"valencia.tar.gz": data})
+    yield server, data, contents
+    server.shutdown()
+
+
+def test_fetch_parallel_ranges_and_extract(tmp_path, tarball):
+    server, data, contents = tarball
+    (tmp_path / "data" / "regions" / "uki").mkdir(parents=True)
+    checksum = f"md5:{hashlib.md5(data).hexdigest()}"
+
+    blob = fetch(
+        server.url("valencia.tar.gz"),
+        checksum,
+        cache_dir=tmp_path / "cache",
+        extract_dir=tmp_path / "data",
+        connections=4,
+        part_size=16_384,
+    )
+
+    assert blob.name == f"sha256-{hashlib.sha256(data).hexdigest()}"
+    assert blob.read_bytes() == data
+    for name, content in contents.items():
+        assert (tmp_path / "data" / name).read_bytes() == content
+    # extraction adds to the directory instead of replacing it
+    assert (tmp_path / "data" / "regions" / "uki").is_dir()
+    num_parts = -(-len(data) // 16_384)
+    assert len(server.requests) == 1 + num_parts
+
+    # cached: found by URL without touching the server
+    again = fetch(
+        server.url("valencia.tar.gz"), checksum, cache_dir=tmp_path / "cache"
+    )
+    assert again == blob and len(server.requests) == 1 + num_parts
+
+
+def test_fetch_resumes_interrupted_download(tmp_path, tarball):
+    server, data, _ = tarball
+    url = server.url("valencia.tar.gz")
+    num_parts = -(-len(data) // 16_384)
+
+    # the third part is cut short and not retried
+    server.drop = {3}
+    with pytest.raises(OSError):
+        fetch(
+            url,
+            cache_dir=tmp_path / "cache",
+            connections=1,
+            part_size=16_384,
+            retries=0,
+        )
+    state = json.loads(
+        next((tmp_path / "cache" / "partial").glob("*.json")).read_text()
+    )
+    assert state["done"] == [0, 1]
+
+    # only the parts that were not finished are fetched again
+    server.requests.clear()
+    server.drop = set()
+    blob = fetch(
+        url, cache_dir=tmp_path / "cache", connections=1, part_size=16_384
+    )
+    assert blob.read_bytes() == data
+    assert len(server.requests) == 1 + num_parts - 2
+    assert server.requests[1] == f"bytes={2 * 16_384}-{3 * 16_384 - 1}"
+    assert list((tmp_path / "cache" / "partial").iterdir()) == []
+
+
+def test_fetch_retries_dropped_connections(tmp_path, tarball):
+    server, data, _ = tarball
+    server.drop = {1, 2}
+
+    blob = fetch(
+        server.url("valencia.tar.gz"),
+        cache_dir=tmp_path / "cache",
+        connections=2,
+        part_size=16_384,
+    )
+
+    assert blob.read_bytes() == data
+
+
+def test_fetch_checksum_mismatch(tmp_path, tarball):
+    server, _, _ = tarball
+
+    with pytest.raises(ValueError, match="expected"):
+        fetch(
+            server.url("valencia.tar.gz"),
+            "sha256:" + "0" * 64,
+            cache_dir=tmp_path / "cache",
+            extract_dir=tmp_path / "data",
+        )
+
+    assert not (tmp_path / "cache" / "blobs").exists()
+    assert not (tmp_path / "data").exists()
+    assert list(tmp_path.iterdir()) == [tmp_path / "cache"]
+
+
+def test_fetch_not_a_tarball(tmp_path):
+    server = FileServer({"valencia.tar.gz": b"not a tarball" * 100})
+
+    with pytest.raises(tarfile.TarError):
+        fetch(
+            server.url("valencia.tar.gz"),
+            cache_dir=tmp_path / "cache",
+            extract_dir=tmp_path / "data",
+        )
+
+    # nothing is kept to resume from
+    assert list((tmp_path / "cache" / "partial").iterdir()) == []
+    assert not (tmp_path / "cache" / "blobs").exists()
+    server.shutdown()
+
+
+def test_fetch_without_ranges(tmp_path):
+    data, contents = make_tarball(num_files=2)
+    server = FileServer({"uki.tar.gz": data}, ranges=False)
+
+    fetch(
+        server.url("uki.tar.gz"),
+        cache_dir=tmp_path / "cache",
+        extract_dir=tmp_path / "data",
+    )
+
+    for name, content in contents.items():
+        assert (tmp_path / "data" / name).read_bytes() == content
+    server.shutdown()
+
+
+def test_zenodo_checksum():
+    record = {"files": [{"key": "valencia.tar.gz", "checksum": "md5:abc"}]}
+    server = FileServer({"api/records/1": json.dumps(record).encode()})
+
+    assert (
+        zenodo_checksum("valencia.tar.gz", server.url("api/records/1"))
+        == "md5:abc"
+    )
+    assert zenodo_checksum("uki.tar.gz", server.url("api/records/1")) is None
+    server.shutdown()
+
+
+def test_download_dataset_checks_cache_first(tmp_path, tarball, monkeypatch):
+    server, data, _ = tarball
+    published = {"valencia": f"md5:{hashlib.md5(data).hexdigest()}"}
+    lookups = []
+
+    def checksum(filename):
+        lookups.append(filename)
+        return published.get("valencia")
+
+    monkeypatch.setattr(
+        download, "dataset_url", lambda name: server.url("valencia.tar.gz")
+    )
+    monkeypatch.setattr(download, "zenodo_checksum", checksum)
+
+    blob = download_dataset("valencia", cache_dir=tmp_path / "cache")
+    assert blob.read_bytes() == data and len(lookups) == 1
+
+    # cached: neither Zenodo nor the file server is asked again
+    num_requests = len(server.requests)
+    assert download_dataset("valencia", cache_dir=tmp_path / "cache") == blob
+    assert len(lookups) == 1 and len(server.requests) == num_requests
+
+    # not cached, and no checksum to verify against
+    published.clear()
+    with pytest.raises(ValueError, match="no checksum"):
+        download_dataset("valencia", cache_dir=tmp_path / "other")
+    assert len(lookups) == 2
+
+
+def test_download_model(tmp_path, monkeypatch):
+    checkpoint, config = b"weights" * 1000, b"model: unet\n"
+    server = FileServer(
+        {"model/ckpt": checkpoint, "model/config.yaml": config}
+    )
+    git_sha1 = hashlib.sha1(b"blob %d\0" % len(config) + config).hexdigest()
+    server.heads = {
+        # LFS files redirect to the storage, with their sha256 in a header
+        "model/ckpt": (
+            302,
+            {
+                "Location": "/storage/ckpt",
+                "X-Linked-Etag": f'"{hashlib.sha256(checkpoint).hexdigest()}"',
+            },
+        ),
+        "model/config.yaml": (200, {"ETag": f'"{git_sha1}"'}),
+    }
+    monkeypatch.setattr(download, "MODEL_URL", server.url("model"))
+    monkeypatch.setattr(download, "MODEL_FILES", ("ckpt", "config.yaml"))
+
+    files = download_model(tmp_path / "model", cache_dir=tmp_path / "cache")
+    assert [f.read_bytes() for f in files] == [checkpoint, config]
+
+    # cached and verified: no checksum lookups or downloads
+    server.requests.clear()
+    download_model(tmp_path / "model", cache_dir=tmp_path / "cache")
+    assert server.requests == []
+
+    server.files["model/ckpt"] = b"tampered" * 1000
+    with pytest.raises(ValueError, match="expected"):
+        download_model(tmp_path / "other", cache_dir=tmp_path / "other_cache")
+    server.shutdown()
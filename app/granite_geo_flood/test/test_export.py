@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from granite_geo_flood import export
+from granite_geo_flood.export import export_artifact, load_artifact
+from granite_geo_flood.predictor import FloodPredictor
+
+
+class BufferModel(torch.nn.Module):
+    """stand-in model with a buffer outside the state dict"""
+
+    def __init__(self, bands=9, classes=2):
+        super().__init__()
+        self.head = torch.nn.Conv2d(bands, classes, 1)
+        self.register_buffer(
+            "bias", torch.ones(classes, 1, 1), persistent=False
+        )
+
+    def forward(self, x):
+        return SimpleNamespace(output=self.head(x) + self.bias)
+
+
+def stand_in_builder(model_class, built):
+    """`build_model` stand-in: seeded weights for a checkpoint, recording
+    the device of each model built"""
+
+    def build(config, checkpoint=None):
+        torch.manual_seed(0 if checkpoint else 1)
+        model = model_class().eval()
+        built.append(next(model.parameters()).device.type)
+        return model
+
+    return build
+
+
+def test_artifact_round_trip(
+    tmp_path, monkeypatch, config_file, make_predictor
+):
+    built = []
+    original = make_predictor()
+    model_class = type(original.model)
+    monkeypatch.setattr(
+        export, "build_model", stand_in_builder(model_class, built)
+    )
+
+    artifact = export_artifact(
+        config_file, "model.ckpt", tmp_path / "model.pt"
+    )
+    predictor = FloodPredictor.from_artifact(artifact)
+
+    # built once with the trained weights, then only on the meta device
+    assert built == ["cpu", "meta"]
+    assert not any(
+        p.is_meta or p.requires_grad for p in predictor.model.parameters()
+    )
+    assert predictor.config["model"]["init_args"]["aux_heads"] is None
+    batch = np.random.default_rng(0).random((2, 9, 16, 16), dtype=np.float32)
+    np.testing.assert_array_equal(
+        predictor.predict_proba(batch), original.predict_proba(batch)
+    )
+
+
+def test_load_artifact_rebuilds_for_buffers(
+    tmp_path, monkeypatch, config_file
+):
+    built = []
+    monkeypatch.setattr(
+        export, "build_model", stand_in_builder(BufferModel, built)
+    )
+
+    export_artifact(config_file, "model.ckpt", tmp_path / "model.pt")
+    _, model = load_artifact(tmp_path / "model.pt")
+
+    # the unsaved buffer is left on the meta device, so the model is built
+    # again
+    assert built == ["cpu", "meta", "cpu"]
+    assert model.bias.sum() == 2
+    torch.manual_seed(0)
+    torch.testing.assert_close(model.head.weight, BufferModel().head.weight)
@@ -0,0 +1,56 @@
+import json
+
+from granite_geo_flood.instrument import STAGES, Histogram, RunRecorder
+from granite_geo_flood.pipeline import run_pipeline
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in [0.05, 0.5, 0.7, 3.0]:
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [("0.1", 1), ("1", 3), ("+Inf", 4)]
+    assert histogram.count == 4 and histogram.sum == 4.25
+
+
+def test_run_pipeline_recorder(tmp_path, first_bands, write_tiles):
+    image_files = write_tiles(count=5)
+    metrics_dir = tmp_path / "metrics"
+
+    with RunRecorder(
+        metrics_dir / "events.jsonl",
+        metrics_dir / "inference.prom",
+        profiler="cprofile",
+        profile_tiles=[3],
+    ) as recorder:
+        run_pipeline(
+            first_bands,
+            image_files,
+            tmp_path / "out",
+            batch_size=2,
+            recorder=recorder,
+        )
+
+    events = [json.loads(line) for line in open(metrics_dir / "events.jsonl")]
+    tiles = [event for event in events if event["event"] == "tile"]
+    assert sorted(event["path"] for event in tiles) == sorted(
+        map(str, image_files)
+    )
+    for event in tiles:
+        assert event["shape"] == [9, 32, 32] and event["bytes_read"] > 0
+        assert all(event[f"{stage}_seconds"] >= 0 for stage in STAGES)
+    assert events[-1]["event"] == "run"
+    assert events[-1]["tiles"] == 5 and events[-1]["batches"] == 3
+
+    prom = (metrics_dir / "inference.prom").read_text()
+    assert "flood_inference_tiles_total 5" in prom
+    assert 'flood_inference_stage_seconds_count{stage="forward"} 5' in prom
+    assert (
+        'flood_inference_stage_seconds_bucket{stage="write",le="+Inf"} 5'
+        in prom
+    )
+
+    # tile 3 is predicted in the batch of tiles 2 and 3
+    assert [f.name for f in metrics_dir.glob("*.prof")] == [
+        "profile_tile_2.prof"
+    ]
@@ -0,0 +1,33 @@
+import numpy as np
+from global_land_mask import globe
+from rasterio.transform import from_origin
+
+from granite_geo_flood.utils.land_mask import LandMaskCache, pixel_centres
+
+# grid over the Valencia coast
+TRANSFORM = from_origin(-0.6, 39.5, 0.001, 0.001)
+SHAPE = (300, 400)
+
+
+def test_land_mask_matches_meshgrid_lookup():
+    x, y = pixel_centres(TRANSFORM, SHAPE)
+    lon_grid, lat_grid = np.meshgrid(x, y)
+    expected = globe.is_land(lat_grid, lon_grid)
+
+    mask = LandMaskCache().get("EPSG:4326", TRANSFORM, SHAPE)
+
+    np.testing.assert_array_equal(mask, expected)
+    assert 0 < mask.mean() < 1
+
+
+def test_land_mask_cache(tmp_path):
+    cache = LandMaskCache(maxsize=1, cache_dir=tmp_path)
+    mask = cache.get("EPSG:4326", TRANSFORM, SHAPE)
+    assert cache.get("EPSG:4326", TRANSFORM, SHAPE) is mask
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # evicted from memory by another grid, reloaded from disk
+    cache.get("EPSG:4326", TRANSFORM, (10, 10))
+    reloaded = cache.get("EPSG:4326", TRANSFORM, SHAPE)
+    assert reloaded is not mask
+    np.testing.assert_array_equal(reloaded, mask)
@@ -0,0 +1,99 @@
+import dask.array as da
+import numpy as np
+import pytest
+import rasterio
+import rioxarray
+from rasterio.transform import from_origin
+
+from granite_geo_flood.utils.helper import prep_valencia_images, scale_s2_image
+from granite_geo_flood.utils.land_mask import compute_land_mask
+from granite_geo_flood.utils.lazy import (
+    land_mask_lazy,
+    open_chunked,
+    prep_valencia_lazy,
+    prepare_scene,
+)
+
+# grid over the Valencia coast
+TRANSFORM = from_origin(-0.6, 39.5, 0.001, 0.001)
+SHAPE = (300, 400)
+
+
+@pytest.fixture
+def scene(tmp_path, write_raster):
+    rng = np.random.default_rng(0)
+    image = rng.normal(0.1, 0.1, (9, *SHAPE)).astype(np.float32)
+    pred = rng.integers(0, 2, (1, *SHAPE)).astype(np.int16)
+    return (
+        write_raster(tmp_path / "valencia_image.tif", image, TRANSFORM),
+        write_raster(tmp_path / "valencia_pred.tif", pred, TRANSFORM),
+    )
+
+
+def test_land_mask_lazy_matches_whole_grid(scene):
+    image_file, _ = scene
+    image = open_chunked(image_file, chunks=128)
+
+    mask = land_mask_lazy(image)
+
+    assert mask.chunks == ((128, 128, 44), (128, 128, 128, 16))
+    np.testing.assert_array_equal(
+        mask.to_numpy(), compute_land_mask("EPSG:4326", TRANSFORM, SHAPE)
+    )
+
+
+def test_prep_valencia_lazy_matches_eager(scene):
+    image_file, pred_file = scene
+    rgb_bands, vv_band = [4, 3, 2], 0
+
+    s1, s2, pred = prep_valencia_lazy(
+        open_chunked(image_file, chunks=128),
+        open_chunked(pred_file, chunks=128),
+        rgb_bands,
+        vv_band,
+    )
+    assert all(isinstance(array.data, da.Array) for array in (s1, s2, pred))
+
+    expected = prep_valencia_images(
+        rioxarray.open_rasterio(image_file),
+        rioxarray.open_rasterio(pred_file),
+        rgb_bands,
+        vv_band,
+    )
+    np.testing.assert_array_equal(s1.to_numpy(), expected[0])
+    np.testing.assert_array_equal(pred.to_numpy(), expected[2])
+    # the percentile is merged from the chunks, so the scaling is approximate
+    np.testing.assert_allclose(s2.to_numpy(), expected[1], rtol=0.02)
+
+
+def test_prepare_scene_clipped(tmp_path, scene):
+    image_file, pred_file = scene
+    bounds = (-0.5, 39.3, -0.3, 39.45)
+
+    files = prepare_scene(
+        image_file,
+        pred_file,
+        tmp_path / "prepared",
+        [4, 3, 2],
+        0,
+        bounds,
+        chunks=64,
+    )
+
+    with rasterio.open(files["s2"]) as src:
+        assert src.count == 3
+        assert np.allclose(src.bounds, bounds, atol=0.002)
+        assert src.read().min() >= 0
+        shape = src.shape
+    for name in ("s1", "pred"):
+        with rasterio.open(files[name]) as src:
+            assert src.shape == shape and src.count == 1
+
+
+def test_scale_s2_image_leaves_input():
+    image = np.array([[[-1.0, 2.0, 4.0]]])
+
+    scaled = scale_s2_image(image)
+
+    assert image[0, 0, 0] == -1.0
+    assert scaled.min() == 0
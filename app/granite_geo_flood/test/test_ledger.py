@@ -0,0 +1,72 @@
+from pathlib import Path
+
+from granite_geo_flood.ledger import RunLedger, config_hash, run_resumable
+
+
+class FakePredictor:
+    """writes a small output per tile, failing on tiles named bad"""
+
+    def __init__(self):
+        self.predicted = []
+
+    def predict_files(
+        self,
+        image_files,
+        output_dir,
+        batch_size=1,
+        shapes=None,
+        writer=None,
+        tile_filter=None,
+    ):
+        saved = []
+        for image_file in image_files:
+            if "bad" in Path(image_file).name:
+                raise ValueError("cannot decode")
+            save_file = Path(output_dir) / f"{Path(image_file).stem}_pred.tif"
+            save_file.write_bytes(b"pred")
+            saved.append(save_file)
+            self.predicted.append(Path(image_file).name)
+        return saved
+
+
+def test_run_resumable(tmp_path):
+    image_files = []
+    for name in ["a", "b", "bad", "c"]:
+        image_files.append(tmp_path / f"{name}.tif")
+        image_files[-1].write_bytes(name.encode())
+    shapes = [(9, 8, 8)] * len(image_files)
+    output_dir = tmp_path / "out"
+    ledger_file = output_dir / "run_ledger.jsonl"
+    output_dir.mkdir()
+
+    predictor = FakePredictor()
+    ledger = RunLedger(ledger_file, "model", config_hash({"a": 1}))
+    saved, failures = run_resumable(
+        predictor, image_files, output_dir, ledger, shapes=shapes
+    )
+    assert predictor.predicted == ["a.tif", "b.tif", "c.tif"]
+    assert saved[2] is None and [f for f, _ in failures] == [image_files[2]]
+
+    # interrupted while writing c, and b's input changed since
+    ledger.record([image_files[3]], [saved[3]], "started")
+    image_files[1].write_bytes(b"b changed")
+
+    predictor = FakePredictor()
+    ledger = RunLedger(ledger_file, "model", config_hash({"a": 1}))
+    assert saved[3].exists()
+    assert ledger.pending(image_files) == [1, 2, 3]
+    assert not saved[3].exists()
+    saved, failures = run_resumable(
+        predictor, image_files, output_dir, ledger, shapes=shapes
+    )
+    assert predictor.predicted == ["b.tif", "c.tif"]
+    assert (
+        len(failures) == 1
+        and ledger.records[str(image_files[2])]["attempts"] == 2
+    )
+
+    # a different model redoes everything
+    predictor = FakePredictor()
+    ledger = RunLedger(ledger_file, "new model", config_hash({"a": 1}))
+    run_resumable(predictor, image_files, output_dir, ledger, shapes=shapes)
+    assert predictor.predicted == ["a.tif", "b.tif", "c.tif"]
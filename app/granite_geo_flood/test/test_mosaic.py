@@ -0,0 +1,106 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from granite_geo_flood.mosaic import build_mosaic, build_mosaics, group_tiles
+
+RES = 0.0001
+
+
+@pytest.fixture
+def write_tile(write_raster):
+    """write a flood map [h x w] `row_off`, `col_off` pixels into the grid"""
+
+    def write(path, row_off, col_off, data, nodata=-1):
+        transform = from_origin(
+            -9.2 + col_off * RES, 53.7 - row_off * RES, RES, RES
+        )
+        return write_raster(path, data, transform, nodata=nodata)
+
+    return write
+
+
+@pytest.fixture
+def make_scene(tmp_path, write_tile):
+    def make(scene="EMSR1_AOI01_20240101", size=48, step=40):
+        """2 x 2 tiles overlapping by size - step pixels"""
+        rng = np.random.default_rng(0)
+        expected = np.full((size + step, size + step), -1, dtype=np.int16)
+        files = []
+        for row in range(2):
+            for col in range(2):
+                data = rng.integers(-1, 2, (size, size)).astype(np.int16)
+                files.append(
+                    tmp_path / f"{scene}_tile_{row}_{col}_image_pred.tif"
+                )
+                write_tile(files[-1], row * step, col * step, data)
+                region = expected[
+                    row * step : row * step + size,
+                    col * step : col * step + size,
+                ]
+                np.maximum(region, data, out=region)
+        return files, expected
+
+    return make
+
+
+def test_group_tiles(tmp_path, make_scene, write_tile):
+    files, _ = make_scene()
+    other, _ = make_scene(scene="EMSR2_AOI03_20240202")
+    loose = tmp_path / "loose_pred.tif"
+    write_tile(loose, 0, 0, np.zeros((8, 8), dtype=np.int16))
+
+    scenes = group_tiles(files + other + [loose])
+
+    assert scenes["EMSR1_AOI01_20240101"] == sorted(files)
+    assert scenes["EMSR2_AOI03_20240202"] == sorted(other)
+    assert scenes["4326_0.0001_0.0001"] == [loose]
+
+
+def test_build_mosaic(tmp_path, make_scene):
+    files, expected = make_scene()
+
+    save_file = build_mosaic(files, tmp_path / "mosaic.tif", blocksize=16)
+
+    with rasterio.open(save_file) as src:
+        assert src.dtypes[0] == "int8" and src.nodata == -1
+        assert src.transform == from_origin(-9.2, 53.7, RES, RES)
+        np.testing.assert_array_equal(src.read(1), expected)
+
+
+def test_build_mosaic_memory(tmp_path, make_scene):
+    files, expected = make_scene(size=480, step=400)
+    build_mosaic(files[:1], tmp_path / "warm_up.tif")
+
+    tracemalloc.start()
+    build_mosaic(files, tmp_path / "mosaic.tif", blocksize=64)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # arrays held at once are about a block, far less than the int8 mosaic
+    assert peak < expected.size / 4
+
+
+def test_build_mosaics_vrt_matches_last(tmp_path, make_scene):
+    files, _ = make_scene()
+
+    mosaics = build_mosaics(files, tmp_path / "out", overlap="last")
+
+    vrt_file, cog_file = mosaics["EMSR1_AOI01_20240101"]
+    with rasterio.open(vrt_file) as vrt, rasterio.open(cog_file) as cog:
+        np.testing.assert_array_equal(vrt.read(1), cog.read(1))
+
+
+def test_build_mosaic_rejects_misaligned(tmp_path, write_tile):
+    write_tile(
+        tmp_path / "a_tile_0_0_pred.tif", 0, 0, np.zeros((8, 8), np.int16)
+    )
+    write_tile(
+        tmp_path / "a_tile_0_1_pred.tif", 0, 7.5, np.zeros((8, 8), np.int16)
+    )
+
+    with pytest.raises(ValueError, match="aligned"):
+        build_mosaic(sorted(tmp_path.glob("*.tif")), tmp_path / "mosaic.tif")
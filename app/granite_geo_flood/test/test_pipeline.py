@@ -0,0 +1,67 @@
+import threading
+
+import numpy as np
+import rasterio
+
+from granite_geo_flood.pipeline import run_pipeline
+
+
+def test_run_pipeline(tmp_path, first_bands, write_tiles):
+    image_files = write_tiles(sizes=[32, 32, 48, 32, 48])
+    expected = []
+    for image_file in image_files:
+        with rasterio.open(image_file) as src:
+            expected.append(
+                first_bands.preprocess(src.read())[:2].argmax(axis=0)
+            )
+
+    saved, stats = run_pipeline(
+        first_bands,
+        image_files,
+        tmp_path / "out",
+        batch_size=2,
+        num_readers=2,
+        queue_depth=1,
+    )
+
+    assert stats.tiles == 5 and stats.batches == 3
+    assert stats.bound in ("io", "compute")
+    for save_file, image_file, pred in zip(saved, image_files, expected):
+        assert save_file.name == f"{image_file.stem}_pred.tif"
+        with rasterio.open(save_file) as src:
+            np.testing.assert_array_equal(src.read(1), pred)
+
+
+def test_run_pipeline_model_error(tmp_path, first_bands, write_tiles):
+    image_files = write_tiles(count=8)
+    runtime = first_bands.runtime
+
+    def fail_second_batch(batch):
+        if runtime.batch_sizes:
+            raise RuntimeError("out of memory")
+        return runtime(batch)
+
+    first_bands.runtime = fail_second_batch
+    threads = threading.active_count()
+    errors = []
+
+    def run():
+        try:
+            run_pipeline(
+                first_bands,
+                image_files,
+                tmp_path / "out",
+                num_readers=2,
+                queue_depth=1,
+            )
+        except RuntimeError as e:
+            errors.append(e)
+
+    # more batches than the queues hold, so readers are blocked when it fails
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+
+    assert not thread.is_alive() and str(errors[0]) == "out of memory"
+    assert threading.active_count() == threads
+    assert len(list((tmp_path / "out").iterdir())) == 1
@@ -0,0 +1,33 @@
+import pytest
+import torch
+
+from granite_geo_flood.precision import apply_precision, guard_precision
+
+
+def test_apply_precision(make_predictor):
+    model = make_predictor("pixel").model
+    assert apply_precision(model, "bf16") is model
+
+    quantized = apply_precision(model, "int8-dynamic")
+    assert isinstance(quantized.head, torch.ao.nn.quantized.dynamic.Linear)
+    assert isinstance(model.head, torch.nn.Linear)
+
+    with pytest.raises(ValueError):
+        apply_precision(model, "fp8")
+
+
+@pytest.mark.parametrize("precision", ["bf16", "int8-dynamic"])
+def test_guard_precision(make_predictor, write_tiles, precision):
+    predictor = make_predictor("pixel")
+    image_files = write_tiles()
+
+    candidate, metrics = guard_precision(
+        predictor, precision, image_files, tolerance=0.2
+    )
+
+    assert candidate.precision == precision and predictor.precision == "fp32"
+    assert metrics["fp32"]["mIoU"] == pytest.approx(1.0)
+    assert metrics[precision]["mIoU"] >= 0.8
+
+    with pytest.raises(ValueError, match="refused"):
+        guard_precision(predictor, precision, image_files, tolerance=-1.0)
@@ -0,0 +1,47 @@
+import numpy as np
+import rasterio
+
+from granite_geo_flood.predictor import read_image
+
+
+def test_predict(make_predictor):
+    predictor = make_predictor()
+    batch = np.random.default_rng(0).random((3, 9, 16, 16), dtype=np.float32)
+
+    preds = predictor.predict(batch)
+
+    assert preds.shape == (3, 16, 16) and preds.dtype == np.int16
+    np.testing.assert_array_equal(predictor.predict(batch[1]), preds[1])
+    probs = predictor.predict_proba(batch)
+    np.testing.assert_allclose(probs.sum(axis=1), 1, rtol=1e-5)
+    np.testing.assert_array_equal(probs.argmax(axis=1), preds)
+
+
+def test_predict_files(tmp_path, make_predictor, write_tiles):
+    predictor = make_predictor()
+    # shapes alternate, so batches are not runs of the input order
+    image_files = write_tiles(sizes=[32, 48, 32, 48, 32])
+    expected = [
+        predictor.predict(read_image(image_file)[0])
+        for image_file in image_files
+    ]
+
+    saved = predictor.predict_files(
+        image_files, tmp_path / "out", batch_size=2
+    )
+
+    assert [save_file.name for save_file in saved] == [
+        f"tile_{i}_image_pred.tif" for i in range(5)
+    ]
+    for save_file, image_file, pred in zip(saved, image_files, expected):
+        with rasterio.open(save_file) as src, rasterio.open(image_file) as ref:
+            assert src.crs == ref.crs and src.transform == ref.transform
+            assert src.dtypes[0] == "int16" and src.nodata == -1
+            np.testing.assert_array_equal(src.read(1), pred)
+
+    preds = predictor.predict_files(image_files, batch_size=3)
+    assert [pred.shape for pred in preds] == [(32, 32), (48, 48)] * 2 + [
+        (32, 32)
+    ]
+    for pred, expected_pred in zip(preds, expected):
+        np.testing.assert_array_equal(pred, expected_pred)
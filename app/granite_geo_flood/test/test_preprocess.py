@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from granite_geo_flood.preprocess import Preprocessor, naive_preprocess
+
+BAND_INDICES = [2, 3, 4, 5, 6, 7, 0, 1, 8]
+MEANS = np.linspace(-0.002, 0.17, 9, dtype=np.float32)
+STDS = np.linspace(0.0001, 0.19, 9, dtype=np.float32)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float16])
+def test_preprocessor_matches_naive(dtype):
+    rng = np.random.default_rng(0)
+    images = rng.random((2, 9, 32, 32), dtype=np.float32) * 3000
+    images[:, :, :4] = np.nan
+
+    preprocessor = Preprocessor(BAND_INDICES, 0.0001, MEANS, STDS, dtype=dtype)
+    out = preprocessor.allocate(images.shape)
+    result = preprocessor(images, out=out)
+
+    expected = np.stack(
+        [
+            naive_preprocess(image, BAND_INDICES, 0.0001, MEANS, STDS)
+            for image in images
+        ]
+    )
+    assert result is out
+    assert result.dtype == dtype
+    np.testing.assert_allclose(
+        result, expected.astype(dtype), rtol=1e-3, atol=1e-3
+    )
+
+
+def test_preprocessor_checks_bands(config):
+    preprocessor = Preprocessor.from_config(config)
+    with pytest.raises(ValueError, match="Expected images with 9 bands"):
+        preprocessor(np.ones((4, 8, 8), dtype=np.float32))
+    with pytest.raises(ValueError, match="got 10"):
+        preprocessor(np.ones((2, 10, 8, 8), dtype=np.float32))
+
+    # without a dataset band count, images need every selected band
+    preprocessor = Preprocessor(BAND_INDICES, 0.0001, MEANS, STDS)
+    with pytest.raises(ValueError, match="Expected images with 9 bands"):
+        preprocessor(np.ones((8, 8, 8), dtype=np.float32))
+    assert preprocessor(np.ones((10, 8, 8), dtype=np.float32)).shape[0] == 9
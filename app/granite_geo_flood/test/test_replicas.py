@@ -0,0 +1,64 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import numpy as np
+import pytest
+import rasterio
+
+from granite_geo_flood import replicas
+from granite_geo_flood.predictor import FloodPredictor, read_image
+from granite_geo_flood.replicas import core_slices, run_replicas
+
+CORES = sorted(os.sched_getaffinity(0))
+
+
+def fail_to_load():
+    raise RuntimeError("no checkpoint")
+
+
+def test_core_slices():
+    assert core_slices(1, len(CORES)) == [CORES]
+    if len(CORES) >= 2:
+        assert core_slices(2, 1) == [CORES[:1], CORES[1:2]]
+
+    with pytest.raises(ValueError, match=f"needs {len(CORES) + 1} cores"):
+        core_slices(len(CORES) + 1, 1)
+    with pytest.raises(ValueError):
+        core_slices(2, 0)
+
+
+@pytest.fixture
+def shared_cores(monkeypatch):
+    """every replica on the first core, so that two fit on any machine"""
+    monkeypatch.setattr(
+        replicas, "core_slices", lambda n, threads: [CORES[:1]] * n
+    )
+
+
+def test_run_replicas(tmp_path, make_predictor, write_tiles, shared_cores):
+    predictor = make_predictor()
+    image_files = write_tiles(sizes=[32, 48, 32, 48, 32])
+    loader = partial(
+        FloodPredictor.from_model, predictor.config, predictor.model
+    )
+
+    saved = run_replicas(
+        image_files, tmp_path / "out", 2, 1, batch_size=2, loader=loader
+    )
+
+    assert [f.name for f in saved] == [
+        f"{f.stem}_pred.tif" for f in image_files
+    ]
+    for save_file, image_file in zip(saved, image_files):
+        with rasterio.open(save_file) as src:
+            expected = predictor.predict(read_image(image_file)[0])
+            np.testing.assert_array_equal(src.read(1), expected)
+
+
+def test_run_replicas_fails_to_load(tmp_path, write_tiles, shared_cores):
+    # a replica that cannot load stops the run instead of being restarted
+    with pytest.raises(BrokenProcessPool):
+        run_replicas(
+            write_tiles(), tmp_path / "out", 2, 1, loader=fail_to_load
+        )
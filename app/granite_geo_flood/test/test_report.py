@@ -0,0 +1,73 @@
+import matplotlib.pyplot as plt
+import numpy as np
+
+from granite_geo_flood import report
+from granite_geo_flood.report import render_report, render_tile
+
+
+def make_tiles(tmp_path, write_raster, count=3, size=96):
+    rng = np.random.default_rng(0)
+    for name in ("good", "bad"):
+        (tmp_path / name).mkdir()
+    image_files = []
+    for i in range(count):
+        stem = f"EMSR1_AOI01_tile_{i}"
+        image_files.append(tmp_path / f"{stem}_image.tif")
+        write_raster(
+            image_files[-1], rng.random((9, size, size), dtype=np.float32)
+        )
+        label = rng.integers(-1, 2, (1, size, size)).astype(np.int16)
+        write_raster(tmp_path / f"{stem}_label.tif", label, nodata=-1)
+        write_raster(
+            tmp_path / "good" / f"{stem}_image_pred.tif", label, nodata=-1
+        )
+        write_raster(
+            tmp_path / "bad" / f"{stem}_image_pred.tif",
+            1 - label.clip(0),
+            nodata=-1,
+        )
+    return image_files
+
+
+def test_render_tile_reuses_figure(tmp_path, write_raster):
+    image_files = make_tiles(tmp_path, write_raster, count=2)
+
+    rows, figures = [], []
+    for i, image_file in enumerate(image_files):
+        rows.append(
+            render_tile(
+                image_file,
+                str(image_file).replace("_image.tif", "_label.tif"),
+                {"good": tmp_path / "good" / f"{image_file.stem}_pred.tif"},
+                tmp_path / f"{i}.png",
+                max_size=32,
+            )
+        )
+        figures.append(report._figure)
+
+    assert figures[0] is figures[1] and plt.get_fignums() == []
+    assert all((tmp_path / f"{i}.png").stat().st_size > 0 for i in range(2))
+    assert (
+        np.trace(rows[0]["matrices"]["good"])
+        == rows[0]["matrices"]["good"].sum()
+    )
+
+
+def test_render_report(tmp_path, write_raster):
+    image_files = make_tiles(tmp_path, write_raster)
+
+    index_file = render_report(
+        image_files,
+        {"good": tmp_path / "good", "bad": tmp_path / "bad"},
+        tmp_path / "report",
+        num_workers=2,
+        max_size=32,
+    )
+
+    page = index_file.read_text()
+    assert (
+        "<tr><td>all</td><td>1.0000</td><td>1.0000</td>"
+        "<td>0.0000</td><td>0.0000</td></tr>" in page
+    )
+    assert page.count("<img") == 3
+    assert len(list((tmp_path / "report").glob("*_quicklook.png"))) == 3
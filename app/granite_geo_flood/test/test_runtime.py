@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from granite_geo_flood.predictor import FloodPredictor
+from granite_geo_flood.runtime import (
+    OnnxRuntime,
+    TorchScriptRuntime,
+    check_parity,
+    example_batch,
+    export_onnx,
+    export_torchscript,
+    load_predictor,
+)
+
+
+@pytest.fixture
+def predictor(make_predictor):
+    return make_predictor()
+
+
+def test_torchscript(tmp_path, predictor):
+    model_file = export_torchscript(
+        predictor, tmp_path / "model.ts", tile_size=32
+    )
+
+    runtime = TorchScriptRuntime(model_file)
+    assert runtime.config == predictor.config
+
+    compiled = FloodPredictor.from_runtime(runtime)
+    batch = example_batch(predictor, 3, 32).numpy()
+    parity = check_parity(predictor, compiled, batch, atol=1e-5)
+    assert parity["class_agreement"] == 1.0
+    assert compiled.predict(np.ones((9, 32, 32), dtype=np.float32)).shape == (
+        32,
+        32,
+    )
+
+    with pytest.raises(ValueError):
+        compiled.with_precision("bf16")
+
+
+@pytest.mark.parametrize("batch_size", [None, 2])
+def test_onnx(tmp_path, predictor, batch_size):
+    pytest.importorskip("onnxruntime")
+    model_file = export_onnx(
+        predictor, tmp_path / "model.onnx", batch_size, tile_size=32
+    )
+
+    runtime = OnnxRuntime(model_file)
+    assert runtime.config == predictor.config
+
+    batch = example_batch(predictor, batch_size or 3, 32).numpy()
+    check_parity(
+        predictor, FloodPredictor.from_runtime(runtime), batch, atol=1e-4
+    )
+
+
+def test_check_parity_refuses_mismatch(predictor, make_predictor):
+    other = make_predictor(seed=1)
+
+    with pytest.raises(ValueError, match="differ"):
+        check_parity(predictor, other, example_batch(predictor, 1, 16).numpy())
+
+    with pytest.raises(ValueError):
+        load_predictor("tensorrt", "model.plan")
+
+
+@pytest.mark.parametrize(
+    "args,error",
+    [
+        (["--runtime", "onnxruntime"], "needs --runtime_model"),
+        (["--runtime", "torchscript"], "needs --runtime_model"),
+        (["--runtime_model", "model.onnx"], "needs --runtime torchscript"),
+    ],
+)
+def test_run_inference_runtime_model(run_inference, args, error):
+    result = run_inference(*args)
+    assert result.returncode == 2 and error in result.stderr
@@ -0,0 +1,36 @@
+import numpy as np
+
+from granite_geo_flood.scan import readable_files, scan_directory
+
+
+def image_with_nan_rows(nan_rows=0):
+    image = np.ones((9, 32, 32), dtype=np.float32)
+    image[:, :nan_rows] = np.nan
+    return image
+
+
+def test_scan_directory(tmp_path, write_raster):
+    write_raster(tmp_path / "a_image.tif", image_with_nan_rows(8))
+    write_raster(tmp_path / "b_image.tif", image_with_nan_rows())
+    (tmp_path / "c_image.tif").write_bytes(b"not a tiff")
+    manifest = tmp_path / "out" / "manifest.json"
+
+    entries = scan_directory(tmp_path, manifest_file=manifest, nan_sample=16)
+
+    assert [e["bands"] for e in entries[:2]] == [9, 9]
+    assert entries[0]["nan_fraction"] == 0.25
+    assert entries[1]["nan_fraction"] == 0
+    assert "error" in entries[2]
+    assert readable_files(entries) == [e["path"] for e in entries[:2]]
+
+    # unchanged files come from the manifest, changed ones are scanned again
+    write_raster(tmp_path / "b_image.tif", image_with_nan_rows(16))
+    rescanned = scan_directory(tmp_path, manifest_file=manifest, nan_sample=16)
+    assert rescanned[0] == entries[0]
+    assert rescanned[1]["nan_fraction"] == 0.5
+
+    # a different sample size is a different scan
+    resampled = scan_directory(tmp_path, manifest_file=manifest, nan_sample=8)
+    assert resampled[0]["nan_sample"] == 8 and rescanned[0]["nan_sample"] == 16
+    unsampled = scan_directory(tmp_path, manifest_file=manifest)
+    assert "nan_fraction" not in unsampled[0]
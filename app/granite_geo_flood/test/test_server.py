@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+import rasterio
+from aiohttp import test_utils
+from rasterio.io import MemoryFile
+
+from granite_geo_flood.loadgen import generate_load
+from granite_geo_flood.server import create_app
+
+
+class ThresholdPredictor:
+    """stand-in model: water where the first band is above 0.5. Records the
+    batch sizes it is called with."""
+
+    def __init__(self, config, delay=0.0):
+        self.config = config
+        self.delay = delay
+        self.batch_sizes = []
+
+    def predict(self, array):
+        time.sleep(self.delay)
+        self.batch_sizes.append(len(array))
+        return (array[:, 0] > 0.5).astype(np.int16)
+
+
+def serve(predictor, test, **kwargs):
+    """run `test(client)` against the service once it is ready"""
+
+    async def run():
+        app = create_app(lambda: predictor, warmup_size=16, **kwargs)
+        async with test_utils.TestClient(test_utils.TestServer(app)) as client:
+            while (await client.get("/readyz")).status != 200:
+                await asyncio.sleep(0.01)
+            await test(client)
+
+    asyncio.run(run())
+
+
+def test_predict_mask_and_stats(tmp_path, config, write_raster):
+    image = np.random.default_rng(0).random((9, 32, 32), dtype=np.float32)
+    tile = write_raster(tmp_path / "tile_image.tif", image)
+    short = write_raster(tmp_path / "short_image.tif", image[:4])
+    predictor = ThresholdPredictor(config)
+    with rasterio.open(tile) as src:
+        transform = src.transform
+
+    async def test(client):
+        response = await client.post("/predict", data=tile.read_bytes())
+        assert response.status == 200
+        with MemoryFile(
+            await response.read()
+        ) as memfile, memfile.open() as src:
+            assert src.transform == transform and src.crs == "EPSG:4326"
+            np.testing.assert_array_equal(src.read(1), image[0] > 0.5)
+
+        response = await client.post(
+            "/predict", params={"output": "stats"}, json={"path": tile.name}
+        )
+        stats = await response.json()
+        assert stats["water_pixels"] == (image[0] > 0.5).sum()
+        # 0.0001 degree pixels at 53.7 N are about 11.1 m x 6.6 m
+        pixel_km2 = 0.0111 * 0.0066
+        assert stats["water_km2"] == pytest.approx(
+            stats["water_pixels"] * pixel_km2, rel=0.02
+        )
+
+        response = await client.post(
+            "/predict", json={"path": "../secret.tif"}
+        )
+        assert response.status == 404
+        response = await client.post("/predict", data=b"not a tiff")
+        assert response.status == 400
+        response = await client.post("/predict", data=short.read_bytes())
+        assert response.status == 400
+        for body in [{"file": tile.name}, {"path": 3}, [tile.name]]:
+            response = await client.post("/predict", json=body)
+            assert response.status == 400
+        response = await client.post(
+            "/predict", data=b"{", headers={"Content-Type": "application/json"}
+        )
+        assert response.status == 400
+
+    serve(predictor, test, data_dir=tmp_path)
+
+
+def test_micro_batching(tmp_path, config, write_raster):
+    image = np.random.default_rng(0).random((9, 32, 32), dtype=np.float32)
+    tile = write_raster(tmp_path / "tile_image.tif", image)
+    predictor = ThresholdPredictor(config, delay=0.05)
+
+    async def test(client):
+        url = str(client.make_url("")).rstrip("/")
+        stats = await generate_load(url, tile, num_requests=16, concurrency=8)
+        assert stats["errors"] == {}
+        assert stats["latency_p50_seconds"] <= stats["latency_p99_seconds"]
+
+    serve(predictor, test, max_batch_size=8, max_delay=0.05)
+
+    # warm-up, then requests sent together share forward passes
+    assert sum(predictor.batch_sizes[1:]) == 16
+    assert max(predictor.batch_sizes[1:]) > 1
+
+
+def test_timeout_and_readiness(tmp_path, config, write_raster):
+    tile = write_raster(
+        tmp_path / "tile_image.tif", np.zeros((9, 16, 16), np.float32)
+    )
+
+    async def test(client):
+        assert (await client.get("/healthz")).status == 200
+        response = await client.post("/predict", data=tile.read_bytes())
+        assert response.status == 504
+
+    serve(ThresholdPredictor(config, delay=0.3), test, timeout=0.1)
+
+    def fail():
+        raise RuntimeError("no checkpoint")
+
+    async def check_failed():
+        async with test_utils.TestClient(
+            test_utils.TestServer(create_app(fail))
+        ) as client:
+            await asyncio.sleep(0.1)
+            response = await client.get("/readyz")
+            assert response.status == 503
+            assert (await response.json())["error"] == "no checkpoint"
+            assert (await client.post("/predict", data=b"")).status == 503
+
+    asyncio.run(check_failed())
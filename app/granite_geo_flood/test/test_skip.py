@@ -0,0 +1,140 @@
+import json
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from granite_geo_flood.instrument import RunRecorder
+from granite_geo_flood.pipeline import run_pipeline
+from granite_geo_flood.skip import OCEAN_STEP, TileFilter
+from granite_geo_flood.utils.land_mask import compute_land_mask
+
+LAND = from_origin(-0.5, 39.45, 0.0001, 0.0001)
+OCEAN = from_origin(0.2, 39.2, 0.0001, 0.0001)
+
+
+def write_tiles(tmp_path, write_raster, size=32):
+    """a land, an ocean, a nodata and a cloudy tile, in that order. The
+    first two model bands (BLUE, GREEN) make land dry for `first_bands`."""
+    rng = np.random.default_rng(0)
+    land = rng.random((9, size, size), dtype=np.float32)
+    land[2], land[3], land[8] = 1, 0, 0
+    nodata = np.full_like(land, np.nan)
+    nodata[8] = 0
+    cloud = land.copy()
+    cloud[8] = 1
+    tiles = [(land, LAND), (land, OCEAN), (nodata, LAND), (cloud, LAND)]
+    return [
+        write_raster(tmp_path / f"tile_{i}_image.tif", image, transform)
+        for i, (image, transform) in enumerate(tiles)
+    ]
+
+
+def read_preds(saved):
+    preds = []
+    for save_file in saved:
+        with rasterio.open(save_file) as src:
+            preds.append(src.read(1))
+    return preds
+
+
+def test_tile_filter_thresholds(config):
+    tile_filter = TileFilter.from_config(config, max_cloud=0.9)
+    image = np.ones((9, 10, 10), dtype=np.float32)
+    image[8] = 0
+    image[:, :, :5] = np.nan
+    profile = {"crs": "EPSG:4326", "transform": OCEAN}
+
+    _, fractions = tile_filter.fractions(image, profile)
+    assert fractions == {"nodata": 0.5, "ocean": 1.0, "cloud": 0.0}
+
+    reason, pred = tile_filter(image, profile)
+    assert reason == "ocean"
+    np.testing.assert_array_equal(pred[:, :5], -1)
+    np.testing.assert_array_equal(pred[:, 5:], 1)
+
+    # half cloud is under the threshold, and land is predicted
+    image[8, :, 5:8] = 1
+    profile["transform"] = LAND
+    assert tile_filter(image, profile) == (None, None)
+    assert tile_filter.checked == 2 and tile_filter.skipped["ocean"] == 1
+
+
+def test_ocean_fraction_samples_pixel_centres():
+    # across the Valencia coastline
+    transform = from_origin(-0.35, 39.5, 0.001, 0.001)
+    nodata = np.zeros((200, 200), dtype=bool)
+
+    sampled = TileFilter._ocean_fraction(
+        "EPSG:4326", transform, nodata, OCEAN_STEP
+    )
+
+    land = compute_land_mask("EPSG:4326", transform, nodata.shape)
+    assert 0 < sampled < 1
+    assert sampled == 1 - land[::OCEAN_STEP, ::OCEAN_STEP].mean()
+
+
+def test_run_pipeline_skips_tiles(tmp_path, caplog, first_bands, write_raster):
+    image_files = write_tiles(tmp_path, write_raster)
+    tile_filter = TileFilter.from_config(first_bands.config, max_cloud=0.95)
+
+    with caplog.at_level("INFO", logger="granite_geo_flood.skip"):
+        with RunRecorder(
+            tmp_path / "events.jsonl", tmp_path / "inference.prom"
+        ) as recorder:
+            saved, stats = run_pipeline(
+                first_bands,
+                image_files,
+                tmp_path / "out",
+                batch_size=4,
+                num_readers=1,
+                recorder=recorder,
+                tile_filter=tile_filter,
+            )
+
+    land, ocean, nodata, cloud = read_preds(saved)
+    assert first_bands.runtime.batch_sizes == [1]
+    assert (land == 0).all() and (ocean == 1).all()
+    assert (nodata == -1).all() and (cloud == -1).all()
+    assert stats.tiles == 4 and stats.skipped == 3
+    assert tile_filter.skipped == {"nodata": 1, "ocean": 1, "cloud": 1}
+    assert len(caplog.records) == 3
+
+    events = [
+        json.loads(line)
+        for line in (tmp_path / "events.jsonl").read_text().splitlines()
+    ]
+    skips = {
+        event["path"]: event["reason"]
+        for event in events
+        if event["event"] == "skip"
+    }
+    assert skips == {
+        str(image_files[1]): "ocean",
+        str(image_files[2]): "nodata",
+        str(image_files[3]): "cloud",
+    }
+    assert events[-1]["tiles"] == 4 and events[-1]["skipped"] == 3
+    # only the predicted tile went through the model
+    prom = (tmp_path / "inference.prom").read_text()
+    assert 'flood_inference_stage_seconds_count{stage="read"} 4' in prom
+    assert 'flood_inference_stage_seconds_count{stage="forward"} 1' in prom
+
+
+def test_predict_files_skips_tiles(tmp_path, first_bands, write_raster):
+    image_files = write_tiles(tmp_path, write_raster)
+
+    preds = first_bands.predict_files(
+        image_files,
+        batch_size=4,
+        tile_filter=TileFilter.from_config(first_bands.config),
+    )
+
+    # cloud skipping is off by default
+    assert first_bands.runtime.batch_sizes == [2]
+    assert [np.unique(pred).tolist() for pred in preds] == [
+        [0],
+        [1],
+        [-1],
+        [0],
+    ]
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from granite_geo_flood.tiling import predict_scene, window_offsets
+
+
+class PixelwisePredictor:
+    """stand-in model whose logits are the first two bands of the image"""
+
+    def preprocess(self, image):
+        return np.nan_to_num(image[:2])
+
+    def forward(self, batch):
+        return batch.copy()
+
+
+@pytest.mark.parametrize(
+    "length,window,stride,expected",
+    [
+        (512, 512, 448, [0]),
+        (300, 512, 448, [0]),
+        (1000, 512, 448, [0, 448, 488]),
+        (960, 512, 448, [0, 448]),
+    ],
+)
+def test_window_offsets(length, window, stride, expected):
+    assert window_offsets(length, window, stride) == expected
+
+
+@pytest.mark.parametrize("stride", [0, -88])
+def test_window_offsets_bad_stride(stride):
+    # before, a negative stride left all but the last window out
+    with pytest.raises(ValueError, match="stride must be positive"):
+        window_offsets(2000, 512, stride)
+
+
+@pytest.mark.parametrize("overlap", [512, 600, -1])
+def test_bad_overlap(tmp_path, overlap, run_inference):
+    with pytest.raises(ValueError, match="less than the window size"):
+        predict_scene(
+            PixelwisePredictor(),
+            tmp_path / "in.tif",
+            tmp_path / "out.tif",
+            window=512,
+            overlap=overlap,
+        )
+
+    result = run_inference(
+        "--sliding_window", "--window_size", 512, "--overlap", overlap
+    )
+    assert result.returncode == 2
+    assert "--overlap must be at least 0" in result.stderr
+
+
+@pytest.mark.parametrize("shape", [(200, 300), (90, 70)])
+def test_predict_scene(tmp_path, shape):
+    rng = np.random.default_rng(0)
+    image = rng.random((3, *shape), dtype=np.float32)
+    transform = from_origin(-9.2, 53.7, 0.0001, 0.0001)
+    image_file = tmp_path / "scene.tif"
+    with rasterio.open(
+        image_file,
+        "w",
+        driver="GTiff",
+        width=shape[1],
+        height=shape[0],
+        count=3,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=transform,
+    ) as dst:
+        dst.write(image)
+
+    save_file = predict_scene(
+        PixelwisePredictor(),
+        image_file,
+        tmp_path / "scene_pred.tif",
+        window=64,
+        overlap=16,
+        batch_size=3,
+        panel_windows=2,
+    )
+
+    with rasterio.open(save_file) as src:
+        assert src.crs.to_epsg() == 4326
+        assert src.transform == transform
+        pred = src.read(1)
+
+    np.testing.assert_array_equal(pred, image[:2].argmax(axis=0))
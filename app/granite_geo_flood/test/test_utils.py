@@ -1,28 +1,87 @@
+import numpy as np
 import pytest
 import torch
+from tifffile import imwrite
+from torchmetrics.classification import MulticlassJaccardIndex
 
-from granite_geo_flood.utils.helper import calc_f1, calc_miou
+from granite_geo_flood.utils.helper import calc_f1, calc_metrics, calc_miou
+from granite_geo_flood.utils.metrics import ConfusionMatrix
 
+MIOU_CASES = [
+    (torch.tensor([0, 0, 1, 1]), torch.tensor([0, 0, 0, 0]), 0.25),
+    (torch.tensor([-1, 1, 1, 1]), torch.tensor([-1, 0, 0, -1]), 0),
+    (torch.tensor([[-1, 0], [1, -1]]), torch.tensor([[-1, 0], [1, -1]]), 1),
+]
+F1_CASES = [
+    (torch.tensor([0, 0, 1, 1]), torch.tensor([0, 0, 0, 0]), 0.5),
+    (torch.tensor([[-1, 0], [1, 0]]), torch.tensor([[-1, 0], [1, 0]]), 1),
+    (torch.tensor([[-1, 0], [0, 0]]), torch.tensor([[-1, 0], [1, 1]]), 1 / 3),
+]
 
-@pytest.mark.parametrize(
-    "truth,pred,expected",
-    [
-        (torch.tensor([0, 0, 1, 1]), torch.tensor([0, 0, 0, 0]), 0.25),
-        (torch.tensor([-1, 1, 1, 1]), torch.tensor([-1, 0, 0, -1]), 0),
-        (torch.tensor([[-1, 0], [1, -1]]), torch.tensor([[-1, 0], [1, -1]]), 1),
-    ],
-)
+
+@pytest.mark.parametrize("truth,pred,expected", MIOU_CASES)
 def test_calc_miou(truth, pred, expected):
     assert calc_miou(truth, pred) == expected
 
 
-@pytest.mark.parametrize(
-    "truth,pred,expected",
-    [
-        (torch.tensor([0, 0, 1, 1]), torch.tensor([0, 0, 0, 0]), 0.5),
-        (torch.tensor([[-1, 0], [1, 0]]), torch.tensor([[-1, 0], [1, 0]]), 1),
-        (torch.tensor([[-1, 0], [0, 0]]), torch.tensor([[-1, 0], [1, 1]]), 1 / 3),
-    ],
-)
+@pytest.mark.parametrize("truth,pred,expected", F1_CASES)
 def test_calc_f1(truth, pred, expected):
     assert calc_f1(truth, pred) == expected
+
+
+@pytest.mark.parametrize("truth,pred,expected", MIOU_CASES)
+def test_confusion_matrix_miou(truth, pred, expected):
+    assert (
+        ConfusionMatrix().update(truth.numpy(), pred.numpy()).miou()
+        == expected
+    )
+
+
+@pytest.mark.parametrize("truth,pred,expected", F1_CASES)
+def test_confusion_matrix_f1(truth, pred, expected):
+    assert (
+        ConfusionMatrix().update(truth.numpy(), pred.numpy()).f1() == expected
+    )
+
+
+def test_confusion_matrix_merge():
+    rng = np.random.default_rng(0)
+    truth = rng.integers(-1, 2, size=(4, 32, 32))
+    pred = rng.integers(0, 2, size=(4, 32, 32))
+
+    whole = ConfusionMatrix().update(truth, pred)
+    left = ConfusionMatrix().update(truth[:2], pred[:2])
+    right = ConfusionMatrix().update(truth[2:], pred[2:])
+
+    np.testing.assert_array_equal((left + right).matrix, whole.matrix)
+    assert left.merge(right).miou() == whole.miou()
+
+
+@pytest.mark.parametrize("backend", ["numpy", "torch"])
+def test_calc_metrics(tmp_path, backend):
+    rng = np.random.default_rng(0)
+    truth = rng.integers(0, 2, size=(5, 64, 64), dtype=np.int16)
+    pred = rng.integers(0, 2, size=(5, 64, 64), dtype=np.int16)
+    truth[:, :8] = -1
+    pred[:, :8] = -1
+    pred[:, -4:] = -1
+
+    truth_files, pred_files = [], []
+    for i in range(len(truth)):
+        truth_files.append(tmp_path / f"tile_{i}_label.tif")
+        pred_files.append(tmp_path / f"tile_{i}_pred.tif")
+        imwrite(truth_files[-1], truth[i])
+        imwrite(pred_files[-1], pred[i])
+
+    metrics = calc_metrics(
+        truth_files, pred_files, num_workers=2, per_class=True, backend=backend
+    )
+
+    truth, pred = torch.from_numpy(truth), torch.from_numpy(pred)
+    assert metrics["mIoU"] == calc_miou(truth, pred).item()
+    assert metrics["F1"] == calc_f1(truth, pred).item()
+    assert metrics["IoU"] == pytest.approx(
+        MulticlassJaccardIndex(num_classes=3, ignore_index=-1, average="none")(
+            truth, pred
+        ).tolist()
+    )
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from tifffile import imread
+
+from granite_geo_flood.predictor import write_prediction
+from granite_geo_flood.writer import (
+    AsyncWriter,
+    benchmark_formats,
+    probability_file,
+    write_cog,
+)
+
+PROFILE = {
+    "driver": "GTiff",
+    "width": 512,
+    "height": 512,
+    "count": 9,
+    "dtype": "float32",
+    "crs": "EPSG:4326",
+    "transform": from_origin(-9.2, 53.7, 0.0001, 0.0001),
+}
+
+
+def make_pred(seed=0):
+    rng = np.random.default_rng(seed)
+    pred = np.zeros((512, 512), dtype=np.int16)
+    pred[100:300, 50:400] = 1
+    pred[:, :20] = -1
+    pred[rng.random(pred.shape) < 0.01] = 1
+    return pred
+
+
+@pytest.mark.parametrize("dtype", ["int8", "uint8"])
+def test_write_cog(tmp_path, dtype):
+    pred = make_pred()
+    probability = np.linspace(0, 1, pred.size, dtype=np.float32).reshape(
+        pred.shape
+    )
+    save_file = tmp_path / "tile_pred.tif"
+
+    write_cog(
+        pred, PROFILE, save_file, probability, dtype=dtype, compress="zstd"
+    )
+
+    with rasterio.open(save_file) as src:
+        assert src.dtypes[0] == dtype and src.count == 1
+        assert src.profile["tiled"] and src.compression.name == "zstd"
+        assert src.overviews(1) == [2]
+        assert src.transform == PROFILE["transform"]
+        mask = src.read(1)
+    np.testing.assert_array_equal(mask == src.nodata, pred == -1)
+    np.testing.assert_array_equal(mask[pred >= 0], pred[pred >= 0])
+
+    with rasterio.open(probability_file(save_file)) as src:
+        np.testing.assert_allclose(src.read(1), probability, atol=1e-3)
+
+    # int8 maps keep -1 as nodata for the metrics
+    if dtype == "int8":
+        np.testing.assert_array_equal(imread(save_file), pred)
+
+
+def test_async_writer(tmp_path):
+    with AsyncWriter(max_workers=2, max_pending=2) as writer:
+        futures = [
+            writer.submit(make_pred(i), PROFILE, tmp_path / f"{i}_pred.tif")
+            for i in range(5)
+        ]
+    assert all(future.done() for future in futures)
+    assert len(list(tmp_path.glob("*_pred.tif"))) == 5
+
+    writer = AsyncWriter()
+    writer.submit(make_pred(), PROFILE, tmp_path / "missing" / "pred.tif")
+    with pytest.raises(Exception, match="No such file"):
+        writer.close()
+
+
+def test_benchmark_formats(tmp_path):
+    pred_files = [tmp_path / f"{i}_pred.tif" for i in range(2)]
+    for i, pred_file in enumerate(pred_files):
+        write_prediction(make_pred(i), PROFILE, pred_file)
+
+    results = benchmark_formats(pred_files, tmp_path / "out")
+
+    baseline = results["int16 lzw"]["bytes_per_tile"]
+    assert results["int8 cog deflate"]["bytes_per_tile"] < baseline
@@ -0,0 +1,218 @@
+"""sliding window inference over whole scenes with bounded memory"""
+
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+
+def window_offsets(length: int, window: int, stride: int) -> list:
+    """start offsets of windows covering `length` pixels, the last window
+    being shifted back so that it ends on the image edge
+
+    Args:
+        length (int): image size along one axis
+        window (int): window size
+        stride (int): distance between consecutive windows
+
+    Returns:
+        list: window start offsets
+
+    Raises:
+        ValueError: if `stride` is not positive
+    """
+    if stride < 1:
+        raise ValueError(f"Window stride must be positive, not {stride}")
+    if length <= window:
+        return [0]
+    offsets = list(range(0, length - window, stride))
+    offsets.append(length - window)
+    return offsets
+
+
+def blend_weights(window: int, overlap: int) -> np.ndarray:
+    """2D weights that ramp up linearly over the overlap at each window edge
+    so that neighbouring windows fade into each other
+
+    Args:
+        window (int): window size
+        overlap (int): number of pixels shared with neighbouring windows
+
+    Returns:
+        np.ndarray: weights [window x window], all strictly positive
+    """
+    ramp = np.ones(window, dtype=np.float32)
+    if overlap > 0:
+        edge = np.arange(1, overlap + 1, dtype=np.float32) / (overlap + 1)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = np.minimum(ramp[-overlap:], edge[::-1])
+    return np.outer(ramp, ramp)
+
+
+def softmax(logits: np.ndarray, axis: int = 1) -> np.ndarray:
+    """numerically stable softmax"""
+    logits = logits - logits.max(axis=axis, keepdims=True)
+    np.exp(logits, out=logits)
+    logits /= logits.sum(axis=axis, keepdims=True)
+    return logits
+
+
+def _panels(xs: list, window: int, width: int, panel_windows: int) -> list:
+    """split the window columns into panels, each owning a range of output
+    columns and listing the windows that overlap that range"""
+    panels = []
+    for start in range(0, len(xs), panel_windows):
+        stop = start + panel_windows
+        col_start = xs[start]
+        col_stop = xs[stop] if stop < len(xs) else width
+        cols = [
+            j
+            for j, x in enumerate(xs)
+            if x < col_stop and x + window > col_start
+        ]
+        panels.append((col_start, col_stop, cols))
+    return panels
+
+
+def predict_scene(
+    predictor,
+    image_file: Path | str,
+    save_file: Path | str,
+    window: int = 512,
+    overlap: int = 64,
+    batch_size: int = 4,
+    panel_windows: int = 8,
+) -> Path:
+    """predict a flood map for a scene of any size with overlapping windows.
+
+    The scene is processed in vertical panels of `panel_windows` windows,
+    top to bottom. Class probabilities of overlapping windows are blended
+    with `blend_weights` and rows are written to the output as soon as no
+    later window can touch them, so memory depends on the window, panel and
+    batch sizes but not on the size of the scene. Windows overlapping two
+    panels are predicted once for each.
+
+    Args:
+        predictor (FloodPredictor): loaded model
+        image_file (Path | str): scene GeoTIFF with all the dataset bands
+        save_file (Path | str): output flood map GeoTIFF
+        window (int): window size, normally the backbone pretraining size.
+            Defaults to 512.
+        overlap (int): pixels shared by neighbouring windows. Defaults to 64.
+        batch_size (int): windows per forward pass. Defaults to 4.
+        panel_windows (int): windows per panel. Defaults to 8.
+
+    Returns:
+        Path: the written flood map
+
+    Raises:
+        ValueError: unless 0 <= `overlap` < `window`
+    """
+    if not 0 <= overlap < window:
+        raise ValueError(
+            f"Overlap must be at least 0 and less than the window size "
+            f"{window}, not {overlap}"
+        )
+    stride = window - overlap
+    weights = blend_weights(window, overlap)
+
+    with rasterio.open(image_file) as src:
+        height, width = src.height, src.width
+        ys = window_offsets(height, window, stride)
+        xs = window_offsets(width, window, stride)
+
+        profile = dict(
+            src.profile,
+            count=1,
+            dtype="int16",
+            nodata=-1,
+            compress="lzw",
+            tiled=True,
+            blockxsize=256,
+            blockysize=256,
+        )
+        if width < 256 or height < 256:
+            profile.update(tiled=False)
+            profile.pop("blockxsize")
+            profile.pop("blockysize")
+
+        with rasterio.open(save_file, "w", **profile) as dst:
+            for col_start, col_stop, cols in _panels(
+                xs, window, width, panel_windows
+            ):
+                panel_xs = [xs[j] for j in cols]
+                _predict_panel(
+                    predictor,
+                    src,
+                    dst,
+                    ys,
+                    panel_xs,
+                    (col_start, col_stop),
+                    window,
+                    weights,
+                    batch_size,
+                )
+
+    return Path(save_file)
+
+
+def _predict_panel(
+    predictor, src, dst, ys, xs, columns, window, weights, batch_size
+) -> None:
+    """predict and write the output columns [col_start, col_stop) of a scene"""
+    col_start, col_stop = columns
+    height = src.height
+    span_start = xs[0]
+    span = xs[-1] + window - span_start
+
+    acc = None
+    top = 0  # scene row of the first buffer row
+
+    for i, y in enumerate(ys):
+        jobs = [(y, x) for x in xs]
+        for b in range(0, len(jobs), batch_size):
+            batch_jobs = jobs[b : b + batch_size]
+            batch = np.stack(
+                [
+                    predictor.preprocess(
+                        src.read(
+                            window=Window(wx, wy, window, window),
+                            out_dtype="float32",
+                            masked=True,
+                            boundless=True,
+                            fill_value=np.nan,
+                        ).filled(np.nan)
+                    )
+                    for wy, wx in batch_jobs
+                ]
+            )
+            probs = softmax(predictor.forward(batch))
+            if acc is None:
+                acc = np.zeros(
+                    (probs.shape[1], window, span), dtype=np.float32
+                )
+
+            for (wy, wx), prob in zip(batch_jobs, probs):
+                r, c = wy - top, wx - span_start
+                h = min(window, acc.shape[1] - r)
+                w = min(window, span - c)
+                acc[:, r : r + h, c : c + w] += (
+                    prob[:, :h, :w] * weights[:h, :w]
+                )
+
+        # rows above the next window row are final. The weights are shared by
+        # all classes, so the argmax does not need normalising by their sum
+        done = (ys[i + 1] if i + 1 < len(ys) else height) - top
+        done = min(done, height - top)
+        pred = acc[:, :done, col_start - span_start : col_stop - span_start]
+        dst.write(
+            pred.argmax(axis=0).astype(np.int16),
+            1,
+            window=Window(col_start, top, col_stop - col_start, done),
+        )
+
+        # shift the unfinished rows to the top of the buffer
+        acc[:, : window - done] = acc[:, done:]
+        acc[:, window - done :] = 0
+        top += done
@@ -0,0 +1,63 @@
+"""surface areas of raster pixels and of the water in flood maps"""
+
+import numpy as np
+from affine import Affine
+from rasterio.crs import CRS
+
+# authalic radius of the WGS84 ellipsoid, the sphere of the same surface area
+EARTH_RADIUS_KM = 6371.0072
+
+
+def row_pixel_areas(
+    crs: CRS | str | None, transform: Affine, height: int
+) -> np.ndarray:
+    """area in km² of a pixel in each row of a north-up grid.
+
+    Pixels of geographic grids are cells of the authalic sphere, so their
+    area shrinks with latitude; pixels of projected grids all have the
+    area of the transform's pixel size.
+
+    Args:
+        crs (CRS | str | None): grid CRS, None for lat/lon coordinates
+        transform (Affine): grid transform (north-up)
+        height (int): rows in the grid
+
+    Returns:
+        np.ndarray: km² per pixel of each row [height]
+    """
+    crs = CRS.from_user_input(crs) if crs is not None else None
+    if crs is None or crs.is_geographic:
+        edges = np.radians(transform.f + np.arange(height + 1) * transform.e)
+        band = np.abs(np.diff(np.sin(edges)))
+        return EARTH_RADIUS_KM**2 * np.radians(abs(transform.a)) * band
+
+    metres = crs.linear_units_factor[1]
+    area = abs(transform.a * transform.e) * metres**2 / 1e6
+    return np.full(height, area)
+
+
+def water_stats(
+    pred: np.ndarray, crs: CRS | str | None, transform: Affine, water: int = 1
+) -> dict:
+    """pixel counts and area of the water in a flood map
+
+    Args:
+        pred (np.ndarray): predicted classes [h x w], -1 for no data
+        crs (CRS | str | None): CRS of the flood map
+        transform (Affine): transform of the flood map
+        water (int): class of water. Defaults to 1.
+
+    Returns:
+        dict: water_pixels, valid_pixels, water_fraction, water_km2, valid_km2
+    """
+    areas = row_pixel_areas(crs, transform, pred.shape[0])
+    water_rows = (pred == water).sum(axis=1)
+    valid_rows = (pred >= 0).sum(axis=1)
+    water_pixels, valid_pixels = int(water_rows.sum()), int(valid_rows.sum())
+    return {
+        "water_pixels": water_pixels,
+        "valid_pixels": valid_pixels,
+        "water_fraction": water_pixels / valid_pixels if valid_pixels else 0.0,
+        "water_km2": float(water_rows @ areas),
+        "valid_km2": float(valid_rows @ areas),
+    }
@@ -1,59 +1,69 @@
+from __future__ import annotations
+
 import os
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
-import torch
-from global_land_mask import globe
 from tifffile import imread
-from torchmetrics.classification import (
-    MulticlassFBetaScore,
-    MulticlassJaccardIndex,
-)
 from xarray import DataArray
 
+from granite_geo_flood.utils.land_mask import image_land_mask
+from granite_geo_flood.utils.metrics import ConfusionMatrix
+
+if TYPE_CHECKING:
+    import torch
 
-def download_data(region: str, save_file: str | Path) -> None:
+
+def download_data(
+    region: str, save_file: str | Path, extract_dir: str | Path | None = None
+) -> None:
     """script for downloading datasets prepared specifically for this repo.
-    Includes UK and Ireland data and some images from Spain.
+    Includes UK and Ireland data and some images from Spain. Downloads from
+    Zenodo go through the resumable, checksum-verified cache of
+    `granite_geo_flood.download`.
 
     Args:
         region (str): region name. Options are "uki", "uki_and_spain", "valencia".
         save_file (str | Path): file location and name with which you plan to save the downloaded data.
+        extract_dir (str | Path | None): directory into which to extract the
+            tarball while it downloads. Defaults to None.
     """
     import sys
 
+    from granite_geo_flood.download import download_dataset, extract_tar
+
     # define URL locations
     match region:
         case "uki":
-            gdrive_url = (
-                "https://drive.google.com/uc?id=1pYQBorXCykfJpY-Bc_ce40yogMDJxmUJ"
-            )
-            zenodo_url = "https://zenodo.org/records/14216851/files/granite-geospatial-uki-flooddetection-dataset-uki.tar.gz?download=1"
+            gdrive_url = "https://drive.google.com/uc?id=1pYQBorXCykfJpY-Bc_ce40yogMDJxmUJ"
         case "uki_and_spain":
-            gdrive_url = (
-                "https://drive.google.com/uc?id=1ysyyvLEQ8C05kmxTv0w91eOFHy2Z5V2i"
-            )
-            zenodo_url = "https://zenodo.org/records/14216851/files/granite-geospatial-uki-flooddetection-dataset-combined-uki-spain.tar.gz?download=1"
+            gdrive_url = "https://drive.google.com/uc?id=1ysyyvLEQ8C05kmxTv0w91eOFHy2Z5V2i"
         case "valencia":
-            gdrive_url = (
-                "https://drive.google.com/uc?id=1CE1TV7WgpMi-jIuKmnvkbgZ_GYQUXPpk"
-            )
-            zenodo_url = "https://zenodo.org/records/14216851/files/granite-geospatial-uki-flooddetection-dataset-valencia.tar.gz?download=1"
+            gdrive_url = "https://drive.google.com/uc?id=1CE1TV7WgpMi-jIuKmnvkbgZ_GYQUXPpk"
+        case _:
+            raise ValueError(f"Unknown region {region!r}")
 
     # downloading
-    zenodo_command = f'wget "{zenodo_url}" -O {str(save_file)}'
     if "google.colab" in sys.modules:
         import gdown
 
         try:
             gdown.download(gdrive_url, str(save_file))
-        except:
+        except Exception:
             print("Download failed via g.down. Reverting to Zenodo.")
-            os.system(zenodo_command)
-    else:
-        os.system(zenodo_command)
+        else:
+            # outside the try, so that a bad tarball is not downloaded again
+            if extract_dir is not None:
+                extract_tar(save_file, extract_dir)
+            return
+    download_dataset(region, save_file, extract_dir)
 
 
 def plot_images_pred_valencia(
@@ -135,7 +145,8 @@ def plot_images_pred_valencia(
     cbar.set_ticks(ticks=tick_vals, labels=tick_labels)
 
     # save the figure
-    plt.savefig(save_file)
+    fig.savefig(save_file)
+    plt.close(fig)
 
 
 def compare_images_label_pred(
@@ -199,7 +210,9 @@ def compare_images_label_pred(
             tick_vals = [0, 1]
             tick_labels = ["not water", "water"]
         case 3:
-            flood_cmap = mpl.colors.ListedColormap(["black", "tan", "paleturquoise"])
+            flood_cmap = mpl.colors.ListedColormap(
+                ["black", "tan", "paleturquoise"]
+            )
             bounds = [-1.5, -0.5, 0.5, 1.5]
             tick_vals = [-1, 0, 1]
             tick_labels = ["no data", "not water", "water"]
@@ -237,15 +250,16 @@ def compare_images_label_pred(
     os.makedirs(save_dir, exist_ok=True)
     filename = label_file.name.replace("_label.tif", "_inference_results.png")
     figure_name = save_dir / filename
-    plt.savefig(figure_name)
+    fig.savefig(figure_name)
+    plt.close(fig)
 
 
 def mask_image(image: DataArray) -> DataArray:
-    """masking over oceans"""
+    """masking over oceans. The land mask is cached per raster grid, so
+    images and predictions on the same grid share a single lookup."""
 
     # get land mask
-    lon_grid, lat_grid = np.meshgrid(image.x, image.y)
-    globe_land_mask = globe.is_land(lat_grid, lon_grid)
+    globe_land_mask = image_land_mask(image)
 
     # mask land
     masked_image = image.where(cond=globe_land_mask, other=1)
@@ -253,14 +267,16 @@ def mask_image(image: DataArray) -> DataArray:
     return masked_image
 
 
-def clip_image(image: DataArray) -> DataArray:
-    """clipping images for the Valencia region to work on free colab account"""
-    image = image.rio.clip_box(
-        minx=-0.3149,
-        miny=39.1032,
-        maxx=-0.2335,
-        maxy=39.1701,
-    )
+# (minx, miny, maxx, maxy) of the part of the Valencia scenes small enough
+# to prepare in memory on a free colab account
+VALENCIA_BOUNDS = (-0.3149, 39.1032, -0.2335, 39.1701)
+
+
+def clip_image(image: DataArray, bounds: tuple = VALENCIA_BOUNDS) -> DataArray:
+    """clipping images for the Valencia region to work on free colab account.
+    Images opened with chunks stay lazy (see `utils.lazy`)."""
+    minx, miny, maxx, maxy = bounds
+    image = image.rio.clip_box(minx=minx, miny=miny, maxx=maxx, maxy=maxy)
     return image
 
 
@@ -305,49 +321,145 @@ def prep_valencia_images(
 
 
 def scale_s2_image(image: np.ndarray) -> np.ndarray:
-    """brighten darker RGB images for easy visualisation"""
-    image[image < 0] = 0
+    """brighten darker RGB images for easy visualisation. The input is left
+    unchanged."""
+    image = np.maximum(image, 0)
     pl, ph = np.percentile(image, [2, 98])
     image = image / ph
 
     return image
 
 
-def calc_metrics(truth_files: list, pred_files: list) -> dict:
-    """calculating some simple metrics for model performance evaluation
+def read_file_pairs(
+    truth_files: list, pred_files: list, num_workers: int = 8
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """reads truth and prediction files pair by pair on a thread pool,
+    keeping at most `2 * num_workers` pairs in flight so that memory stays
+    bounded however many files there are
+
+    Args:
+        truth_files (list): truth labels
+        pred_files (list): predicted labels, in the same order
+        num_workers (int): reader threads. Defaults to 8.
+
+    Yields:
+        tuple[np.ndarray, np.ndarray]: truth and prediction arrays, in file
+            order
+    """
+
+    def read_pair(files: tuple) -> tuple[np.ndarray, np.ndarray]:
+        return imread(files[0]), imread(files[1])
+
+    pairs = iter(zip(truth_files, pred_files))
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque(
+            executor.submit(read_pair, files)
+            for files in islice(pairs, 2 * num_workers)
+        )
+        while pending:
+            truth, pred = pending.popleft().result()
+            for files in islice(pairs, 1):
+                pending.append(executor.submit(read_pair, files))
+            yield truth, pred
+
+
+def calc_metrics(
+    truth_files: list,
+    pred_files: list,
+    num_workers: int = 8,
+    per_class: bool = False,
+    backend: str = "numpy",
+) -> dict:
+    """calculating some simple metrics for model performance evaluation.
+    Files are streamed through the metrics one pair at a time, which only
+    accumulate a confusion matrix, so memory does not grow with the number
+    of files.
 
     Args:
         truth_files (list): truth labels for a particular model
         pred_files (list): predicted labels for the same model
+        num_workers (int): threads used to read the files. Defaults to 8.
+        per_class (bool): also return the IoU of each class. Defaults to False.
+        backend (str): "numpy" for `ConfusionMatrix`, which does not import
+            torch, or "torch" for torchmetrics. Both give the same numbers.
+            Defaults to "numpy".
 
     Returns:
-        dict: contains mIoU and F1 score
+        dict: contains mIoU and F1 score (and per class IoU if requested)
     """
-    # load data into 3D array of size num_files x 512 x 512
-    truth = np.array([imread(truth_file) for truth_file in truth_files])
-    pred = np.array([imread(truth_file) for truth_file in pred_files])
+    match backend:
+        case "numpy":
+            return _calc_metrics_numpy(
+                truth_files, pred_files, num_workers, per_class
+            )
+        case "torch":
+            return _calc_metrics_torch(
+                truth_files, pred_files, num_workers, per_class
+            )
+        case _:
+            raise ValueError(f"Unknown metrics backend: {backend}")
+
+
+def _calc_metrics_numpy(
+    truth_files: list, pred_files: list, num_workers: int, per_class: bool
+) -> dict:
+    confmat = ConfusionMatrix(num_classes=3, ignore_index=-1)
+    for truth, pred in read_file_pairs(truth_files, pred_files, num_workers):
+        confmat.update(truth, pred)
+
+    metrics = {"mIoU": float(confmat.miou()), "F1": float(confmat.f1())}
+    if per_class:
+        metrics["IoU"] = confmat.iou().tolist()
+
+    return metrics
+
 
-    # convert from deta array to tensor
-    truth = torch.tensor(truth)
-    pred = torch.tensor(pred)
+def _calc_metrics_torch(
+    truth_files: list, pred_files: list, num_workers: int, per_class: bool
+) -> dict:
+    import torch
+    from torchmetrics.classification import (
+        MulticlassFBetaScore,
+        MulticlassJaccardIndex,
+    )
+
+    miou = MulticlassJaccardIndex(num_classes=3, ignore_index=-1)
+    f1 = MulticlassFBetaScore(
+        num_classes=3, ignore_index=-1, beta=1.0, average="micro"
+    )
+    iou = MulticlassJaccardIndex(
+        num_classes=3, ignore_index=-1, average="none"
+    )
+
+    for truth, pred in read_file_pairs(truth_files, pred_files, num_workers):
+        # convert from data array to tensor
+        truth = torch.from_numpy(truth)
+        pred = torch.from_numpy(pred)
 
-    # calculate mIoU
-    miou = calc_miou(truth, pred)
+        miou.update(truth, pred)
+        f1.update(truth, pred)
+        if per_class:
+            iou.update(truth, pred)
 
-    # calculate F1
-    f1 = calc_f1(truth, pred)
+    metrics = {"mIoU": miou.compute().item(), "F1": f1.compute().item()}
+    if per_class:
+        metrics["IoU"] = iou.compute().tolist()
 
-    return {"mIoU": miou.detach().item(), "F1": f1.detach().item()}
+    return metrics
 
 
 def calc_miou(truth: torch.Tensor, pred: torch.Tensor) -> torch.Tensor:
     """calculating mIoU"""
+    from torchmetrics.classification import MulticlassJaccardIndex
+
     metric = MulticlassJaccardIndex(num_classes=3, ignore_index=-1)
     return metric(truth, pred)
 
 
 def calc_f1(truth: torch.Tensor, pred: torch.Tensor) -> torch.Tensor:
     """calculating f1 score"""
+    from torchmetrics.classification import MulticlassFBetaScore
+
     metric = MulticlassFBetaScore(
         num_classes=3, ignore_index=-1, beta=1.0, average="micro"
     )
@@ -0,0 +1,161 @@
+"""cached land/ocean masks for raster grids"""
+
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import rioxarray  # noqa: F401  (registers the .rio accessor)
+from affine import Affine
+from global_land_mask import globe
+from rasterio.crs import CRS
+from rasterio.warp import transform as warp_transform
+from xarray import DataArray
+
+
+def pixel_centres(transform: Affine, shape: tuple[int, int]) -> tuple:
+    """x coordinates of the column centres and y coordinates of the row
+    centres of a north-up grid"""
+    height, width = shape
+    x = transform.c + (np.arange(width) + 0.5) * transform.a
+    y = transform.f + (np.arange(height) + 0.5) * transform.e
+    return x, y
+
+
+def compute_land_mask(
+    crs: CRS | str | None,
+    transform: Affine,
+    shape: tuple[int, int],
+    block_rows: int = 512,
+) -> np.ndarray:
+    """land mask of a raster grid, True on land
+
+    Grids in geographic coordinates are looked up from their coordinate
+    vectors, broadcasting rows against columns instead of building a full
+    lat/lon meshgrid. Projected grids are reprojected and looked up a block
+    of rows at a time.
+
+    Args:
+        crs (CRS | str | None): grid CRS, None for lat/lon coordinates
+        transform (Affine): grid transform (north-up)
+        shape (tuple[int, int]): grid height and width
+        block_rows (int): rows reprojected at once for projected grids.
+            Defaults to 512.
+
+    Returns:
+        np.ndarray: boolean mask [h x w]
+    """
+    x, y = pixel_centres(transform, shape)
+    crs = CRS.from_user_input(crs) if crs is not None else None
+
+    if crs is None or crs.is_geographic:
+        return globe.is_land(y[:, None], x[None, :])
+
+    mask = np.empty(shape, dtype=bool)
+    for start in range(0, shape[0], block_rows):
+        rows = y[start : start + block_rows]
+        xs = np.tile(x, len(rows))
+        ys = np.repeat(rows, len(x))
+        lon, lat = warp_transform(crs, "EPSG:4326", xs, ys)
+        mask[start : start + len(rows)] = globe.is_land(
+            np.asarray(lat), np.asarray(lon)
+        ).reshape(len(rows), len(x))
+    return mask
+
+
+class LandMaskCache:
+    """LRU cache of land masks keyed by grid CRS, transform and shape, with
+    an optional on-disk store shared between runs
+
+    Args:
+        maxsize (int): masks kept in memory. Defaults to 16.
+        cache_dir (Path | str | None): directory for masks stored on disk.
+            Defaults to None (memory only).
+    """
+
+    def __init__(
+        self, maxsize: int = 16, cache_dir: Path | str | None = None
+    ) -> None:
+        self.maxsize = maxsize
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self._masks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(
+        crs: CRS | str | None, transform: Affine, shape: tuple[int, int]
+    ) -> str:
+        """hashable identifier of a raster grid"""
+        crs = CRS.from_user_input(crs).to_wkt() if crs is not None else ""
+        grid = f"{crs}|{tuple(transform)[:6]}|{tuple(shape)}"
+        return hashlib.sha1(grid.encode()).hexdigest()
+
+    def get(
+        self, crs: CRS | str | None, transform: Affine, shape: tuple[int, int]
+    ) -> np.ndarray:
+        """land mask of a raster grid, True on land. The returned array is
+        shared with the cache and read-only."""
+        key = self.key(crs, transform, shape)
+
+        if key in self._masks:
+            self.hits += 1
+            self._masks.move_to_end(key)
+            return self._masks[key]
+
+        self.misses += 1
+        mask = self._load(key, shape)
+        if mask is None:
+            mask = compute_land_mask(crs, transform, shape)
+            self._save(key, mask)
+
+        mask.flags.writeable = False
+        self._masks[key] = mask
+        if len(self._masks) > self.maxsize:
+            self._masks.popitem(last=False)
+
+        return mask
+
+    def clear(self) -> None:
+        """drop the masks held in memory"""
+        self._masks.clear()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"land_mask_{key}.npy"
+
+    def _load(self, key: str, shape: tuple[int, int]) -> np.ndarray | None:
+        if self.cache_dir is None or not self._path(key).exists():
+            return None
+        packed = np.load(self._path(key))
+        return (
+            np.unpackbits(packed, count=shape[0] * shape[1])
+            .astype(bool)
+            .reshape(shape)
+        )
+
+    def _save(self, key: str, mask: np.ndarray) -> None:
+        if self.cache_dir is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        np.save(self._path(key), np.packbits(mask))
+
+
+land_masks = LandMaskCache()
+
+
+def image_land_mask(
+    image: DataArray, cache: LandMaskCache | None = None
+) -> np.ndarray:
+    """land mask of the grid of a DataArray with x/y coordinates
+
+    Args:
+        image (DataArray): raster opened with rioxarray
+        cache (LandMaskCache | None): cache to use. Defaults to the module
+            cache.
+
+    Returns:
+        np.ndarray: boolean mask [h x w], True on land
+    """
+    cache = land_masks if cache is None else cache
+    shape = (image.sizes["y"], image.sizes["x"])
+    return cache.get(image.rio.crs, image.rio.transform(), shape)
@@ -0,0 +1,232 @@
+"""lazy, chunked versions of the scene preparation helpers, built on dask"""
+
+import argparse
+import threading
+from pathlib import Path
+
+import dask
+import dask.array as da
+import numpy as np
+import rioxarray
+from affine import Affine
+from xarray import DataArray
+
+from granite_geo_flood.utils.land_mask import compute_land_mask
+
+# height and width of the chunks scenes are read in
+CHUNKS = 1024
+
+
+def open_chunked(path: Path | str, chunks: int = CHUNKS) -> DataArray:
+    """open a raster without reading it: every band of a `chunks` x `chunks`
+    window is one dask chunk, read only when something computes it"""
+    return rioxarray.open_rasterio(
+        path, chunks={"band": -1, "y": chunks, "x": chunks}
+    )
+
+
+def _chunk_land_mask(
+    block: np.ndarray, crs, transform: Affine, block_info: dict | None = None
+) -> np.ndarray:
+    (row, _), (col, _) = block_info[None]["array-location"]
+    return compute_land_mask(
+        crs, transform * Affine.translation(col, row), block.shape
+    )
+
+
+def land_mask_lazy(image: DataArray) -> DataArray:
+    """land mask of the grid of a raster, computed chunk by chunk from each
+    chunk's own transform, so no chunk needs the whole grid in memory
+
+    Args:
+        image (DataArray): raster opened with rioxarray, chunked or not
+
+    Returns:
+        DataArray: deferred boolean mask [y x], True on land, chunked as the
+            image
+    """
+    shape = (image.sizes["y"], image.sizes["x"])
+    chunks = image.chunksizes if image.chunks is not None else {}
+    template = da.empty(
+        shape, dtype=bool, chunks=(chunks.get("y", -1), chunks.get("x", -1))
+    )
+    mask = template.map_blocks(
+        _chunk_land_mask,
+        dtype=bool,
+        crs=image.rio.crs,
+        transform=image.rio.transform(),
+    )
+    return DataArray(
+        mask, coords={"y": image.y, "x": image.x}, dims=("y", "x")
+    )
+
+
+def mask_image_lazy(image: DataArray) -> DataArray:
+    """deferred `helper.mask_image`: ocean pixels set to 1"""
+    return image.where(cond=land_mask_lazy(image), other=1)
+
+
+def scale_s2_lazy(
+    image: DataArray, q: float = 98, two_pass: bool = False
+) -> DataArray:
+    """deferred `helper.scale_s2_image`: negative values set to 0 and the
+    result divided by its `q`th percentile.
+
+    The percentile is approximate: dask merges the percentiles of each chunk
+    instead of sorting every pixel of the scene. As it depends on every
+    chunk, computing the whole scaled image in one go holds all of its chunks
+    in memory until the percentile is known; `two_pass` computes the
+    percentile first, reading the chunks twice but one at a time.
+    """
+    image = image.clip(min=0)
+    data = da.asarray(image.data)
+    values = da.concatenate(
+        [data.blocks[index].ravel() for index in np.ndindex(data.numblocks)]
+    )
+    ph = da.percentile(values, [q])[0]
+    if two_pass:
+        ph = float(ph.compute())
+    return image / ph
+
+
+def prep_valencia_lazy(
+    image: DataArray,
+    pred: DataArray,
+    rgb_bands: list,
+    vv_band: int,
+    bounds: tuple | None = None,
+    two_pass: bool = False,
+) -> tuple[DataArray, DataArray, DataArray]:
+    """deferred `helper.prep_valencia_images`. Nothing is read until one of
+    the results is computed, and then only the chunks it needs; compute them
+    together (`dask.compute(s1, s2, pred)`) to read each chunk once.
+
+    Args:
+        image (DataArray): input image, e.g. from `open_chunked`
+        pred (DataArray): prediction from inference from input image
+        rgb_bands (list): indices of RGB bands (in order) in image
+        vv_band (int): index of S1 VV band in image
+        bounds (tuple | None): (minx, miny, maxx, maxy) to clip to. Defaults
+            to None (the whole scene).
+        two_pass (bool): compute the S2 scaling first (see `scale_s2_lazy`).
+            Defaults to False.
+
+    Returns:
+        tuple[DataArray, DataArray, DataArray]: S1 vv band, S2 RGB [y x band],
+            predictions
+    """
+    if bounds is not None:
+        minx, miny, maxx, maxy = bounds
+        image = image.rio.clip_box(minx=minx, miny=miny, maxx=maxx, maxy=maxy)
+        pred = pred.rio.clip_box(minx=minx, miny=miny, maxx=maxx, maxy=maxy)
+
+    # apply masking over ocean as we don't train on it, to the used bands only
+    land = land_mask_lazy(image)
+    s1 = image[vv_band, :, :].where(cond=land, other=1).squeeze()
+    s2 = image[rgb_bands, :, :].where(cond=land, other=1)
+    pred = pred.where(cond=land, other=1).squeeze()
+
+    s2 = scale_s2_lazy(s2, two_pass=two_pass).transpose("y", "x", "band")
+
+    return s1, s2, pred
+
+
+def prepare_scene(
+    image_file: Path | str,
+    pred_file: Path | str,
+    output_dir: Path | str,
+    rgb_bands: list,
+    vv_band: int,
+    bounds: tuple | None = None,
+    chunks: int = CHUNKS,
+) -> dict:
+    """write the S1 VV band, scaled S2 RGB and ocean-masked prediction of a
+    scene as GeoTIFFs, one chunk at a time, so scenes larger than memory can
+    be prepared
+
+    Args:
+        image_file (Path | str): input image
+        pred_file (Path | str): prediction of the image
+        output_dir (Path | str): directory for `<image name>_{s1,s2,pred}.tif`
+        rgb_bands (list): indices of RGB bands (in order) in image
+        vv_band (int): index of S1 VV band in image
+        bounds (tuple | None): (minx, miny, maxx, maxy) to clip to. Defaults
+            to None (the whole scene).
+        chunks (int): chunk height and width. Defaults to CHUNKS.
+
+    Returns:
+        dict: file written for "s1", "s2" and "pred"
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    s1, s2, pred = prep_valencia_lazy(
+        open_chunked(image_file, chunks),
+        open_chunked(pred_file, chunks),
+        rgb_bands,
+        vv_band,
+        bounds,
+        two_pass=True,
+    )
+
+    stem = Path(image_file).stem
+    outputs = {
+        "s1": s1,
+        "s2": s2.transpose("band", "y", "x").astype(np.float32),
+        "pred": pred,
+    }
+    files = {name: output_dir / f"{stem}_{name}.tif" for name in outputs}
+    lock = threading.Lock()
+    writes = [
+        array.rio.to_raster(
+            files[name],
+            tiled=True,
+            compress="deflate",
+            lock=lock,
+            compute=False,
+        )
+        for name, array in outputs.items()
+    ]
+    dask.compute(*writes)
+    return files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Prepare whole scenes for plotting without loading them into "
+            "memory."
+        )
+    )
+    parser.add_argument("--image", required=True, help="Input image")
+    parser.add_argument(
+        "--pred", required=True, help="Prediction of the image"
+    )
+    parser.add_argument("--output_dir", required=True)
+    parser.add_argument("--rgb_bands", type=int, nargs=3, default=[4, 3, 2])
+    parser.add_argument("--vv_band", type=int, default=0)
+    parser.add_argument(
+        "--bounds",
+        type=float,
+        nargs=4,
+        default=None,
+        metavar=("MINX", "MINY", "MAXX", "MAXY"),
+        help="Clip to these bounds",
+    )
+    parser.add_argument("--chunks", type=int, default=CHUNKS)
+    args = parser.parse_args()
+
+    files = prepare_scene(
+        args.image,
+        args.pred,
+        args.output_dir,
+        args.rgb_bands,
+        args.vv_band,
+        args.bounds,
+        args.chunks,
+    )
+    for name, path in files.items():
+        print(f"{name}: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""NumPy segmentation metrics built on a confusion matrix, without torch.
+
+Results match `helper.calc_miou` and `helper.calc_f1` (torchmetrics
+`MulticlassJaccardIndex` with macro averaging and `MulticlassFBetaScore` with
+micro averaging) down to their float32 precision, and confusion matrices
+can be summed across tiles, workers and events before the metrics are
+computed.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+
+class ConfusionMatrix:
+    """per-class confusion matrix, rows are truth and columns predictions
+
+    Args:
+        num_classes (int): number of classes. Defaults to 3.
+        ignore_index (int): label of pixels left out of the metrics, in
+            either the truth or the prediction. Defaults to -1.
+    """
+
+    def __init__(self, num_classes: int = 3, ignore_index: int = -1) -> None:
+        self.num_classes = num_classes
+        self.ignore_index = ignore_index
+        self.matrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+
+    def update(self, truth: np.ndarray, pred: np.ndarray) -> "ConfusionMatrix":
+        """add the pixels of a truth and prediction pair of any shape"""
+        truth = np.asarray(truth).ravel()
+        pred = np.asarray(pred).ravel()
+
+        valid = (truth != self.ignore_index) & (pred != self.ignore_index)
+        if not valid.all():
+            truth, pred = truth[valid], pred[valid]
+
+        index = truth.astype(np.int64) * self.num_classes + pred
+        self.matrix += np.bincount(
+            index, minlength=self.num_classes**2
+        ).reshape(self.num_classes, self.num_classes)
+        return self
+
+    def merge(self, other: "ConfusionMatrix") -> "ConfusionMatrix":
+        """add the counts of another confusion matrix to this one"""
+        self.matrix += other.matrix
+        return self
+
+    def __add__(self, other: "ConfusionMatrix") -> "ConfusionMatrix":
+        result = ConfusionMatrix(self.num_classes, self.ignore_index)
+        result.matrix = self.matrix + other.matrix
+        return result
+
+    def iou(self) -> np.ndarray:
+        """IoU of each class, 0 for classes absent from truth and prediction"""
+        matrix = self.matrix.astype(np.float32)
+        tp = np.diag(matrix)
+        denom = matrix.sum(0) + matrix.sum(1) - tp
+        return np.divide(tp, denom, out=np.zeros_like(tp), where=denom != 0)
+
+    def miou(self) -> np.float32:
+        """IoU averaged over the classes present in truth or prediction"""
+        matrix = self.matrix.astype(np.float32)
+        weights = (matrix.sum(0) + matrix.sum(1) != 0).astype(np.float32)
+        with np.errstate(invalid="ignore"):
+            return ((weights * self.iou()) / weights.sum()).sum()
+
+    def f1(self) -> np.float32:
+        """micro averaged F1 score"""
+        tp = np.trace(self.matrix)
+        errors = (
+            self.matrix.sum() - tp
+        )  # false positives, and as many false negatives
+        denom = 2 * tp + 2 * errors
+        if not denom:
+            return np.float32(0)
+        return np.float32(2 * tp) / np.float32(denom)
+
+
+def benchmark(
+    num_tiles: int = 20, tile_size: int = 512, repeats: int = 3
+) -> dict:
+    """time ConfusionMatrix against the torchmetrics metrics on random tiles
+
+    Args:
+        num_tiles (int): tiles per run. Defaults to 20.
+        tile_size (int): tile height and width. Defaults to 512.
+        repeats (int): runs per backend, the fastest is kept. Defaults to 3.
+
+    Returns:
+        dict: seconds per run for each backend
+    """
+    import torch
+    from torchmetrics.classification import (
+        MulticlassFBetaScore,
+        MulticlassJaccardIndex,
+    )
+
+    rng = np.random.default_rng(0)
+    truth = rng.integers(
+        -1, 2, size=(num_tiles, tile_size, tile_size), dtype=np.int16
+    )
+    pred = np.where(
+        truth == -1, -1, rng.integers(0, 2, size=truth.shape)
+    ).astype(np.int16)
+
+    def run_numpy():
+        confmat = ConfusionMatrix()
+        for t, p in zip(truth, pred):
+            confmat.update(t, p)
+        return confmat.miou(), confmat.f1()
+
+    def run_torch():
+        miou = MulticlassJaccardIndex(num_classes=3, ignore_index=-1)
+        f1 = MulticlassFBetaScore(
+            num_classes=3, ignore_index=-1, beta=1.0, average="micro"
+        )
+        for t, p in zip(truth, pred):
+            t, p = torch.from_numpy(t), torch.from_numpy(p)
+            miou.update(t, p)
+            f1.update(t, p)
+        return miou.compute().item(), f1.compute().item()
+
+    timings = {}
+    for name, run in [("numpy", run_numpy), ("torch", run_torch)]:
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare the NumPy and torchmetrics metric backends."
+    )
+    parser.add_argument("--num_tiles", type=int, default=20)
+    parser.add_argument("--tile_size", type=int, default=512)
+    args = parser.parse_args()
+
+    timings = benchmark(args.num_tiles, args.tile_size)
+    for name, seconds in timings.items():
+        print(
+            f"{name:>5}: {seconds * 1000:8.1f} ms for {args.num_tiles} tiles "
+            f"({timings['torch'] / seconds:.2f}x torchmetrics)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""compact Cloud-Optimized GeoTIFF flood maps, written on a thread pool"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.shutil import copy as copy_dataset
+
+from granite_geo_flood.predictor import write_prediction
+
+# nodata value of the mask for each storage dtype
+MASK_NODATA = {"int8": -1, "uint8": 255}
+
+
+def probability_file(save_file: Path | str) -> Path:
+    """location of the water probability written alongside a flood map"""
+    save_file = Path(save_file)
+    return save_file.with_name(f"{save_file.stem}_prob{save_file.suffix}")
+
+
+def _write_cog(
+    data: np.ndarray,
+    profile: dict,
+    save_file: Path | str,
+    compress: str,
+    blocksize: int,
+    resampling: str,
+    **options,
+) -> None:
+    """write [bands x h x w] as a tiled COG with overviews. The COG driver
+    can only copy a dataset, so the data goes through an in-memory GTiff."""
+    mem_profile = {
+        "driver": "GTiff",
+        "count": data.shape[0],
+        "height": data.shape[1],
+        "width": data.shape[2],
+        "dtype": data.dtype,
+        "crs": profile.get("crs"),
+        "transform": profile.get("transform"),
+        "nodata": profile.get("nodata"),
+    }
+    with MemoryFile() as memfile, memfile.open(**mem_profile) as mem:
+        mem.write(data)
+        copy_dataset(
+            mem,
+            str(save_file),
+            driver="COG",
+            COMPRESS=compress.upper(),
+            BLOCKSIZE=blocksize,
+            OVERVIEW_RESAMPLING=resampling.upper(),
+            **options,
+        )
+
+
+def write_cog(
+    pred: np.ndarray,
+    profile: dict,
+    save_file: Path | str,
+    probability: np.ndarray | None = None,
+    dtype: str = "int8",
+    compress: str = "deflate",
+    blocksize: int = 256,
+) -> None:
+    """write a flood map as an internally tiled, compressed Cloud-Optimized
+    GeoTIFF with overviews, and optionally its water probability as a
+    half-precision float COG next to it (see `probability_file`).
+
+    Args:
+        pred (np.ndarray): predicted classes [h x w], -1 for no data
+        profile (dict): rasterio profile of the input image
+        save_file (Path | str): output GeoTIFF location
+        probability (np.ndarray | None): water probability [h x w]. Defaults
+            to None.
+        dtype (str): "int8" (nodata -1) or "uint8" (nodata 255). Defaults to
+            "int8".
+        compress (str): "deflate" or "zstd". Defaults to "deflate".
+        blocksize (int): internal tile size. Defaults to 256.
+    """
+    nodata = MASK_NODATA[dtype]
+    mask = np.where(pred < 0, nodata, pred).astype(dtype)
+    _write_cog(
+        mask[None],
+        dict(profile, nodata=nodata),
+        save_file,
+        compress,
+        blocksize,
+        resampling="nearest",
+    )
+
+    if probability is not None:
+        # GeoTIFF has no float16 type, NBITS=16 stores float32 as half floats
+        _write_cog(
+            probability[None].astype(np.float32),
+            dict(profile, nodata=np.nan),
+            probability_file(save_file),
+            compress,
+            blocksize,
+            resampling="average",
+            NBITS=16,
+        )
+
+
+class AsyncWriter:
+    """writes flood maps on a thread pool so that compression and disk
+    writes overlap with inference. rasterio releases the GIL while it
+    compresses, so the threads write in parallel.
+
+    At most `max_pending` writes are queued; `submit` blocks beyond that,
+    which bounds the predictions held in memory. Errors are raised by
+    `close`, or on leaving the `with` block.
+
+    Args:
+        cog (bool): write `write_cog` COGs, or the int16 LZW GeoTIFFs of
+            `write_prediction` if False. Defaults to True.
+        dtype (str): mask dtype of the COGs, "int8" or "uint8". Defaults to
+            "int8".
+        compress (str): COG compression, "deflate" or "zstd". Defaults to
+            "deflate".
+        probability (bool): also write the water probability. Defaults to
+            False.
+        max_workers (int): writer threads. Defaults to 2.
+        max_pending (int): writes queued before `submit` blocks. Defaults to 8.
+    """
+
+    def __init__(
+        self,
+        cog: bool = True,
+        dtype: str = "int8",
+        compress: str = "deflate",
+        probability: bool = False,
+        max_workers: int = 2,
+        max_pending: int = 8,
+    ) -> None:
+        self.cog = cog
+        self.dtype = dtype
+        self.compress = compress
+        self.probability = probability
+
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._errors = []
+
+    def write(
+        self,
+        pred: np.ndarray,
+        profile: dict,
+        save_file: Path | str,
+        probability: np.ndarray | None = None,
+    ) -> None:
+        """write one flood map on the calling thread"""
+        if self.cog:
+            write_cog(
+                pred,
+                profile,
+                save_file,
+                probability,
+                self.dtype,
+                self.compress,
+            )
+        else:
+            write_prediction(pred, profile, save_file)
+
+    def submit(
+        self,
+        pred: np.ndarray,
+        profile: dict,
+        save_file: Path | str,
+        probability: np.ndarray | None = None,
+    ) -> Future:
+        """queue a flood map to be written by the thread pool"""
+        self._slots.acquire()
+        future = self._executor.submit(
+            self.write, pred, profile, save_file, probability
+        )
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future) -> None:
+        self._slots.release()
+        if future.exception() is not None:
+            self._errors.append(future.exception())
+
+    def close(self) -> None:
+        """wait for the queued writes, raising the first error if any failed"""
+        self._executor.shutdown(wait=True)
+        if self._errors:
+            raise self._errors[0]
+
+    def __enter__(self) -> "AsyncWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def benchmark_formats(
+    pred_files: list,
+    output_dir: Path | str,
+    compressions: list = ("deflate", "zstd"),
+) -> dict:
+    """size and write time of flood maps in the int16 LZW format against
+    int8 COGs, rewriting existing predictions
+
+    Args:
+        pred_files (list): existing prediction GeoTIFFs
+        output_dir (Path | str): scratch directory for the rewritten files
+        compressions (list): COG compressions to try. Defaults to
+            ("deflate", "zstd").
+
+    Returns:
+        dict: bytes and seconds per tile for each format
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    preds = []
+    for pred_file in pred_files:
+        with rasterio.open(pred_file) as src:
+            preds.append((src.read(1), src.profile))
+
+    formats = {"int16 lzw": AsyncWriter(cog=False, max_workers=1)}
+    for compress in compressions:
+        formats[f"int8 cog {compress}"] = AsyncWriter(
+            compress=compress, max_workers=1
+        )
+
+    results = {}
+    for name, writer in formats.items():
+        save_files = [
+            output_dir / f"{name.replace(' ', '_')}_{i}.tif"
+            for i in range(len(preds))
+        ]
+        start = time.perf_counter()
+        for (pred, profile), save_file in zip(preds, save_files):
+            writer.write(pred, profile, save_file)
+        seconds = time.perf_counter() - start
+        writer.close()
+
+        results[name] = {
+            "bytes_per_tile": sum(f.stat().st_size for f in save_files)
+            / len(preds),
+            "seconds_per_tile": seconds / len(preds),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare flood map size and write time across output formats."
+        )
+    )
+    parser.add_argument(
+        "--pred_dir", required=True, help="Directory of *_pred.tif files"
+    )
+    parser.add_argument(
+        "--output_dir", required=True, help="Scratch output directory"
+    )
+    parser.add_argument("--num_tiles", type=int, default=32)
+    args = parser.parse_args()
+
+    pred_files = sorted(Path(args.pred_dir).glob("*_pred.tif"))[
+        : args.num_tiles
+    ]
+    results = benchmark_formats(pred_files, args.output_dir)
+    baseline = results["int16 lzw"]["bytes_per_tile"]
+    for name, stats in results.items():
+        print(
+            f"{name:>16}: {stats['bytes_per_tile'] / 1024:8.1f} KiB/tile "
+            f"({stats['bytes_per_tile'] / baseline:.2f}x), "
+            f"{stats['seconds_per_tile'] * 1000:.1f} ms/tile"
+        )
+
+
+if __name__ == "__main__":
+    main()
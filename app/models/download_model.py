@@ -1,26 +1,14 @@
 # models/download_model.py
-from huggingface_hub import hf_hub_download
-import os
+"""download the fine-tuned checkpoint and its config next to this script,
+through the resumable cache of `granite_geo_flood.download`"""
 
-MODEL_REPO = "ibm-granite/granite-geospatial-uki-flooddetection"
-CKPT_FILE = "granite_geospatial_uki_flood_detection_v1.ckpt"
-CONFIG_FILE = "config.yaml"
-TARGET_DIR = "." # Download to the directory where the script is run
+import sys
+from pathlib import Path
 
-print(f"Downloading {CKPT_FILE}...")
-hf_hub_download(
-    repo_id=MODEL_REPO,
-    filename=CKPT_FILE,
-    local_dir=TARGET_DIR,
-    local_dir_use_symlinks=False
-)
-print("Checkpoint download complete.")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-print(f"Downloading {CONFIG_FILE}...")
-hf_hub_download(
-    repo_id=MODEL_REPO,
-    filename=CONFIG_FILE,
-    local_dir=TARGET_DIR,
-    local_dir_use_symlinks=False
-)
-print("Config download complete.")
\ No newline at end of file
+from granite_geo_flood.download import download_model  # noqa: E402
+
+if __name__ == "__main__":
+    for file in download_model(Path(__file__).parent):
+        print(f"Downloaded {file}")
@@ -1,125 +1,563 @@
-import subprocess
 import argparse
+import logging
+import os
 import sys
-import rioxarray
-import numpy as np
+import time
+from pathlib import Path
 
-from glob import glob
+from granite_geo_flood import runtime
+from granite_geo_flood.batching import auto_batch_size
+from granite_geo_flood.instrument import PROFILERS, RunRecorder
+from granite_geo_flood.ledger import (
+    RunLedger,
+    config_hash,
+    file_hash,
+    run_resumable,
+)
+from granite_geo_flood.pipeline import run_pipeline
+from granite_geo_flood.precision import (
+    PRECISIONS,
+    guard_precision,
+    reference_labels,
+)
+from granite_geo_flood.predictor import FloodPredictor
+from granite_geo_flood.replicas import run_replicas
+from granite_geo_flood.scan import readable_files, scan_directory
+from granite_geo_flood.skip import TileFilter
+from granite_geo_flood.tiling import predict_scene
+from granite_geo_flood.writer import AsyncWriter
 
-files = sorted(glob("/app/data/input/*.tif"))
-print(f"Found {len(files)} .tif files")
-for f in files:
-    try:
-        arr = rioxarray.open_rasterio(f, masked=True)
-        print(
-            f"{f}: shape={arr.shape}, dtype={arr.dtype}, "
-            f"NaNs={np.isnan(arr).sum().item()}"
-        )
-    except Exception as e:
-        print(f"Error loading {f}: {e}")
- 
 print("Starting inference script inside container...")
-input_tif = "/app/data/input/EMSR407_AOI_3_2019-11-14_tile_0_2_test_image.tif"
-print(rioxarray.open_rasterio(input_tif).shape)
-arr = rioxarray.open_rasterio(input_tif, masked=True)
-print(np.isnan(arr).sum().item())
- 
+
 # --- Argument Parsing ---
 parser = argparse.ArgumentParser(
-    description="Run Terratorch inference inside Docker."
+    description="Run flood detection inference inside Docker."
 )
 parser.add_argument(
-    '--config',
-    default='/app/configs/'
-            'config_granite_geospatial_uki_flood_detection_v1.yaml',
-    help='Path inside container to config.yaml'
+    "--config",
+    default="/app/configs/"
+    "config_granite_geospatial_uki_flood_detection_v1.yaml",
+    help="Path inside container to config.yaml",
 )
 parser.add_argument(
-    '--checkpoint',
-    default='/app/models/granite_geospatial_uki_flood_detection_v1.ckpt',
-    help='Path inside container to model.ckpt'
+    "--checkpoint",
+    default="/app/models/granite_geospatial_uki_flood_detection_v1.ckpt",
+    help="Path inside container to model.ckpt",
 )
 parser.add_argument(
-    '--input_dir',
-    default='/app/data/input',
-    help='Path inside container to the input data root directory '
-         '(parent of image files)'
+    "--input_dir",
+    default="/app/data/input",
+    help="Path inside container to the input data root directory "
+    "(parent of image files)",
 )
 parser.add_argument(
-    '--output_dir',
-    default='/app/data/output',
-    help='Path inside container for prediction output'
+    "--output_dir",
+    default="/app/data/output",
+    help="Path inside container for prediction output",
 )
 # Add accelerator argument
 parser.add_argument(
-    '--accelerator', default='cpu',
-    help='Accelerator to use (e.g., cpu, gpu)'
+    "--accelerator", default="cpu", help="Accelerator to use (e.g., cpu, gpu)"
+)
+parser.add_argument(
+    "--sliding_window",
+    action="store_true",
+    help="Predict whole scenes with overlapping windows instead of "
+    "treating each file as a single tile",
+)
+parser.add_argument(
+    "--window_size",
+    type=int,
+    default=512,
+    help="Window size for --sliding_window",
+)
+parser.add_argument(
+    "--overlap",
+    type=int,
+    default=64,
+    help="Pixels shared by neighbouring windows for --sliding_window",
+)
+parser.add_argument(
+    "--batch_size",
+    default="auto",
+    help='Tiles per forward pass, or "auto" to choose from available memory',
+)
+parser.add_argument(
+    "--manifest",
+    default=None,
+    help="JSON manifest of the scanned inputs, reused between runs "
+    "(default: <output_dir>/input_manifest.json)",
+)
+parser.add_argument(
+    "--nan_sample",
+    type=int,
+    default=0,
+    help="Estimate NaN/nodata share of each input from a decimated read "
+    "of this many pixels per side (0 to skip)",
+)
+parser.add_argument(
+    "--artifact",
+    default=None,
+    help="Inference-only model artifact (from granite_geo_flood.export) "
+    "to load instead of --config/--checkpoint",
+)
+parser.add_argument(
+    "--num_readers",
+    type=int,
+    default=None,
+    help="Threads decoding and preprocessing tiles ahead of the model "
+    "(default: 2; 0 to read, predict and write one batch at a time)",
+)
+parser.add_argument(
+    "--queue_depth",
+    type=int,
+    default=4,
+    help="Batches buffered between the reader, model and writer stages",
+)
+parser.add_argument(
+    "--replicas",
+    type=int,
+    default=1,
+    help="Model replicas, each a process pinned to its own cores",
+)
+parser.add_argument(
+    "--threads_per_replica",
+    type=int,
+    default=None,
+    help="Cores and torch threads per replica "
+    "(default: available cores divided by --replicas)",
+)
+parser.add_argument(
+    "--precision",
+    default="fp32",
+    choices=PRECISIONS,
+    help="Run the model in float32, bfloat16 autocast or with dynamically "
+    "int8 quantized Linear layers",
+)
+parser.add_argument(
+    "--reference_dir",
+    default=None,
+    help="Reference *_image.tif tiles (with *_label.tif labels if present) "
+    "on which a --precision other than fp32 must keep its accuracy",
+)
+parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=0.01,
+    help="Largest mIoU or F1 drop allowed on the reference tiles",
+)
+parser.add_argument(
+    "--runtime",
+    default="eager",
+    choices=runtime.BACKENDS,
+    help="Run the model eagerly, through torch.compile, or from an "
+    "exported TorchScript or ONNX model (see granite_geo_flood.runtime)",
+)
+parser.add_argument(
+    "--runtime_model",
+    default=None,
+    help="Exported model file for --runtime torchscript or onnxruntime",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Keep a run ledger in --output_dir and only predict tiles that are "
+    "new, changed, failed or interrupted since the last run",
+)
+parser.add_argument(
+    "--output_format",
+    default="gtiff",
+    choices=["gtiff", "cog"],
+    help="int16 LZW GeoTIFFs, or compact tiled int8 Cloud-Optimized "
+    "GeoTIFFs with overviews written on a thread pool",
+)
+parser.add_argument(
+    "--compress",
+    default="deflate",
+    choices=["deflate", "zstd"],
+    help="Compression of --output_format cog",
+)
+parser.add_argument(
+    "--mask_dtype",
+    default="int8",
+    choices=["int8", "uint8"],
+    help="Mask dtype of --output_format cog (nodata -1 or 255)",
+)
+parser.add_argument(
+    "--probability",
+    action="store_true",
+    help="Also write a half-float water probability COG per tile "
+    "(<name>_pred_prob.tif) with --output_format cog",
+)
+parser.add_argument(
+    "--write_workers",
+    type=int,
+    default=2,
+    help="Writer threads for --output_format cog",
+)
+parser.add_argument(
+    "--metrics_dir",
+    default=None,
+    help="Write per-tile events (tile_events.jsonl) and run metrics in the "
+    "Prometheus text format (inference.prom) here, with --num_readers "
+    "above 0",
+)
+parser.add_argument(
+    "--profile",
+    default=None,
+    choices=PROFILERS,
+    help="Profile the forward pass of the batches holding --profile_tiles "
+    "into --metrics_dir",
+)
+parser.add_argument(
+    "--profile_tiles",
+    type=int,
+    nargs="+",
+    default=[0],
+    help="Indices of the input tiles to profile with --profile",
+)
+parser.add_argument(
+    "--skip_tiles",
+    action="store_true",
+    help="Write the flood maps of tiles that are all nodata, ocean or cloud "
+    "without running the model, logging each skipped tile",
+)
+parser.add_argument(
+    "--skip_nodata",
+    type=float,
+    default=1.0,
+    help=(
+        "Share of nodata pixels from which --skip_tiles writes a tile as "
+        "nodata"
+    ),
+)
+parser.add_argument(
+    "--skip_ocean",
+    type=float,
+    default=1.0,
+    help="Share of ocean pixels (of those with data) from which --skip_tiles "
+    "writes a tile as water",
+)
+parser.add_argument(
+    "--skip_cloud",
+    type=float,
+    default=None,
+    help="Share of CLOUD pixels (of those with data) from which --skip_tiles "
+    "writes a tile as nodata (default: never, the model also sees S1)",
 )
 args = parser.parse_args()
 
+threads_per_replica = None
+if args.replicas > 1:
+    num_cores = len(os.sched_getaffinity(0))
+    threads_per_replica = (
+        args.threads_per_replica or num_cores // args.replicas
+    )
+    if threads_per_replica < 1:
+        parser.error(
+            f"--replicas {args.replicas} needs at least one core per replica, "
+            f"only {num_cores} available"
+        )
+
+if not 0 <= args.overlap < args.window_size:
+    parser.error(
+        f"--overlap must be at least 0 and less than --window_size "
+        f"{args.window_size}, not {args.overlap}"
+    )
+
+num_readers = 2 if args.num_readers is None else args.num_readers
+
+# options that the chosen prediction path would otherwise silently ignore
+unsupported = {}
+if args.replicas > 1:
+    path = "--replicas"
+    unsupported = {
+        "--sliding_window": args.sliding_window,
+        "--resume": args.resume,
+        "--skip_tiles": args.skip_tiles,
+        "--output_format cog": args.output_format == "cog",
+        f"--runtime {args.runtime}": args.runtime != "eager",
+        "--metrics_dir": args.metrics_dir is not None,
+        "--num_readers": args.num_readers is not None,
+    }
+elif args.sliding_window:
+    path = "--sliding_window"
+    unsupported = {
+        "--resume": args.resume,
+        "--skip_tiles": args.skip_tiles,
+        "--output_format cog": args.output_format == "cog",
+        "--metrics_dir": args.metrics_dir is not None,
+        "--num_readers": args.num_readers is not None,
+    }
+elif args.resume:
+    path = "--resume"
+    unsupported = {
+        "--metrics_dir": args.metrics_dir is not None,
+        "--num_readers": args.num_readers is not None,
+    }
+elif num_readers == 0:
+    path = "--num_readers 0"
+    unsupported = {"--metrics_dir": args.metrics_dir is not None}
+for flag, given in unsupported.items():
+    if given:
+        parser.error(f"{flag} is not supported with {path}")
+if args.runtime in ("torchscript", "onnxruntime"):
+    if args.runtime_model is None:
+        parser.error(f"--runtime {args.runtime} needs --runtime_model")
+elif args.runtime_model is not None:
+    parser.error("--runtime_model needs --runtime torchscript or onnxruntime")
+if args.probability and args.output_format != "cog":
+    parser.error("--probability needs --output_format cog")
+if args.profile is not None and args.metrics_dir is None:
+    parser.error("--profile needs --metrics_dir")
+
 print(f"Config Path: {args.config}")
 print(f"Checkpoint Path: {args.checkpoint}")
 print(f"Input Data Root: {args.input_dir}")
 print(f"Output Directory: {args.output_dir}")
 print(f"Accelerator: {args.accelerator}")
+print(f"Precision: {args.precision}")
+print(f"Runtime: {args.runtime}")
+
+# --- Pre-flight scan ---
+manifest = args.manifest or os.path.join(
+    args.output_dir, "input_manifest.json"
+)
+entries = scan_directory(
+    args.input_dir, manifest_file=manifest, nan_sample=args.nan_sample
+)
+print(f"\nFound {len(entries)} .tif files (manifest: {manifest})")
+for entry in entries:
+    if "error" in entry:
+        print(f"Error loading {entry['path']}: {entry['error']}")
+        continue
+    nans = (
+        f", NaN share={entry['nan_fraction']:.3f}"
+        if "nan_fraction" in entry
+        else ""
+    )
+    print(
+        f"{entry['path']}: shape=({entry['bands']}, {entry['height']}, "
+        f"{entry['width']}), dtype={entry['dtype']}{nans}"
+    )
 
-# --- Terratorch Command Construction ---
-# We need to run terratorch from the directory containing 'custom_modules'
-# Assuming the project code is copied to /app/uki-flooddetection
-project_code_dir = "/app"
-predict_script = "terratorch"  # Assuming terratorch is in the PATH
-
-command = [
-    predict_script,
-    "predict",
-    "-c", args.config,
-    "--ckpt_path", args.checkpoint,
-    "--predict_output_dir", args.output_dir,
-    "--data.init_args.predict_data_root", args.input_dir,
-    "--data.init_args.img_grep", "*.tif",
-    f"--trainer.accelerator={args.accelerator}",  # Control CPU/GPU
-    "--trainer.devices=1",  # Specify number of devices (1 for CPU/single GPU)
-    "--data.init_args.batch_size=1"  # Override batch size for prediction
+# --- Inference ---
+image_files = readable_files(entries)
+shapes = [
+    (entry["bands"], entry["height"], entry["width"])
+    for entry in entries
+    if "error" not in entry
 ]
+print(f"\nPredicting {len(image_files)} files\n")
 
-print(f"\nExecuting command: {' '.join(command)}\n")
 
-# --- Execute Command ---
-try:
-    # Run the command from the project directory
-    process = subprocess.Popen(
-        command,
-        cwd=project_code_dir,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True
-    )
+def load_predictor(device: str = "cpu") -> FloodPredictor:
+    """load the model on the --runtime backend, switched to --precision if
+    it passes the accuracy guard on --reference_dir"""
+    if args.runtime in ("torchscript", "onnxruntime"):
+        if args.precision != "fp32":
+            raise ValueError(
+                f"--precision {args.precision} needs an eager model"
+            )
+        return runtime.load_predictor(args.runtime, args.runtime_model, device)
+
+    predictor = load_eager_predictor(device)
+    if args.runtime == "compile":
+        predictor = runtime.compile_predictor(predictor)
+    return predictor
+
 
-    # Stream output
-    while True:
-        output = process.stdout.readline()
-        if output == '' and process.poll() is not None:
-            break
-        if output:
-            print(output.strip())
-
-    rc = process.poll()
-    if rc == 0:
-        print("\nTerratorch predict command finished successfully.")
+def load_eager_predictor(device: str = "cpu") -> FloodPredictor:
+    """load the eager model in --precision, see `load_predictor`"""
+    if args.artifact:
+        predictor = FloodPredictor.from_artifact(args.artifact, device=device)
     else:
+        predictor = FloodPredictor(args.config, args.checkpoint, device=device)
+    if args.precision == "fp32":
+        return predictor
+
+    if args.reference_dir is None:
         print(
-            f"\nTerratorch predict command failed with exit code {rc}.",
-            file=sys.stderr
+            f"Warning: no --reference_dir, {args.precision} accuracy is "
+            "unchecked"
         )
-        sys.exit(rc)  # Exit script with the same error code
+        return predictor.with_precision(args.precision)
 
-except FileNotFoundError:
-    print(
-        f"Error: Command '{predict_script}' not found. "
-        "Is terratorch installed and in PATH?",
-        file=sys.stderr
+    reference_files = sorted(Path(args.reference_dir).glob("*_image.tif"))
+    label_files = reference_labels(reference_files)
+    if not all(label_file.exists() for label_file in label_files):
+        print("No reference labels, comparing against fp32 predictions")
+        label_files = None
+    predictor, metrics = guard_precision(
+        predictor, args.precision, reference_files, label_files, args.tolerance
     )
-    sys.exit(1)
+    for precision, scores in metrics.items():
+        print(
+            f"Reference {precision}: mIoU={scores['mIoU']:.4f}, "
+            f"F1={scores['F1']:.4f}"
+        )
+    return predictor
+
+
+try:
+    if args.replicas > 1:
+        if args.precision != "fp32" and args.reference_dir is not None:
+            # check the mode once here rather than in every replica
+            load_predictor()
+        start = time.perf_counter()
+        saved = run_replicas(
+            image_files,
+            args.output_dir,
+            args.replicas,
+            threads_per_replica,
+            config_file=args.config,
+            checkpoint=args.checkpoint,
+            artifact=args.artifact,
+            batch_size=1
+            if args.batch_size == "auto"
+            else int(args.batch_size),
+            shapes=shapes,
+            precision=args.precision,
+        )
+        elapsed = time.perf_counter() - start
+        for save_file in saved:
+            print(f"Saved {save_file}")
+        if saved:
+            print(
+                f"{len(saved) / elapsed:.2f} tiles/s with {args.replicas} "
+                f"replicas x {threads_per_replica} threads"
+            )
+        print("\nInference script finished.")
+        sys.exit(0)
+
+    device = "cuda" if args.accelerator == "gpu" else args.accelerator
+    predictor = load_predictor(device)
+    writer = None
+    if args.output_format == "cog":
+        writer = AsyncWriter(
+            dtype=args.mask_dtype,
+            compress=args.compress,
+            probability=args.probability,
+            max_workers=args.write_workers,
+        )
+    tile_filter = None
+    if args.skip_tiles:
+        logging.basicConfig(format="%(message)s")
+        logging.getLogger("granite_geo_flood.skip").setLevel(logging.INFO)
+        tile_filter = TileFilter.from_config(
+            predictor.config,
+            args.skip_nodata,
+            args.skip_ocean,
+            args.skip_cloud,
+        )
+    recorder = None
+    if args.metrics_dir:
+        recorder = RunRecorder(
+            os.path.join(args.metrics_dir, "tile_events.jsonl"),
+            os.path.join(args.metrics_dir, "inference.prom"),
+            profiler=args.profile,
+            profile_tiles=args.profile_tiles,
+        )
+    if args.batch_size == "auto":
+        batch_size = auto_batch_size(args.window_size, args.window_size)
+    else:
+        batch_size = int(args.batch_size)
+    if args.sliding_window:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for image_file in image_files:
+            save_file = os.path.join(
+                args.output_dir, f"{Path(image_file).stem}_pred.tif"
+            )
+            predict_scene(
+                predictor,
+                image_file,
+                save_file,
+                window=args.window_size,
+                overlap=args.overlap,
+                batch_size=batch_size,
+            )
+            print(f"Saved {save_file}")
+    elif args.resume:
+        if args.batch_size == "auto":
+            batch_size = predictor.auto_batch_size(shapes)
+        if args.runtime in ("torchscript", "onnxruntime"):
+            model_file = args.runtime_model
+        else:
+            model_file = args.artifact or args.checkpoint
+        ledger = RunLedger(
+            os.path.join(args.output_dir, "run_ledger.jsonl"),
+            file_hash(model_file),
+            config_hash(predictor.config),
+        )
+        saved, failures = run_resumable(
+            predictor,
+            image_files,
+            args.output_dir,
+            ledger,
+            batch_size=batch_size,
+            shapes=shapes,
+            writer=writer,
+            tile_filter=tile_filter,
+        )
+        print(
+            f"{sum(s is not None for s in saved)} of {len(saved)} tiles done, "
+            f"{len(failures)} failed (ledger: {ledger.ledger_file})"
+        )
+        for image_file, error in failures:
+            print(f"Failed {image_file}: {error}")
+        if tile_filter is not None:
+            print(tile_filter.summary())
+    elif num_readers > 0:
+        if args.batch_size == "auto":
+            batch_size = predictor.auto_batch_size(shapes)
+        saved, stats = run_pipeline(
+            predictor,
+            image_files,
+            args.output_dir,
+            batch_size=batch_size,
+            num_readers=num_readers,
+            queue_depth=args.queue_depth,
+            shapes=shapes,
+            writer=writer,
+            recorder=recorder,
+            tile_filter=tile_filter,
+        )
+        for save_file in saved:
+            print(f"Saved {save_file}")
+        print(stats.summary())
+        if tile_filter is not None:
+            predicted = stats.tiles - stats.skipped
+            print(
+                tile_filter.summary(
+                    stats.compute_seconds / predicted if predicted else 0.0
+                )
+            )
+    else:
+        start = time.perf_counter()
+        saved = predictor.predict_files(
+            image_files,
+            args.output_dir,
+            batch_size=args.batch_size,
+            shapes=shapes,
+            writer=writer,
+            tile_filter=tile_filter,
+        )
+        elapsed = time.perf_counter() - start
+        for save_file in saved:
+            print(f"Saved {save_file}")
+        if saved:
+            print(f"{len(saved) / elapsed:.2f} tiles/s")
+        if tile_filter is not None:
+            # without per-stage timings, the whole run time stands for compute
+            predicted = len(saved) - sum(tile_filter.skipped.values())
+            print(
+                tile_filter.summary(elapsed / predicted if predicted else 0.0)
+            )
+    if writer is not None:
+        writer.close()
+    if recorder is not None:
+        recorder.close()
+        print(f"Metrics written to {args.metrics_dir}")
 except Exception as e:
     print(f"An error occurred: {e}", file=sys.stderr)
     sys.exit(1)
@@ -1,7 +1,9 @@
 import os
-import rasterio
+
 from osgeo import gdal
 
+from granite_geo_flood.scan import scan_directory
+
 # Print GDAL version
 print(f"GDAL version: {gdal.__version__}")
 
@@ -25,16 +27,12 @@ if os.path.exists(input_dir):
 
 # Try to open a sample TIF file if exists
 print("\nTrying to open a sample TIF file:")
-for root, dirs, files in os.walk(input_dir):
-    for file in files:
-        if file.endswith(".tif"):
-            try:
-                sample_path = os.path.join(root, file)
-                print(f"Attempting to open: {sample_path}")
-                with rasterio.open(sample_path) as src:
-                    print(f"  Success! Dimensions: {src.width}x{src.height}")
-                    print(f"  Bands: {src.count}")
-                    print(f"  CRS: {src.crs}")
-                break
-            except Exception as e:
-                print(f"  Error opening file: {e}")
\ No newline at end of file
+for entry in scan_directory(input_dir, "**/*.tif"):
+    print(f"Attempting to open: {entry['path']}")
+    if "error" in entry:
+        print(f"  Error opening file: {entry['error']}")
+        continue
+    print(f"  Success! Dimensions: {entry['width']}x{entry['height']}")
+    print(f"  Bands: {entry['bands']}")
+    print(f"  CRS: {entry['crs']}")
+    break